@@ -2,46 +2,180 @@
 # pip install PyQt5
 # pip install PyQt5 mysql-connector-python Pillow
 # pip install mysql.connector
+#
+# Startup is staged: the window is built and shown first, then StartupLoader
+# loads the picture, connects, checks the schema and fetches the dashboard
+# numbers in the background. mysql.connector, the service layer and the
+# report dialogs (report_windows.py) are only imported when first needed.
+# profile_startup.py measures time to first paint and to interactive.
 
 
 import os
+import re
 import sys
-import sqlite3
-import mysql.connector
 from PyQt5.QtWidgets import (  # type: ignore
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel,
-    QPushButton, QTableWidget, QTableWidgetItem, QMessageBox,
-    QMainWindow, QAction, QDialog, QGridLayout, QFrame, QLineEdit,
-    QSizePolicy, QSpacerItem)
-from PyQt5.QtGui import QPixmap, QFont  # type: ignore
-from PyQt5.QtCore import Qt  # type: ignore
+    QPushButton, QMessageBox, QMainWindow, QGridLayout, QFrame, QLineEdit)
+from PyQt5.QtGui import QFont, QImage, QPixmap  # type: ignore
+from PyQt5.QtCore import Qt, QThread, QTimer, pyqtSignal  # type: ignore
+
+from db_settings import (
+    ORDER_BACKEND, REPLICA_MAX_LAG_SECONDS, WORKLOAD_CAPTURE_PATH, get_db_config,
+    get_replica_config)
+from report_cache import ReportCache, bump_tables
+from workload_capture import start_capture, stop_capture
+
+
+class StartupLoader(QThread):
+    # Runs the slow part of ProductApp startup off the GUI thread and reports
+    # each stage through a signal, so the window fills in as results arrive.
+    image_loaded = pyqtSignal(QImage)
+    database_ready = pyqtSignal()
+    summary_loaded = pyqtSignal(list)
+    failed = pyqtSignal(str)
+
+    def __init__(self, window):
+        super().__init__(window)
+        self.window = window
+
+    def run(self):
+        # QImage, unlike QPixmap, may be used outside the GUI thread
+        self.image_loaded.emit(self.window.load_image())
+        try:
+            self.window.open_database()
+            self.database_ready.emit()
+            self.summary_loaded.emit(self.window.get_inventory_summary())
+        except Exception as err:
+            self.failed.emit(str(err))
 
 
 class ProductApp(QMainWindow):
+    # Emitted once background startup has finished, successfully or not.
+    startup_finished = pyqtSignal()
+
     def __init__(self):
         super().__init__()
-        self.db_config = {
-            'host': 'localhost',
-            'user': 'root',
-            # Password needs to entered to connect to the server.
-            'password': '',
-            'database': 'inventory_mgmt'
-        }
-        self.conn = mysql.connector.connect(**self.db_config)
-        self.cursor = self.conn.cursor()
-        self.create_database()
+        # Password needs to entered in db_settings.py to connect to the server.
+        self.db_config = get_db_config()
+        self.conn = None
+        self.reports = None
+        self.db_errors = ()
+        # Widgets that need the database stay disabled until it is ready.
+        self.database_widgets = []
         # self.create_procedures()
         self.initUI()
+        self.statusBar().showMessage('Connecting to database...')
+        # Start loading once the event loop runs, i.e. after the first show.
+        self.loader = StartupLoader(self)
+        self.loader.image_loaded.connect(self.set_image)
+        self.loader.database_ready.connect(self.on_database_ready)
+        self.loader.summary_loaded.connect(self.update_info)
+        self.loader.failed.connect(self.on_startup_failed)
+        self.loader.finished.connect(self.startup_finished)
+        QTimer.singleShot(0, self.loader.start)
 
     def get_db_connection(self):
         return self.conn, self.db_config
 
+    def open_database(self):
+        # Called from StartupLoader, so it must not touch any widgets.
+        import mysql.connector
+        from inventory_service import InventoryService, ServiceError
+        from read_routing import ReadRouter
+
+        if not self.schema_ready():
+            self.create_database()
+            if not self.schema_ready():
+                raise RuntimeError('Creating the database failed, see the errors printed by the '
+                                   'schema script')
+        self.conn = mysql.connector.connect(**self.db_config)
+        self.cursor = self.conn.cursor()
+        # Reports and the dashboard read through self.reads, which uses the
+        # replica when one is configured and fresh enough.
+        self.reads = ReadRouter(self.conn, get_replica_config(), REPLICA_MAX_LAG_SECONDS)
+        # Report dialogs are served from self.reports. Its background
+        # refreshes run on their own connection through a second router.
+        self.refresh_reads = ReadRouter(mysql.connector.connect(**self.db_config),
+                                        get_replica_config(), REPLICA_MAX_LAG_SECONDS)
+        self.reports = ReportCache(self.reads.run_report,
+                                   refresh_load=self.refresh_reads.run_report)
+        self.service = InventoryService(self.db_config)
+        self.db_errors = (mysql.connector.Error, ServiceError)
+        self.init_order_backend()
+        if WORKLOAD_CAPTURE_PATH:
+            start_capture(WORKLOAD_CAPTURE_PATH)
+
+    def schema_ready(self):
+        # The schema script drops and reseeds the database, so it is only run
+        # on a database without any of its tables. One that has some but not
+        # all of them is reported instead of being wiped on every start.
+        import mysql.connector
+
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        tables = set(re.findall(
+            r'CREATE TABLE\s+(?:IF NOT EXISTS\s+)?`?(\w+)',
+            self.load_sql_script(os.path.join(script_dir, 'Inventory_system.sql')),
+            re.IGNORECASE))
+
+        server_config = self.db_config.copy()
+        database = server_config.pop('database')
+        with mysql.connector.connect(**server_config) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    'SELECT table_name FROM information_schema.TABLES WHERE table_schema = %s',
+                    (database,))
+                existing = {row[0].lower() for row in cursor.fetchall()}
+        missing = sorted(table for table in tables if table.lower() not in existing)
+        if missing and len(missing) < len(tables):
+            raise RuntimeError(f"Database {database} is missing the tables {', '.join(missing)}. "
+                               f"Fix Inventory_system.sql or restore them, the app will not "
+                               f"rebuild a database that has data.")
+        return not missing
+
+    def init_order_backend(self):
+        # Sales and purchase orders go through self.orders, which has the
+        # same methods whichever backend is configured.
+        self.orders = self.service
+        if ORDER_BACKEND == 'async':
+            from async_db import DatabaseError, SyncInventoryDB
+            self.orders = SyncInventoryDB(self.db_config)
+            self.db_errors += (DatabaseError,)
+
+    def load_image(self):
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        image = QImage(os.path.join(script_dir, 'pic.png'))
+        if not image.isNull():
+            image = image.scaled(500, 500, Qt.KeepAspectRatio)
+        return image
+
+    def set_image(self, image):
+        if not image.isNull():
+            self.image_label.setPixmap(QPixmap.fromImage(image))
+
+    def on_database_ready(self):
+        for widget in self.database_widgets:
+            widget.setEnabled(True)
+        self.statusBar().showMessage('Ready', 3000)
+
+    def on_startup_failed(self, message):
+        self.statusBar().showMessage('Database unavailable')
+        QMessageBox.critical(self, 'Database Error', message, QMessageBox.Ok)
+
+    def closeEvent(self, event):
+        self.loader.wait()
+        if self.reports is not None:
+            self.reports.close()
+        stop_capture()
+        super().closeEvent(event)
+
     def load_sql_script(self, filename):
         with open(filename, 'r', encoding='utf-8') as file:
             sql_script = file.read()
         return sql_script
 
     def execute_sql_script(self, cursor, sql_script):
+        import mysql.connector
+
         sql_commands = sql_script.split(';')
         for command in sql_commands:
             command = command.strip()
@@ -57,6 +191,8 @@ class ProductApp(QMainWindow):
                     print(f"Error: {err}")
 
     def create_database(self):
+        import mysql.connector
+
         # 获取脚本所在目录
         script_dir = os.path.dirname(os.path.abspath(__file__))
         create_db_sql_file_path = os.path.join(
@@ -115,15 +251,10 @@ class ProductApp(QMainWindow):
         left_layout = QVBoxLayout()
 
         # 图片展示区域
+        # 图片在后台加载，先用灰色占位
         self.image_label = QLabel(self)
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        image_path = os.path.join(script_dir, 'pic.png')
-        pixmap = QPixmap(image_path)
-        if pixmap.isNull():
-            pixmap = QPixmap(500, 500)
-            pixmap.fill(Qt.gray)  # 灰色填充占位
-        else:
-            pixmap = pixmap.scaled(500, 500, Qt.KeepAspectRatio)
+        pixmap = QPixmap(500, 500)
+        pixmap.fill(Qt.gray)  # 灰色填充占位
         self.image_label.setPixmap(pixmap)
         self.image_label.setFixedSize(500, 500)
         self.image_label.setAlignment(Qt.AlignCenter)
@@ -143,11 +274,13 @@ class ProductApp(QMainWindow):
         product_list_button = QPushButton('Product List', self)
         product_list_button.clicked.connect(self.show_product_list)
         button_layout.addWidget(product_list_button)
+        self.database_widgets.append(product_list_button)
 
         # 库存列表按钮
         stock_list_button = QPushButton('Inventory List', self)
         stock_list_button.clicked.connect(self.show_stock_list)
         button_layout.addWidget(stock_list_button)
+        self.database_widgets.append(stock_list_button)
 
         left_layout.addLayout(button_layout)
         left_layout.addSpacing(38)  # 添加间隔
@@ -168,6 +301,7 @@ class ProductApp(QMainWindow):
         buy_button = QPushButton('Buy', self)
         buy_button.clicked.connect(self.buy_product)
         buy_button.setFixedWidth(80)
+        self.database_widgets.append(buy_button)
 
         input_layout.addWidget(buy_id_label, 0, 0)
         input_layout.addWidget(self.buy_id_input, 0, 1)
@@ -188,6 +322,7 @@ class ProductApp(QMainWindow):
         sell_button = QPushButton('Sell', self)
         sell_button.clicked.connect(self.sell_product)
         sell_button.setFixedWidth(80)
+        self.database_widgets.append(sell_button)
 
         input_layout.addWidget(sell_id_label, 0, 3)
         input_layout.addWidget(self.sell_id_input, 0, 4)
@@ -198,6 +333,31 @@ class ProductApp(QMainWindow):
         input_layout.addWidget(sell_button, 0, 5, 3, 1,
                                alignment=Qt.AlignCenter)
 
+        # 调拨布局
+        transfer_from_label = QLabel('From Warehouse', self)
+        self.transfer_from_input = QLineEdit(self)
+        transfer_to_label = QLabel('To Warehouse', self)
+        self.transfer_to_input = QLineEdit(self)
+        transfer_id_label = QLabel('Product ID', self)
+        self.transfer_id_input = QLineEdit(self)
+        transfer_quantity_label = QLabel('Quantity', self)
+        self.transfer_quantity_input = QLineEdit(self)
+        transfer_button = QPushButton('Transfer', self)
+        transfer_button.clicked.connect(self.transfer_product)
+        transfer_button.setFixedWidth(80)
+        self.database_widgets.append(transfer_button)
+
+        input_layout.addWidget(transfer_from_label, 3, 0)
+        input_layout.addWidget(self.transfer_from_input, 3, 1)
+        input_layout.addWidget(transfer_to_label, 4, 0)
+        input_layout.addWidget(self.transfer_to_input, 4, 1)
+        input_layout.addWidget(transfer_id_label, 3, 3)
+        input_layout.addWidget(self.transfer_id_input, 3, 4)
+        input_layout.addWidget(transfer_quantity_label, 4, 3)
+        input_layout.addWidget(self.transfer_quantity_input, 4, 4)
+        input_layout.addWidget(transfer_button, 3, 5, 2, 1,
+                               alignment=Qt.AlignCenter)
+
         left_layout.addLayout(input_layout)
 
         # 中间间隔
@@ -215,18 +375,20 @@ class ProductApp(QMainWindow):
         ]
         button_names = [
             'Refresh', 'Boss Key', 'Catalog Management', 'Order Management',
-            'Most frequently\ntransferred products', 'Monthly\ninventory changes', 'Low\ninventory products', 'Order Management',
+            'Most frequently\ntransferred products', 'Monthly\ninventory changes', 'Low\ninventory products', 'Inventory\nvaluation',
             'Refresh', 'Boss Key', 'Catalog Management', 'Order Management',
             'Refresh', 'Boss Key', 'Catalog Management', 'Order Management',
             'Refresh', 'Boss Key', 'Catalog Management', 'Order Management'
         ]
-        for i in range(7):  # 有多少个按钮
+        for i in range(8):  # 有多少个按钮
             button = QPushButton(button_names[i], self)
             button.setFixedHeight(100)  # 设置按钮固定高度
             button.clicked.connect(button_functions[i])  # 绑定不同的槽函数
             row = i // 3
             col = i % 3
             right_layout.addWidget(button, row, col)
+            if i != 1:  # Boss Key 不需要数据库
+                self.database_widgets.append(button)
 
         main_layout.addLayout(left_layout, 11)
         main_layout.addWidget(spacer, 2)
@@ -236,6 +398,9 @@ class ProductApp(QMainWindow):
         container.setLayout(main_layout)
         self.setCentralWidget(container)
 
+        for widget in self.database_widgets:
+            widget.setEnabled(False)
+
     def init_info_area(self, left_layout):
         self.info_layout = QHBoxLayout()
 
@@ -270,23 +435,33 @@ class ProductApp(QMainWindow):
         try:
             self.cursor.execute('''
                 INSERT INTO Inventory (warehouse_id, product_id, quantity, shelf_space, catalog_id)
-                VALUES (?, ?, ?, ?, ?)
+                VALUES (%s, %s, %s, %s, %s)
             ''', (warehouse_id, product_id, quantity, shelf_space, catalog_id))
             self.conn.commit()
-        except sqlite3.Error as e:
+            bump_tables('Inventory', 'InventoryMovements')
+        except self.db_errors as e:
             self.handle_error(e)
+        finally:
+            self.note_write()
 
     # 修改某一条inventory，基本不会用到
     def update_inventory(self, inventory_id, warehouse_id, product_id, quantity, shelf_space, catalog_id):
         try:
             self.cursor.execute('''
                 UPDATE Inventory
-                SET warehouse_id = ?, product_id = ?, quantity = ?, shelf_space = ?, catalog_id = ?
-                WHERE inventory_id = ?
+                SET warehouse_id = %s, product_id = %s, quantity = %s, shelf_space = %s, catalog_id = %s
+                WHERE inventory_id = %s
             ''', (warehouse_id, product_id, quantity, shelf_space, catalog_id, inventory_id))
             self.conn.commit()
-        except sqlite3.Error as e:
+            bump_tables('Inventory', 'InventoryMovements')
+        except self.db_errors as e:
             self.handle_error(e)
+        finally:
+            self.note_write()
+
+    def note_write(self):
+        self.reads.note_write()
+        self.refresh_reads.note_write()
 
     def handle_error(self, error):
         # 提取错误消息并显示
@@ -297,233 +472,88 @@ class ProductApp(QMainWindow):
     # +++++++++++++++++++++++++++ 功能区 ++++++++++++++++++++++++++++++++++
     # +++++++++++++++++++++++++++ 功能区 ++++++++++++++++++++++++++++++++++
     # +++++++++++++++++++++++++++ 功能区 ++++++++++++++++++++++++++++++++++
+    def show_window(self, name, class_name):
+        # The dialog classes live in report_windows, imported on first use.
+        import report_windows
+
+        conn, db_config = self.reads.connection(), self.db_config
+        window = getattr(report_windows, class_name)(conn, db_config, self.reports)
+        setattr(self, name, window)
+        window.show()
+
     def show_product_list(self):
-        conn, db_config = self.get_db_connection()
-        self.product_list_window = ProductListWindow(conn, db_config)
-        self.product_list_window.show()
+        self.show_window('product_list_window', 'ProductListWindow')
 
     def show_stock_list(self):
-        conn, db_config = self.get_db_connection()
-        self.stock_list_window = StockListWindow(conn, db_config)
-        self.stock_list_window.show()
+        self.show_window('stock_list_window', 'StockListWindow')
 
     def show_catalog_list(self):
-        conn, db_config = self.get_db_connection()
-        self.catalog_list_window = CatalogListWindow(conn, db_config)
-        self.catalog_list_window.show()
+        self.show_window('catalog_list_window', 'CatalogListWindow')
 
     def show_order_list(self):
-        conn, db_config = self.get_db_connection()
-        self.order_list_window = OrderListWindow(conn, db_config)
-        self.order_list_window.show()
+        self.show_window('order_list_window', 'OrderListWindow')
 
     def show_most_transferred_products(self):
-        conn, db_config = self.get_db_connection()
-        self.most_transferred_products_window = MostTransferredProductsWindow(
-            conn, db_config)
-        self.most_transferred_products_window.show()
+        self.show_window('most_transferred_products_window', 'MostTransferredProductsWindow')
 
     def show_monthly_inventory_changes(self):
-        conn, db_config = self.get_db_connection()
-        self.monthly_inventory_changes_window = MonthlyInventoryChangesWindow(
-            conn, db_config)
-        self.monthly_inventory_changes_window.show()
+        self.show_window('monthly_inventory_changes_window', 'MonthlyInventoryChangesWindow')
 
     def show_low_stock_products(self):
-        conn, db_config = self.get_db_connection()
-        self.low_stock_products_window = LowStockProductsWindow(
-            conn, db_config)
-        self.low_stock_products_window.show()
+        self.show_window('low_stock_products_window', 'LowStockProductsWindow')
+
+    def show_inventory_valuation(self):
+        self.show_window('inventory_valuation_window', 'InventoryValuationWindow')
 
     def buy_product(self):
         product_id = int(self.buy_id_input.text())
         quantity = int(self.buy_quantity_input.text())
 
-        conn, db_config = self.get_db_connection()
-        cursor = conn.cursor()
-
         try:
-            # Ensure TempSuppliers table exists and is populated
-            cursor.execute('''
-                DROP TEMPORARY TABLE IF EXISTS TempSuppliers;
-                CREATE TEMPORARY TABLE TempSuppliers AS
-                SELECT supplier_id, catalog_id, price, max_quantity
-                FROM Catalog
-                WHERE product_id = %s
-                ORDER BY price;
-            ''', (product_id,))
-            cursor.fetchall()  # 清空结果集
-
-            # Fetch the first supplier ID to initialize the PurchaseOrder
-            cursor.execute('SELECT supplier_id FROM TempSuppliers LIMIT 1;')
-            supplier_var = cursor.fetchone()[0]
-
-            # Create Purchase Order
-            cursor.execute('''
-                INSERT INTO PurchaseOrders (supplier_id, order_date, status, total_cost)
-                VALUES (%s, CURDATE(), 'Pending', 0);
-            ''', (supplier_var,))
-            conn.commit()
-            po_var = cursor.lastrowid
-
-            # Get product shelf space
-            cursor.execute(
-                'SELECT shelf_space FROM Products WHERE product_id = %s;', (product_id,))
-            product_shelf_space = cursor.fetchone()[0]
-
-            # Initialize remaining quantity
-            remaining_quantity = quantity
-
-            # Temporary table to store allocations
-            cursor.execute('''
-                DROP TEMPORARY TABLE IF EXISTS temp_allocations;
-                CREATE TEMPORARY TABLE temp_allocations (
-                    warehouse_id INT,
-                    quantity INT
-                );
-            ''')
-            cursor.fetchall()  # 清空结果集
-
-            # Open cursor to iterate through warehouses
-            cursor.execute(
-                'SELECT warehouse_id, capacity FROM Warehouses ORDER BY capacity DESC;')
-            warehouses = cursor.fetchall()
-
-            for warehouse in warehouses:
-                current_warehouse_id, current_warehouse_capacity = warehouse
-
-                # Calculate current used capacity
-                cursor.execute('''
-                    SELECT IFNULL(SUM(Inventory.quantity * Products.shelf_space), 0)
-                    FROM Inventory
-                    JOIN Products ON Inventory.product_id = Products.product_id
-                    WHERE Inventory.warehouse_id = %s;
-                ''', (current_warehouse_id,))
-                current_warehouse_used_capacity = cursor.fetchone()[0]
-
-                # Calculate how much can be allocated to this warehouse
-                allocatable_quantity = (
-                    current_warehouse_capacity - current_warehouse_used_capacity) // product_shelf_space
-
-                if allocatable_quantity > 0:
-                    if allocatable_quantity >= remaining_quantity:
-                        cursor.execute('INSERT INTO temp_allocations (warehouse_id, quantity) VALUES (%s, %s);',
-                                       (current_warehouse_id, remaining_quantity))
-                        conn.commit()
-                        remaining_quantity = 0
-                        break
-                    else:
-                        cursor.execute('INSERT INTO temp_allocations (warehouse_id, quantity) VALUES (%s, %s);',
-                                       (current_warehouse_id, allocatable_quantity))
-                        conn.commit()
-                        remaining_quantity -= allocatable_quantity
-
-            # Check if all quantity could be allocated
-            if remaining_quantity > 0:
-                alert_message = f'Warning: Not enough warehouse capacity for the entire order of {quantity} units of product ID {product_id}. PO rejected. Unallocated quantity: {remaining_quantity}'
-
-                cursor.execute('''
-                    UPDATE PurchaseOrders
-                    SET status = 'Rejected'
-                    WHERE po_id = %s;
-                ''', (po_var,))
-                conn.commit()
+            result = self.orders.purchase(product_id, quantity)
+            print(result['message'])
 
-                cursor.execute('''
-                    INSERT INTO Alerts (entity_type, entity_id, message, alert_date)
-                    VALUES ('Product', %s, %s, NOW());
-                ''', (product_id, alert_message))
-                conn.commit()
-
-                print(alert_message)
-                return
-
-            # Allocate the quantities from suppliers
-            total_cost = 0
-            remaining_quantity = quantity
-            cursor.execute(
-                'SELECT supplier_id, catalog_id, price, max_quantity FROM TempSuppliers;')
-            suppliers = cursor.fetchall()
-
-            for supplier in suppliers:
-                temp_supplier_id, temp_catalog_id, temp_price, temp_max_quantity = supplier
-                supplier_quantity = min(temp_max_quantity, remaining_quantity)
-                supplier_price = temp_price * supplier_quantity
-                total_cost += supplier_price
-
-                cursor.execute('''
-                    INSERT INTO PurchaseOrderDetails (po_id, catalog_id, quantity, cost_for_product)
-                    VALUES (%s, %s, %s, %s);
-                ''', (po_var, temp_catalog_id, supplier_quantity, temp_price))
-                conn.commit()
-
-                remaining_quantity -= supplier_quantity
-                if remaining_quantity == 0:
-                    break
-
-            cursor.execute('''
-                UPDATE PurchaseOrders
-                SET total_cost = %s, status = 'Add to Inventory'
-                WHERE po_id = %s;
-            ''', (total_cost, po_var))
-            conn.commit()
-
-            # Update Inventory based on allocations with shelf space
-            cursor.execute('''
-                INSERT INTO Inventory (warehouse_id, product_id, quantity, shelf_space, catalog_id)
-                SELECT warehouse_id, %s, quantity, %s * quantity, %s
-                FROM temp_allocations
-                JOIN (
-                    SELECT catalog_id, supplier_id, price, max_quantity
-                    FROM Catalog
-                    WHERE product_id = %s
-                ) AS temp_catalog ON temp_catalog.catalog_id = %s
-                ON DUPLICATE KEY UPDATE 
-                    Inventory.quantity = Inventory.quantity + VALUES(Inventory.quantity),
-                    Inventory.shelf_space = Inventory.shelf_space + VALUES(Inventory.shelf_space);
-            ''', (product_id, product_shelf_space, temp_catalog_id, product_id, temp_catalog_id))
-            conn.commit()
-
-            alert_message = f'Purchase Order created with ID: {po_var} for {quantity} units of product ID {product_id}. Inventory allocated across multiple warehouses.'
-
-            cursor.execute('''
-                INSERT INTO Alerts (entity_type, entity_id, message, alert_date)
-                VALUES ('PurchaseOrder', %s, %s, NOW());
-            ''', (po_var, alert_message))
-            conn.commit()
-
-            print(alert_message)
-
-        except mysql.connector.Error as err:
+        except self.db_errors as err:
             print(f"Error: {err}")
-
         finally:
-            cursor.close()
-            conn.close()
+            self.note_write()
 
     def sell_product(self):
         product_id = int(self.sell_id_input.text())
         quantity = int(self.sell_quantity_input.text())
         order_id = int(self.sell_customer_input.text())
 
-        conn = mysql.connector.connect(**self.db_config)
-        cursor = conn.cursor()
-
         try:
-            cursor.callproc('process_sales_order', [
-                            order_id, product_id, quantity])
-            conn.commit()
+            result = self.orders.sell(order_id, product_id, quantity)
 
             # 获取存储过程的结果
-            for result in cursor.stored_results():
-                print(result.fetchall())
+            for message in result['messages']:
+                print(message)
 
-        except mysql.connector.Error as err:
+        except self.db_errors as err:
             print(f"Error: {err}")
+        finally:
+            self.note_write()
+
+    def transfer_product(self):
+        from_warehouse_id = int(self.transfer_from_input.text())
+        to_warehouse_id = int(self.transfer_to_input.text())
+        product_id = int(self.transfer_id_input.text())
+        quantity = int(self.transfer_quantity_input.text())
 
+        try:
+            results = self.service.transfer(
+                [(from_warehouse_id, to_warehouse_id, product_id, quantity)])
+            for result in results:
+                message = f"Transfer {result['transfer_id']}: {result['status']}"
+                if result['reason']:
+                    message += f". {result['reason']}"
+                print(message)
+
+        except self.db_errors as err:
+            print(f"Error: {err}")
         finally:
-            cursor.close()
-            conn.close()
+            self.note_write()
 
     # +++++++++++++++++++++++++++ 功能区 end ++++++++++++++++++++++++++++++++++
     # +++++++++++++++++++++++++++ 功能区 end ++++++++++++++++++++++++++++++++++
@@ -560,7 +590,7 @@ class ProductApp(QMainWindow):
         self.show_low_stock_products()
 
     def button_function_8(self):
-        pass
+        self.show_inventory_valuation()
 
     def button_function_9(self):
         pass
@@ -594,481 +624,7 @@ class ProductApp(QMainWindow):
             info_value.setText(str(new_value))
 
     def get_inventory_summary(self):
-        # Inventory remaining
-        self.cursor.execute('''
-        SELECT SUM(quantity) AS total_inventory
-        FROM Inventory;
-        ''')
-        total_inventory = self.cursor.fetchone()[0]
-
-        # Products on sale
-        self.cursor.execute('''
-        SELECT
-            COUNT(DISTINCT product_id) AS on_sale_products
-        FROM
-            Catalog;
-        ''')
-        on_sale_products = self.cursor.fetchone()[0]
-
-        # Warehouse quantity
-        self.cursor.execute('''
-        SELECT
-            COUNT(*) AS warehouse_count
-        FROM
-            Warehouses;
-        ''')
-        warehouse_count = self.cursor.fetchone()[0]
-
-        # Total inventory value
-        self.cursor.execute('''
-        SELECT
-            SUM(Inventory.quantity * Catalog.price) AS total_inventory_value
-        FROM
-            Inventory
-        JOIN
-            Catalog ON Inventory.catalog_id = Catalog.catalog_id;
-        ''')
-        total_inventory_value = self.cursor.fetchone()[0]
-
-        return [
-            ("Inventory remaining", total_inventory),
-            ("Products on sale", on_sale_products),
-            ("Warehouse quantity", warehouse_count),
-            ("Total inventory value", total_inventory_value)
-        ]
-
-
-class ProductListWindow(QDialog):
-    def __init__(self, conn, db_config):
-        super().__init__()
-        self.conn = conn
-        self.db_config = db_config
-        self.initUI()
-
-    def initUI(self):
-        self.setWindowTitle('Product List')
-        self.setGeometry(200, 200, 1030, 1200)
-        layout = QVBoxLayout()
-
-        self.table = QTableWidget(self)
-        self.table.setColumnCount(7)
-        self.table.setHorizontalHeaderLabels(
-            ['ID', 'Name', 'Description', 'Market Price', 'Safe Stock Lv', 'Healthy Stock Lv', 'Shelf Space'])
-
-        # 设置每列的宽度
-        self.table.setColumnWidth(0, 50)   # ID列
-        self.table.setColumnWidth(1, 150)  # Name列
-        self.table.setColumnWidth(2, 300)  # Description列
-        self.table.setColumnWidth(3, 150)  # Selling Price列
-        self.table.setColumnWidth(4, 100)  # Safe Stock Level列
-        self.table.setColumnWidth(5, 100)  # Healthy Stock Level列
-        self.table.setColumnWidth(6, 100)  # Shelf Space列
-
-        self.load_products()
-
-        layout.addWidget(self.table)
-        self.setLayout(layout)
-
-    def load_products(self):
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM Products')
-        rows = cursor.fetchall()
-
-        self.table.setRowCount(0)
-        for row in rows:
-            self.table.insertRow(self.table.rowCount())
-            for col, data in enumerate(row):
-                self.table.setItem(self.table.rowCount() - 1,
-                                   col, QTableWidgetItem(str(data)))
-
-        cursor.close()
-
-
-class StockListWindow(QDialog):
-    def __init__(self, conn, db_config):
-        super().__init__()
-        self.conn = conn
-        self.db_config = db_config
-        self.initUI()
-
-    def initUI(self):
-        self.setWindowTitle('Stock List')
-        self.setGeometry(200, 200, 1000, 1200)
-        layout = QVBoxLayout()
-
-        self.table = QTableWidget(self)
-        self.table.setColumnCount(7)
-        self.table.setHorizontalHeaderLabels(
-            ['Product ID', 'Product Name', 'Warehouse ID', 'Quantity', 'Shelf Space', 'Catalog ID', 'Price'])
-
-        # 设置每列的宽度
-        self.table.setColumnWidth(0, 100)  # Product ID列
-        self.table.setColumnWidth(1, 150)  # Product Name列
-        self.table.setColumnWidth(2, 100)  # Warehouse ID列
-        self.table.setColumnWidth(3, 100)  # Quantity列
-        self.table.setColumnWidth(4, 100)  # Shelf Space列
-        self.table.setColumnWidth(5, 100)  # Catalog ID列
-        self.table.setColumnWidth(6, 100)  # Price列
-
-        self.load_stock()
-
-        layout.addWidget(self.table)
-        self.setLayout(layout)
-
-    def load_stock(self):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT 
-                Inventory.product_id, 
-                Products.name AS product_name,
-                Inventory.warehouse_id, 
-                Inventory.quantity, 
-                Inventory.shelf_space, 
-                Inventory.catalog_id,
-                Catalog.price
-            FROM Inventory
-            JOIN Catalog ON Inventory.catalog_id = Catalog.catalog_id
-            JOIN Products ON Inventory.product_id = Products.product_id
-            ORDER BY Inventory.product_id
-        ''')
-        rows = cursor.fetchall()
-
-        self.table.setRowCount(0)
-        for row in rows:
-            self.table.insertRow(self.table.rowCount())
-            for col, data in enumerate(row):
-                self.table.setItem(self.table.rowCount() - 1,
-                                   col, QTableWidgetItem(str(data)))
-
-        cursor.close()
-
-
-class CatalogListWindow(QDialog):
-    def __init__(self, conn, db_config):
-        super().__init__()
-        self.conn = conn
-        self.db_config = db_config
-        self.initUI()
-
-    def initUI(self):
-        self.setWindowTitle('Catalog List')
-        self.setGeometry(200, 200, 1050, 600)
-        layout = QVBoxLayout()
-
-        self.table = QTableWidget(self)
-        self.table.setColumnCount(6)
-        self.table.setHorizontalHeaderLabels(
-            ['ID', 'Product Name', 'Description', 'Supplier Name', 'Max Quantity', 'Selling Price'])
-
-        # 设置每列的宽度
-        self.table.setColumnWidth(0, 50)   # ID列
-        self.table.setColumnWidth(1, 150)  # Product Name列
-        self.table.setColumnWidth(2, 300)  # Description列
-        self.table.setColumnWidth(3, 150)  # Supplier Name列
-        self.table.setColumnWidth(4, 100)  # Max Quantity列
-        self.table.setColumnWidth(5, 200)  # Selling Price列
-
-        self.load_catalog()
-
-        layout.addWidget(self.table)
-        self.setLayout(layout)
-
-    def load_catalog(self):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT 
-                Catalog.catalog_id, 
-                Products.name AS product_name,
-                Products.description,
-                Suppliers.name AS supplier_name,
-                Catalog.max_quantity, 
-                Catalog.price
-            FROM Catalog
-            JOIN Products ON Catalog.product_id = Products.product_id
-            JOIN Suppliers ON Catalog.supplier_id = Suppliers.supplier_id
-            ORDER BY Catalog.catalog_id
-        ''')
-        rows = cursor.fetchall()
-
-        self.table.setRowCount(0)
-        for row in rows:
-            self.table.insertRow(self.table.rowCount())
-            for col, data in enumerate(row):
-                self.table.setItem(self.table.rowCount() - 1,
-                                   col, QTableWidgetItem(str(data)))
-
-        cursor.close()
-
-
-class OrderListWindow(QDialog):
-    def __init__(self, conn, db_config):
-        super().__init__()
-        self.conn = conn
-        self.db_config = db_config
-        self.initUI()
-
-    def initUI(self):
-        self.setWindowTitle('Order List')
-        self.setGeometry(200, 200, 1200, 600)
-        layout = QVBoxLayout()
-
-        self.table = QTableWidget(self)
-        self.table.setColumnCount(9)
-        self.table.setHorizontalHeaderLabels(['Order ID', 'Customer Name', 'Order Date',
-                                             'Total Price', 'Delivery Date', 'Status', 'Product Name', 'Quantity', 'Unit price'])
-
-        # 设置每列的宽度
-        self.table.setColumnWidth(0, 100)  # Order ID列
-        self.table.setColumnWidth(1, 150)  # Customer Name列
-        self.table.setColumnWidth(2, 100)  # Order Date列
-        self.table.setColumnWidth(3, 100)  # Total Price列
-        self.table.setColumnWidth(4, 100)  # Delivery Date列
-        self.table.setColumnWidth(5, 100)  # Status列
-        self.table.setColumnWidth(6, 150)  # Product Name列
-        self.table.setColumnWidth(7, 100)  # Quantity列
-        self.table.setColumnWidth(8, 100)  # Unit price列
-
-        self.load_orders()
-
-        layout.addWidget(self.table)
-        self.setLayout(layout)
-
-    def load_orders(self):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT 
-                SalesOrders.order_id, 
-                Customers.name AS customer_name,
-                SalesOrders.order_date,
-                SalesOrders.total_price,
-                SalesOrders.delivery_date,
-                SalesOrders.status,
-                Products.name AS product_name,
-                SalesOrderDetails.quantity,
-                SalesOrderDetails.price_for_product
-            FROM SalesOrders
-            JOIN Customers ON SalesOrders.customer_id = Customers.customer_id
-            JOIN SalesOrderDetails ON SalesOrders.order_id = SalesOrderDetails.order_id
-            JOIN Products ON SalesOrderDetails.product_id = Products.product_id
-            ORDER BY SalesOrders.order_id
-        ''')
-        rows = cursor.fetchall()
-
-        self.table.setRowCount(0)
-        for row in rows:
-            self.table.insertRow(self.table.rowCount())
-            for col, data in enumerate(row):
-                self.table.setItem(self.table.rowCount() - 1,
-                                   col, QTableWidgetItem(str(data)))
-
-        cursor.close()
-
-
-class MostTransferredProductsWindow(QDialog):
-    def __init__(self, conn, db_config):
-        super().__init__()
-        self.conn = conn
-        self.db_config = db_config
-        self.initUI()
-
-    def initUI(self):
-        self.setWindowTitle('Most Transferred Products')
-        self.setGeometry(200, 200, 800, 600)
-        layout = QVBoxLayout()
-
-        self.table = QTableWidget(self)
-        self.table.setColumnCount(4)
-        self.table.setHorizontalHeaderLabels(
-            ['Warehouse ID', 'Product ID', 'Total Transferred', 'Product Name'])
-
-        # 设置每列的宽度
-        self.table.setColumnWidth(0, 150)  # Warehouse ID列
-        self.table.setColumnWidth(1, 150)  # Product ID列
-        self.table.setColumnWidth(2, 150)  # Total Transferred列
-        self.table.setColumnWidth(3, 200)  # Product Name列
-
-        self.load_data()
-
-        layout.addWidget(self.table)
-        self.setLayout(layout)
-
-    def load_data(self):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT 
-                t.warehouse_id,
-                t.product_id,
-                t.total_transferred,
-                p.name AS product_name
-            FROM (
-                SELECT 
-                    warehouse_id,
-                    product_id,
-                    SUM(total_transferred) AS total_transferred,
-                    ROW_NUMBER() OVER (PARTITION BY warehouse_id ORDER BY SUM(total_transferred) DESC) AS row_order
-                FROM (
-                    SELECT 
-                        from_warehouse_id AS warehouse_id,
-                        product_id,
-                        SUM(quantity) AS total_transferred
-                    FROM 
-                        WarehouseTransfers
-                    GROUP BY 
-                        1,2
-                    
-                    UNION ALL
-                    
-                    SELECT 
-                        to_warehouse_id AS warehouse_id,
-                        product_id,
-                        SUM(quantity) AS total_transferred
-                    FROM 
-                        WarehouseTransfers
-                    GROUP BY 
-                        1,2
-                ) AS transfers
-                GROUP BY 
-                    1,2
-            ) AS t
-            JOIN Products p ON t.product_id = p.product_id
-            WHERE row_order <= 5
-            ORDER BY t.warehouse_id, row_order;
-        ''')
-        rows = cursor.fetchall()
-
-        self.table.setRowCount(0)
-        for row in rows:
-            self.table.insertRow(self.table.rowCount())
-            for col, data in enumerate(row):
-                self.table.setItem(self.table.rowCount() - 1,
-                                   col, QTableWidgetItem(str(data)))
-
-        cursor.close()
-
-
-class MonthlyInventoryChangesWindow(QDialog):
-    def __init__(self, conn, db_config):
-        super().__init__()
-        self.conn = conn
-        self.db_config = db_config
-        self.initUI()
-
-    def initUI(self):
-        self.setWindowTitle('Monthly Inventory Changes')
-        self.setGeometry(200, 200, 1000, 600)
-        layout = QVBoxLayout()
-
-        self.table = QTableWidget(self)
-        self.table.setColumnCount(5)
-        self.table.setHorizontalHeaderLabels(
-            ['Warehouse ID', 'Product ID', 'Month and Year', 'Quantity Change', 'Product Name'])
-
-        # 设置每列的宽度
-        self.table.setColumnWidth(0, 150)  # Warehouse ID列
-        self.table.setColumnWidth(1, 150)  # Product ID列
-        self.table.setColumnWidth(2, 200)  # Month and Year列
-        self.table.setColumnWidth(3, 150)  # Quantity Change列
-        self.table.setColumnWidth(4, 200)  # Product Name列
-
-        self.load_data()
-
-        layout.addWidget(self.table)
-        self.setLayout(layout)
-
-    def load_data(self):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT 
-                i.warehouse_id,
-                i.product_id,
-                DATE_FORMAT(t.transfer_date, '%Y-%m') AS month_and_year,
-                COALESCE(SUM(CASE 
-                    WHEN t.from_warehouse_id = i.warehouse_id THEN -t.quantity
-                    WHEN t.to_warehouse_id = i.warehouse_id THEN t.quantity
-                    ELSE 0 
-                END), 0) AS quantity_change,
-                p.name AS product_name
-            FROM 
-                Inventory i
-            LEFT JOIN 
-                WarehouseTransfers t ON i.product_id = t.product_id 
-            JOIN Products p ON i.product_id = p.product_id
-            GROUP BY 
-                i.warehouse_id, i.product_id, month_and_year
-            HAVING 
-                quantity_change <> 0
-            ORDER BY 
-                i.warehouse_id, i.product_id, month_and_year;
-        ''')
-        rows = cursor.fetchall()
-
-        self.table.setRowCount(0)
-        for row in rows:
-            self.table.insertRow(self.table.rowCount())
-            for col, data in enumerate(row):
-                self.table.setItem(self.table.rowCount() - 1,
-                                   col, QTableWidgetItem(str(data)))
-
-        cursor.close()
-
-
-class LowStockProductsWindow(QDialog):
-    def __init__(self, conn, db_config):
-        super().__init__()
-        self.conn = conn
-        self.db_config = db_config
-        self.initUI()
-
-    def initUI(self):
-        self.setWindowTitle('Low Stock Products')
-        self.setGeometry(200, 200, 1000, 600)
-        layout = QVBoxLayout()
-
-        self.table = QTableWidget(self)
-        self.table.setColumnCount(5)
-        self.table.setHorizontalHeaderLabels(
-            ['Product ID', 'Product Name', 'Safe Stock Level', 'Current Stock', 'Restock Needed'])
-
-        # 设置每列的宽度
-        self.table.setColumnWidth(0, 150)  # Product ID列
-        self.table.setColumnWidth(1, 200)  # Product Name列
-        self.table.setColumnWidth(2, 150)  # Safe Stock Level列
-        self.table.setColumnWidth(3, 150)  # Current Stock列
-        self.table.setColumnWidth(4, 150)  # Restock Needed列
-
-        self.load_data()
-
-        layout.addWidget(self.table)
-        self.setLayout(layout)
-
-    def load_data(self):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT
-                P.product_id,
-                P.name AS product_name,
-                P.safe_stock_level,
-                SUM(I.quantity) AS current_stock,
-                (P.safe_stock_level - SUM(I.quantity)) AS restock_needed
-            FROM
-                Products P
-            LEFT JOIN
-                Inventory I ON P.product_id = I.product_id
-            GROUP BY
-                P.product_id, P.name, P.safe_stock_level
-            HAVING
-                current_stock < P.safe_stock_level;
-        ''')
-        rows = cursor.fetchall()
-
-        self.table.setRowCount(0)
-        for row in rows:
-            self.table.insertRow(self.table.rowCount())
-            for col, data in enumerate(row):
-                self.table.setItem(self.table.rowCount() - 1,
-                                   col, QTableWidgetItem(str(data)))
-
-        cursor.close()
+        return self.reads.inventory_summary()
 
 
 if __name__ == '__main__':
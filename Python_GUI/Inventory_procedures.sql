@@ -54,7 +54,7 @@ BEGIN
     DECLARE total_cost DECIMAL(10, 2) DEFAULT 0;
     DECLARE current_warehouse_id INT;
     DECLARE current_warehouse_capacity INT;
-    DECLARE current_warehouse_used_capacity INT;
+    DECLARE current_warehouse_free_space INT;
     DECLARE allocatable_quantity INT;
     DECLARE product_shelf_space INT;
     DECLARE supplier_quantity INT;
@@ -66,9 +66,12 @@ BEGIN
     DECLARE temp_price DECIMAL(10, 2);
     DECLARE temp_max_quantity INT;
     
+    -- Warehouses with room for at least one unit, largest first
+    -- (WarehouseSpace is kept by the triggers in section 13)
     DECLARE warehouse_cursor CURSOR FOR 
-        SELECT warehouse_id, capacity 
-        FROM Warehouses 
+        SELECT warehouse_id, capacity, free_space
+        FROM WarehouseSpace
+        WHERE free_space >= product_shelf_space
         ORDER BY capacity DESC;
 
     DECLARE supplier_cursor CURSOR FOR
@@ -116,21 +119,15 @@ BEGIN
         OPEN warehouse_cursor;
 
         allocation_loop: LOOP
-            FETCH warehouse_cursor INTO current_warehouse_id, current_warehouse_capacity;
+            FETCH warehouse_cursor INTO current_warehouse_id, current_warehouse_capacity,
+                                        current_warehouse_free_space;
             IF done THEN
                 LEAVE allocation_loop;
             END IF;
 
-            -- Calculate current used capacity
-            SELECT IFNULL(SUM(Inventory.quantity * Products.shelf_space), 0)
-            INTO current_warehouse_used_capacity
-            FROM Inventory
-            JOIN Products ON Inventory.product_id = Products.product_id
-            WHERE Inventory.warehouse_id = current_warehouse_id;
-
             -- Calculate how much can be allocated to this warehouse
             SET allocatable_quantity = 
-                FLOOR((current_warehouse_capacity - current_warehouse_used_capacity) / product_shelf_space);
+                FLOOR(current_warehouse_free_space / product_shelf_space);
 
             IF allocatable_quantity > 0 THEN
                 IF allocatable_quantity >= remaining_quantity THEN
@@ -198,17 +195,17 @@ BEGIN
             WHERE po_id = po_var;
 
             -- Update Inventory based on allocations with shelf space
+            -- (recorded in InventoryMovements as a receipt of this PO)
+            SET @movement_type = 'receipt', @movement_source_type = 'PurchaseOrder', @movement_source_id = po_var;
+            -- One row per allocation, with the catalog entry of the last
+            -- supplier used, as InventoryService._purchase does
             INSERT INTO Inventory (warehouse_id, product_id, quantity, shelf_space, catalog_id)
-            SELECT warehouse_id, product_id_var, quantity, product_shelf_space * quantity, catalog_id
+            SELECT warehouse_id, product_id_var, quantity, product_shelf_space * quantity, temp_catalog_id
             FROM temp_allocations
-            JOIN (
-                SELECT catalog_id, supplier_id, price, max_quantity
-                FROM Catalog
-                WHERE product_id = product_id_var
-            ) AS temp_catalog ON temp_catalog.catalog_id = catalog_id
             ON DUPLICATE KEY UPDATE 
                 Inventory.quantity = Inventory.quantity + VALUES(Inventory.quantity),
                 Inventory.shelf_space = Inventory.shelf_space + VALUES(Inventory.shelf_space);
+            SET @movement_type = NULL, @movement_source_type = NULL, @movement_source_id = NULL;
 
             -- Add an alert for successful PO creation
             SET alert_message = CONCAT('Purchase Order created with ID: ', po_var, 
@@ -286,11 +283,15 @@ BEGIN
     FROM Inventory
     WHERE product_id = product_id_var AND warehouse_id = warehouse_id_var;
 
+    -- Recorded in InventoryMovements as a receipt of this PO
+    SET @movement_type = 'receipt', @movement_source_type = 'PurchaseOrder', @movement_source_id = NEW.po_id;
+
     IF product_exists = 0 THEN
         -- Add the product to the Inventory table
         INSERT INTO Inventory (warehouse_id, product_id, quantity, shelf_space, catalog_id)
         VALUES (warehouse_id_var, product_id_var, NEW.quantity, 
-                (SELECT shelf_space FROM Products WHERE product_id = product_id_var), NEW.catalog_id);
+                NEW.quantity * (SELECT shelf_space FROM Products WHERE product_id = product_id_var),
+                NEW.catalog_id);
 
         -- Log the successful addition to the inventory list
         INSERT INTO Alerts (entity_type, entity_id, message, alert_date)
@@ -301,6 +302,8 @@ BEGIN
         SET quantity = quantity + NEW.quantity
         WHERE product_id = product_id_var AND warehouse_id = warehouse_id_var;
     END IF;
+
+    SET @movement_type = NULL, @movement_source_type = NULL, @movement_source_id = NULL;
 END//
 
 DELIMITER ;
@@ -524,10 +527,15 @@ BEGIN
         -- Insert alert and display the alert message
         INSERT INTO Alerts (entity_type, entity_id, message, alert_date)
         VALUES ('Product', p_product_id, CONCAT('Insufficient stock for product ', p_product_id, ' to fulfill sales order ', p_order_id), NOW());
-        SELECT CONCAT('Insufficient stock for product ', p_product_id, ' to fulfill sales order ', p_order_id) AS alert_message;
+        -- Triggers may not return result sets, see trg_after_insert_sales_order_details
+        IF @in_sales_order_trigger IS NULL THEN
+            SELECT CONCAT('Insufficient stock for product ', p_product_id, ' to fulfill sales order ', p_order_id) AS alert_message;
+        END IF;
     ELSE
         -- Loop through warehouses to fulfill the order
         SET v_needed_quantity = p_quantity;
+        -- Recorded in InventoryMovements as a sale of this order
+        SET @movement_type = 'sale', @movement_source_type = 'SalesOrder', @movement_source_id = p_order_id;
         OPEN warehouse_cursor;
 
         read_loop: LOOP
@@ -553,6 +561,7 @@ BEGIN
         END LOOP;
 
         CLOSE warehouse_cursor;
+        SET @movement_type = NULL, @movement_source_type = NULL, @movement_source_id = NULL;
 
         -- Reset done flag
         SET done = 0;
@@ -569,7 +578,9 @@ BEGIN
             -- Insert alert for low stock level and generate a suggestion instead of actual purchase order
             INSERT INTO Alerts (entity_type, entity_id, message, alert_date)
             VALUES ('Product', p_product_id, CONCAT('Suggestion: Consider placing a purchase order for product ', p_product_id, ' in inventory ID ', v_inventory_id, '. Current stock is ', v_current_stock, ' units, below safe stock level of ', v_safe_stock_level, ' units.'), NOW());
-			SELECT CONCAT('Suggestion: Consider placing a purchase order for product ', p_product_id, ' in inventory ID ', v_inventory_id, '. Current stock is ', v_current_stock, ' units, below safe stock level of ', v_safe_stock_level, ' units.') AS alert_message;
+            IF @in_sales_order_trigger IS NULL THEN
+                SELECT CONCAT('Suggestion: Consider placing a purchase order for product ', p_product_id, ' in inventory ID ', v_inventory_id, '. Current stock is ', v_current_stock, ' units, below safe stock level of ', v_safe_stock_level, ' units.') AS alert_message;
+            END IF;
         END LOOP;
 
         CLOSE below_safe_stock_cursor;
@@ -608,7 +619,15 @@ AFTER INSERT ON SalesOrderDetails
 FOR EACH ROW
 BEGIN
     -- 调用存储过程
-    CALL process_sales_order(NEW.order_id, NEW.product_id, NEW.quantity);
+    -- The flag stops process_sales_order from returning result sets, which
+    -- MySQL does not allow inside a trigger (error 1415).
+    -- A writer that has already filled the line with process_sales_order
+    -- (InventoryService.sell) records it with @sales_line_filled set.
+    IF @sales_line_filled IS NULL THEN
+        SET @in_sales_order_trigger = 1;
+        CALL process_sales_order(NEW.order_id, NEW.product_id, NEW.quantity);
+        SET @in_sales_order_trigger = NULL;
+    END IF;
 END //
 
 DELIMITER ;
@@ -819,3 +838,227 @@ CALL MostTransferredProducts();
 -- A list of the most frequently transferred products between warehouses. The output should include
 -- the warehouse ID, product ID, and the total quantity transferred for the top 5 most transferred 
 -- products in each warehouse.
+
+
+
+-- 12. Inventory movement ledger
+-- Every change of Inventory.quantity is appended to InventoryMovements in
+-- the same transaction. Writers describe the change in session variables
+-- before touching Inventory and clear them afterwards:
+--   @movement_type         receipt, sale, transfer_in, transfer_out or adjustment
+--   @movement_source_type  PurchaseOrder, SalesOrder, WarehouseTransfer, ...
+--   @movement_source_id    id of that document
+-- A change made without them is recorded as an adjustment.
+DROP TRIGGER IF EXISTS after_inventory_insert_ledger;
+DROP TRIGGER IF EXISTS after_inventory_update_ledger;
+DROP TRIGGER IF EXISTS after_inventory_delete_ledger;
+
+DELIMITER //
+
+CREATE TRIGGER after_inventory_insert_ledger
+AFTER INSERT ON Inventory
+FOR EACH ROW
+BEGIN
+    IF IFNULL(NEW.quantity, 0) <> 0 THEN
+        INSERT INTO InventoryMovements (movement_time, movement_type, warehouse_id, product_id,
+                                        inventory_id, quantity_change, source_type, source_id)
+        VALUES (NOW(), IFNULL(@movement_type, 'adjustment'), NEW.warehouse_id, NEW.product_id,
+                NEW.inventory_id, NEW.quantity, @movement_source_type, @movement_source_id);
+    END IF;
+END//
+
+CREATE TRIGGER after_inventory_update_ledger
+AFTER UPDATE ON Inventory
+FOR EACH ROW
+BEGIN
+    IF OLD.warehouse_id <=> NEW.warehouse_id AND OLD.product_id <=> NEW.product_id THEN
+        IF IFNULL(NEW.quantity, 0) <> IFNULL(OLD.quantity, 0) THEN
+            INSERT INTO InventoryMovements (movement_time, movement_type, warehouse_id, product_id,
+                                            inventory_id, quantity_change, source_type, source_id)
+            VALUES (NOW(), IFNULL(@movement_type, 'adjustment'), NEW.warehouse_id, NEW.product_id,
+                    NEW.inventory_id, IFNULL(NEW.quantity, 0) - IFNULL(OLD.quantity, 0),
+                    @movement_source_type, @movement_source_id);
+        END IF;
+    ELSE
+        -- The row was moved to another warehouse or product
+        INSERT INTO InventoryMovements (movement_time, movement_type, warehouse_id, product_id,
+                                        inventory_id, quantity_change, source_type, source_id)
+        VALUES (NOW(), IFNULL(@movement_type, 'adjustment'), OLD.warehouse_id, OLD.product_id,
+                OLD.inventory_id, -IFNULL(OLD.quantity, 0), @movement_source_type, @movement_source_id),
+               (NOW(), IFNULL(@movement_type, 'adjustment'), NEW.warehouse_id, NEW.product_id,
+                NEW.inventory_id, IFNULL(NEW.quantity, 0), @movement_source_type, @movement_source_id);
+    END IF;
+END//
+
+CREATE TRIGGER after_inventory_delete_ledger
+AFTER DELETE ON Inventory
+FOR EACH ROW
+BEGIN
+    IF IFNULL(OLD.quantity, 0) <> 0 THEN
+        INSERT INTO InventoryMovements (movement_time, movement_type, warehouse_id, product_id,
+                                        inventory_id, quantity_change, source_type, source_id)
+        VALUES (NOW(), IFNULL(@movement_type, 'adjustment'), OLD.warehouse_id, OLD.product_id,
+                OLD.inventory_id, -OLD.quantity, @movement_source_type, @movement_source_id);
+    END IF;
+END//
+
+DELIMITER ;
+
+		-- Test case
+		-- A sale is recorded with its order id
+		CALL process_sales_order(1, 1, 1);
+		SELECT * FROM InventoryMovements ORDER BY movement_id DESC LIMIT 5;
+
+
+
+-- 13. Warehouse space ledger
+-- Inventory.shelf_space is the space a row takes, quantity x
+-- Products.shelf_space. It is set here on every insert and update, whatever
+-- the writer passed, and WarehouseSpace.used_space moves with it in the same
+-- transaction. A new warehouse gets its WarehouseSpace row, a changed
+-- capacity or per unit shelf space is carried over.
+DROP TRIGGER IF EXISTS before_inventory_insert_space;
+DROP TRIGGER IF EXISTS before_inventory_update_space;
+DROP TRIGGER IF EXISTS after_inventory_insert_space;
+DROP TRIGGER IF EXISTS after_inventory_update_space;
+DROP TRIGGER IF EXISTS after_inventory_delete_space;
+DROP TRIGGER IF EXISTS after_warehouse_insert_space;
+DROP TRIGGER IF EXISTS after_warehouse_update_space;
+DROP TRIGGER IF EXISTS after_product_update_space;
+
+DELIMITER //
+
+CREATE TRIGGER before_inventory_insert_space
+BEFORE INSERT ON Inventory
+FOR EACH ROW
+BEGIN
+    SET NEW.shelf_space = IFNULL(NEW.quantity, 0) *
+        IFNULL((SELECT shelf_space FROM Products WHERE product_id = NEW.product_id), 0);
+END//
+
+CREATE TRIGGER before_inventory_update_space
+BEFORE UPDATE ON Inventory
+FOR EACH ROW
+BEGIN
+    SET NEW.shelf_space = IFNULL(NEW.quantity, 0) *
+        IFNULL((SELECT shelf_space FROM Products WHERE product_id = NEW.product_id), 0);
+END//
+
+CREATE TRIGGER after_inventory_insert_space
+AFTER INSERT ON Inventory
+FOR EACH ROW
+BEGIN
+    IF NEW.shelf_space <> 0 THEN
+        UPDATE WarehouseSpace
+        SET used_space = used_space + NEW.shelf_space
+        WHERE warehouse_id = NEW.warehouse_id;
+    END IF;
+END//
+
+CREATE TRIGGER after_inventory_update_space
+AFTER UPDATE ON Inventory
+FOR EACH ROW
+BEGIN
+    IF OLD.warehouse_id <=> NEW.warehouse_id THEN
+        IF NEW.shelf_space <> IFNULL(OLD.shelf_space, 0) THEN
+            UPDATE WarehouseSpace
+            SET used_space = used_space + NEW.shelf_space - IFNULL(OLD.shelf_space, 0)
+            WHERE warehouse_id = NEW.warehouse_id;
+        END IF;
+    ELSE
+        -- The row was moved to another warehouse
+        UPDATE WarehouseSpace
+        SET used_space = used_space - IFNULL(OLD.shelf_space, 0)
+        WHERE warehouse_id = OLD.warehouse_id;
+        UPDATE WarehouseSpace
+        SET used_space = used_space + NEW.shelf_space
+        WHERE warehouse_id = NEW.warehouse_id;
+    END IF;
+END//
+
+CREATE TRIGGER after_inventory_delete_space
+AFTER DELETE ON Inventory
+FOR EACH ROW
+BEGIN
+    IF IFNULL(OLD.shelf_space, 0) <> 0 THEN
+        UPDATE WarehouseSpace
+        SET used_space = used_space - OLD.shelf_space
+        WHERE warehouse_id = OLD.warehouse_id;
+    END IF;
+END//
+
+CREATE TRIGGER after_warehouse_insert_space
+AFTER INSERT ON Warehouses
+FOR EACH ROW
+BEGIN
+    INSERT INTO WarehouseSpace (warehouse_id, capacity, used_space)
+    VALUES (NEW.warehouse_id, IFNULL(NEW.capacity, 0), 0);
+END//
+
+CREATE TRIGGER after_warehouse_update_space
+AFTER UPDATE ON Warehouses
+FOR EACH ROW
+BEGIN
+    IF NOT (OLD.capacity <=> NEW.capacity) THEN
+        UPDATE WarehouseSpace
+        SET capacity = IFNULL(NEW.capacity, 0)
+        WHERE warehouse_id = NEW.warehouse_id;
+    END IF;
+END//
+
+CREATE TRIGGER after_product_update_space
+AFTER UPDATE ON Products
+FOR EACH ROW
+BEGIN
+    IF NOT (OLD.shelf_space <=> NEW.shelf_space) THEN
+        -- before_inventory_update_space recomputes each row
+        UPDATE Inventory
+        SET shelf_space = IFNULL(quantity, 0) * IFNULL(NEW.shelf_space, 0)
+        WHERE product_id = NEW.product_id;
+    END IF;
+END//
+
+DELIMITER ;
+
+		-- Test case
+		-- A sale frees its shelf space in the warehouse it was taken from
+		SELECT * FROM WarehouseSpace ORDER BY warehouse_id;
+		CALL process_sales_order(1, 1, 1);
+		SELECT * FROM WarehouseSpace WHERE free_space >= 100 ORDER BY free_space;
+
+
+
+-- 14. Opening balances
+-- The test cases above change Inventory before the triggers that record it
+-- exist, so the space ledger and the opening snapshot of the movement ledger
+-- are taken here, from the stock as it is now.
+-- Shelf space and WarehouseSpace are recomputed as
+-- `python warehouse_space.py rebuild` does (quantities do not change, so
+-- no movement is recorded).
+UPDATE Inventory
+LEFT JOIN Products ON Products.product_id = Inventory.product_id
+SET Inventory.shelf_space = IFNULL(Inventory.quantity, 0) * IFNULL(Products.shelf_space, 0)
+WHERE NOT (Inventory.shelf_space <=> IFNULL(Inventory.quantity, 0) * IFNULL(Products.shelf_space, 0));
+
+INSERT INTO WarehouseSpace (warehouse_id, capacity, used_space)
+SELECT Warehouses.warehouse_id, IFNULL(Warehouses.capacity, 0),
+       IFNULL(SUM(IFNULL(Inventory.quantity, 0) * IFNULL(Products.shelf_space, 0)), 0)
+FROM Warehouses
+LEFT JOIN Inventory ON Inventory.warehouse_id = Warehouses.warehouse_id
+LEFT JOIN Products ON Products.product_id = Inventory.product_id
+GROUP BY Warehouses.warehouse_id, Warehouses.capacity
+ON DUPLICATE KEY UPDATE capacity = VALUES(capacity), used_space = VALUES(used_space);
+
+-- The opening snapshot covers every movement recorded so far and is only
+-- taken once, running this script again keeps the first one.
+INSERT INTO InventorySnapshots (snapshot_id, snapshot_time, last_movement_id, created_at)
+SELECT 1, IFNULL(movements.last_time, NOW()), IFNULL(movements.last_id, 0), NOW()
+FROM (SELECT MAX(movement_time) AS last_time, MAX(movement_id) AS last_id
+      FROM InventoryMovements) AS movements
+WHERE NOT EXISTS (SELECT 1 FROM InventorySnapshots);
+
+INSERT INTO InventorySnapshotLines (snapshot_id, warehouse_id, product_id, quantity)
+SELECT 1, warehouse_id, product_id, SUM(quantity)
+FROM Inventory
+WHERE NOT EXISTS (SELECT 1 FROM InventorySnapshotLines WHERE snapshot_id = 1)
+GROUP BY warehouse_id, product_id;
@@ -127,6 +127,79 @@ CREATE TABLE Alerts (
     alert_date DATETIME
 );
 
+-- Append-only ledger of every Inventory quantity change, written by the
+-- Inventory triggers in Inventory_procedures.sql (see movement_ledger.py)
+CREATE TABLE InventoryMovements (
+    movement_id BIGINT PRIMARY KEY AUTO_INCREMENT,
+    movement_time DATETIME NOT NULL,
+    movement_type ENUM('receipt', 'sale', 'transfer_in', 'transfer_out', 'adjustment') NOT NULL,
+    warehouse_id INT NOT NULL,
+    product_id INT NOT NULL,
+    inventory_id INT NOT NULL,
+    quantity_change INT NOT NULL,
+    source_type VARCHAR(50) NULL,
+    source_id INT NULL,
+    INDEX idx_movements_product (product_id, movement_time),
+    INDEX idx_movements_source (source_type, source_id)
+);
+
+-- Used and free shelf space per warehouse. Inventory.shelf_space is the space
+-- a row takes (quantity x Products.shelf_space) and used_space is their sum.
+-- Both are kept by the triggers in Inventory_procedures.sql, section 13, in
+-- the same transaction as the stock change. idx_warehouse_space_free answers
+-- "warehouses with at least X free" with one index range scan.
+-- `python warehouse_space.py rebuild` recomputes it from Inventory.
+CREATE TABLE WarehouseSpace (
+    warehouse_id INT PRIMARY KEY,
+    capacity INT NOT NULL,
+    used_space BIGINT NOT NULL,
+    free_space BIGINT AS (capacity - used_space) STORED,
+    INDEX idx_warehouse_space_free (free_space, warehouse_id),
+    FOREIGN KEY (warehouse_id) REFERENCES Warehouses(warehouse_id) ON DELETE CASCADE
+);
+
+-- Compacted stock per warehouse and product, covering all movements up to
+-- last_movement_id. snapshot_time is the latest movement_time covered.
+CREATE TABLE InventorySnapshots (
+    snapshot_id INT PRIMARY KEY AUTO_INCREMENT,
+    snapshot_time DATETIME NOT NULL,
+    last_movement_id BIGINT NOT NULL,
+    created_at DATETIME NOT NULL,
+    INDEX idx_snapshots_time (snapshot_time)
+);
+
+CREATE TABLE InventorySnapshotLines (
+    snapshot_id INT,
+    warehouse_id INT,
+    product_id INT,
+    quantity INT NOT NULL,
+    PRIMARY KEY (snapshot_id, warehouse_id, product_id),
+    FOREIGN KEY (snapshot_id) REFERENCES InventorySnapshots(snapshot_id)
+);
+
+-- Pricing rules read by pricing.py. A quantity break sets the unit price once
+-- a product reaches min_quantity units in an order, a promotion takes
+-- percent_off that price between starts_on and ends_on (product_id NULL: all
+-- products). Without a rule a product sells at Products.selling_price.
+CREATE TABLE PriceBreaks (
+    break_id INT PRIMARY KEY AUTO_INCREMENT,
+    product_id INT NOT NULL,
+    min_quantity INT NOT NULL,
+    unit_price DECIMAL(10, 2) NOT NULL,
+    UNIQUE KEY uq_price_breaks (product_id, min_quantity),
+    FOREIGN KEY (product_id) REFERENCES Products(product_id)
+);
+
+CREATE TABLE Promotions (
+    promotion_id INT PRIMARY KEY AUTO_INCREMENT,
+    name VARCHAR(255) NOT NULL,
+    product_id INT NULL,
+    percent_off DECIMAL(5, 2) NOT NULL,
+    starts_on DATE NOT NULL,
+    ends_on DATE NOT NULL,
+    FOREIGN KEY (product_id) REFERENCES Products(product_id)
+);
+
 USE inventory_mgmt;
 
 -- insert Supplier's data
@@ -855,4 +928,36 @@ INSERT INTO WarehouseTransfers (from_warehouse_id, to_warehouse_id, product_id,
 (4, 2, 5, 4, '2024-05-13', 'Completed'),
 (5, 3, 9, 8, '2024-05-15', 'Completed'),
 (1, 4, 13, 6, '2024-05-17', 'Completed'),
-(2, 5, 17, 3, '2024-05-19', 'Completed');
\ No newline at end of file
+(2, 5, 17, 3, '2024-05-19', 'Completed');
+
+-- Insert pricing rules
+INSERT INTO PriceBreaks (product_id, min_quantity, unit_price) VALUES
+(1, 10, 1140.00),
+(1, 50, 1080.00),
+(2, 20, 760.00),
+(2, 100, 720.00),
+(5, 25, 135.00),
+(8, 25, 185.00),
+(10, 20, 230.00),
+(13, 50, 36.00);
+
+INSERT INTO Promotions (name, product_id, percent_off, starts_on, ends_on) VALUES
+('Back to school tablets', 7, 10.00, '2024-08-01', '2024-09-15'),
+('Summer kitchen week', 14, 15.00, '2024-06-01', '2024-06-07'),
+('Year end sale', NULL, 5.00, '2024-12-20', '2024-12-31');
+
+-- Shelf space of the seed stock as the triggers keep it, quantity x per unit space.
+-- The test cases in Inventory_procedures.sql allocate from this, and its
+-- last section recomputes both once the space triggers exist.
+UPDATE Inventory
+JOIN Products ON Products.product_id = Inventory.product_id
+SET Inventory.shelf_space = IFNULL(Inventory.quantity, 0) * IFNULL(Products.shelf_space, 0);
+
+INSERT INTO WarehouseSpace (warehouse_id, capacity, used_space)
+SELECT Warehouses.warehouse_id, IFNULL(Warehouses.capacity, 0), IFNULL(SUM(Inventory.shelf_space), 0)
+FROM Warehouses
+LEFT JOIN Inventory ON Inventory.warehouse_id = Warehouses.warehouse_id
+GROUP BY Warehouses.warehouse_id, Warehouses.capacity;
+
+-- The opening balance of the movement ledger is taken at the end of
+-- Inventory_procedures.sql, once the ledger triggers exist.
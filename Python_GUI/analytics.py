@@ -0,0 +1,356 @@
+# Vectorised inventory analytics: valuation, average cost, stock age, turnover
+# pip install numpy mysql-connector-python
+#
+# Inventory, Catalog, Products, purchase receipts and sales are read once
+# into NumPy column arrays. Every metric is then computed for all products
+# and warehouses at once with bincount/cumsum instead of one procedure call
+# (and one temporary table) per product.
+#
+#   average cost       SUM(quantity * catalog price) / SUM(quantity), the same
+#                      figure calculate_average_price_per_product returns
+#   valuation          stock value at cost and at selling price, per warehouse
+#   stock age          quantity weighted age of on-hand stock, assuming the
+#                      newest receipts are the ones still on the shelf (FIFO)
+#   turnover           units sold in the window / units on hand
+#
+# The same arrays can come from a columnar snapshot instead of the database
+# (columnar_snapshot.py), e.g. python analytics.py --snapshot snapshots/inventory
+
+import argparse
+import csv
+import sys
+
+import numpy as np
+
+from db_settings import add_db_arguments, db_config_from_args
+
+
+class InventoryArrays:
+    # Raw columns, one array per column.
+
+    def __init__(self):
+        self.product_ids = np.zeros(0, dtype=np.int64)
+        self.product_names = []
+        self.selling_price = np.zeros(0)
+        self.shelf_space = np.zeros(0, dtype=np.int64)
+
+        self.warehouse_ids = np.zeros(0, dtype=np.int64)
+        self.capacity = np.zeros(0, dtype=np.int64)
+
+        self.inv_warehouse = np.zeros(0, dtype=np.int64)
+        self.inv_product = np.zeros(0, dtype=np.int64)
+        self.inv_quantity = np.zeros(0, dtype=np.int64)
+        self.inv_unit_cost = np.zeros(0)
+
+        self.receipt_product = np.zeros(0, dtype=np.int64)
+        self.receipt_date = np.zeros(0, dtype='datetime64[D]')
+        self.receipt_quantity = np.zeros(0, dtype=np.int64)
+
+        self.sale_product = np.zeros(0, dtype=np.int64)
+        self.sale_date = np.zeros(0, dtype='datetime64[D]')
+        self.sale_quantity = np.zeros(0, dtype=np.int64)
+
+
+def _fetch_columns(cursor, sql, dtypes):
+    cursor.execute(sql)
+    rows = cursor.fetchall()
+    columns = list(zip(*rows)) if rows else [()] * len(dtypes)
+    return [np.array([0 if v is None else v for v in col], dtype=dtype)
+            if dtype != 'datetime64[D]'
+            else np.array([str(v) for v in col], dtype=dtype)
+            for col, dtype in zip(columns, dtypes)]
+
+
+def load_arrays(conn):
+    arrays = InventoryArrays()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        SELECT product_id, name, selling_price, shelf_space
+        FROM Products
+        ORDER BY product_id;
+    ''')
+    rows = cursor.fetchall()
+    arrays.product_ids = np.array([r[0] for r in rows], dtype=np.int64)
+    arrays.product_names = [r[1] for r in rows]
+    arrays.selling_price = np.array([float(r[2] or 0) for r in rows])
+    arrays.shelf_space = np.array([r[3] or 0 for r in rows], dtype=np.int64)
+
+    arrays.warehouse_ids, arrays.capacity = _fetch_columns(cursor, '''
+        SELECT warehouse_id, capacity FROM Warehouses ORDER BY warehouse_id;
+    ''', [np.int64, np.int64])
+
+    (arrays.inv_warehouse, arrays.inv_product,
+     arrays.inv_quantity, arrays.inv_unit_cost) = _fetch_columns(cursor, '''
+        SELECT Inventory.warehouse_id, Inventory.product_id, Inventory.quantity, Catalog.price
+        FROM Inventory
+        JOIN Catalog ON Inventory.catalog_id = Catalog.catalog_id;
+    ''', [np.int64, np.int64, np.int64, np.float64])
+
+    (arrays.receipt_product, arrays.receipt_date,
+     arrays.receipt_quantity) = _fetch_columns(cursor, '''
+        SELECT c.product_id, COALESCE(po.expected_delivery_date, po.order_date), d.quantity
+        FROM PurchaseOrderDetails d
+        JOIN PurchaseOrders po ON d.po_id = po.po_id
+        JOIN Catalog c ON d.catalog_id = c.catalog_id
+        WHERE po.status <> 'Rejected' AND po.order_date IS NOT NULL;
+    ''', [np.int64, 'datetime64[D]', np.int64])
+
+    (arrays.sale_product, arrays.sale_date,
+     arrays.sale_quantity) = _fetch_columns(cursor, '''
+        SELECT d.product_id, o.order_date, d.quantity
+        FROM SalesOrderDetails d
+        JOIN SalesOrders o ON d.order_id = o.order_id
+        WHERE o.order_date IS NOT NULL;
+    ''', [np.int64, 'datetime64[D]', np.int64])
+
+    cursor.close()
+    conn.commit()
+    return arrays
+
+
+def load_arrays_from_snapshot(path):
+    # Same columns and filters as load_arrays, read from a columnar snapshot
+    from columnar_snapshot import SnapshotReader
+
+    reader = SnapshotReader(path)
+    arrays = InventoryArrays()
+
+    products = reader.columns('Products')
+    order = np.argsort(products['product_id'], kind='stable')
+    arrays.product_ids = products['product_id'][order].astype(np.int64)
+    arrays.product_names = [str(name) for name in products['name'][order]]
+    arrays.selling_price = products['selling_price'][order] / 100.0
+    arrays.shelf_space = products['shelf_space'][order].astype(np.int64)
+
+    warehouses = reader.columns('Warehouses')
+    order = np.argsort(warehouses['warehouse_id'], kind='stable')
+    arrays.warehouse_ids = warehouses['warehouse_id'][order].astype(np.int64)
+    arrays.capacity = warehouses['capacity'][order].astype(np.int64)
+
+    # Inventory JOIN Catalog
+    catalog = reader.columns('Catalog', ['catalog_id', 'price'])
+    catalog_order = np.argsort(catalog['catalog_id'], kind='stable')
+    catalog_ids = catalog['catalog_id'][catalog_order]
+    catalog_price = catalog['price'][catalog_order] / 100.0
+    inventory = reader.columns('Inventory', ['warehouse_id', 'product_id', 'quantity', 'catalog_id'])
+    if catalog_ids.size:
+        c_idx = np.minimum(np.searchsorted(catalog_ids, inventory['catalog_id']),
+                           catalog_ids.size - 1)
+        found = catalog_ids[c_idx] == inventory['catalog_id']
+    else:
+        c_idx = np.zeros(len(inventory['catalog_id']), dtype=np.int64)
+        found = np.zeros(len(inventory['catalog_id']), dtype=bool)
+    arrays.inv_warehouse = inventory['warehouse_id'][found].astype(np.int64)
+    arrays.inv_product = inventory['product_id'][found].astype(np.int64)
+    arrays.inv_quantity = inventory['quantity'][found].astype(np.int64)
+    arrays.inv_unit_cost = catalog_price[c_idx[found]] if catalog_ids.size else np.zeros(0)
+
+    receipts = reader.columns('PurchaseOrderDetails', [
+        'product_id', 'quantity', 'order_date', 'expected_delivery_date', 'status'])
+    rejected = reader.category_code('PurchaseOrderDetails', 'status', 'Rejected')
+    keep = ((receipts['status'] != rejected) & (receipts['status'] != 0)
+            & ~np.isnat(receipts['order_date']))
+    delivery = receipts['expected_delivery_date'][keep]
+    arrays.receipt_product = receipts['product_id'][keep].astype(np.int64)
+    arrays.receipt_date = np.where(np.isnat(delivery), receipts['order_date'][keep], delivery)
+    arrays.receipt_quantity = receipts['quantity'][keep].astype(np.int64)
+
+    sales = reader.columns('SalesOrderDetails', ['product_id', 'quantity', 'order_date'])
+    keep = ~np.isnat(sales['order_date'])
+    arrays.sale_product = sales['product_id'][keep].astype(np.int64)
+    arrays.sale_date = sales['order_date'][keep]
+    arrays.sale_quantity = sales['quantity'][keep].astype(np.int64)
+    return arrays
+
+
+class InventoryAnalytics:
+    def __init__(self, arrays, as_of=None, turnover_days=90):
+        self.arrays = arrays
+        self.turnover_days = turnover_days
+        self.as_of = self._resolve_as_of(as_of)
+        self._compute()
+
+    def _resolve_as_of(self, as_of):
+        if as_of is not None:
+            return np.datetime64(as_of, 'D')
+        # Default to the latest recorded activity so historical data sets
+        # are measured against their own timeline.
+        dates = np.concatenate([self.arrays.receipt_date, self.arrays.sale_date])
+        if dates.size:
+            return dates.max()
+        return np.datetime64('today', 'D')
+
+    def _product_index(self, product_ids):
+        # Dense index into arrays.product_ids; -1 for unknown products.
+        known = self.arrays.product_ids
+        if known.size == 0:
+            return np.full(product_ids.shape, -1, dtype=np.int64)
+        index = np.minimum(np.searchsorted(known, product_ids), known.size - 1)
+        return np.where(known[index] == product_ids, index, -1)
+
+    def _compute(self):
+        a = self.arrays
+        n_products = a.product_ids.size
+        n_warehouses = a.warehouse_ids.size
+
+        # Valuation at cost.
+        p_idx = self._product_index(a.inv_product)
+        keep = p_idx >= 0
+        p_idx = p_idx[keep]
+        quantity = a.inv_quantity[keep].astype(np.float64)
+        cost_value = quantity * a.inv_unit_cost[keep]
+
+        self.on_hand = np.bincount(p_idx, quantity, minlength=n_products)
+        self.cost_value = np.bincount(p_idx, cost_value, minlength=n_products)
+        self.average_cost = np.divide(self.cost_value, self.on_hand,
+                                      out=np.zeros(n_products), where=self.on_hand > 0)
+        self.retail_value = self.on_hand * a.selling_price
+
+        w_idx = np.searchsorted(a.warehouse_ids, a.inv_warehouse[keep])
+        w_idx = np.clip(w_idx, 0, max(n_warehouses - 1, 0))
+        self.warehouse_units = np.bincount(w_idx, quantity, minlength=n_warehouses)
+        self.warehouse_value = np.bincount(w_idx, cost_value, minlength=n_warehouses)
+        self.warehouse_retail_value = np.bincount(
+            w_idx, quantity * a.selling_price[p_idx], minlength=n_warehouses)
+        self.warehouse_used_space = np.bincount(
+            w_idx, quantity * a.shelf_space[p_idx], minlength=n_warehouses)
+        self.warehouse_utilisation = np.divide(
+            self.warehouse_used_space, a.capacity.astype(np.float64),
+            out=np.zeros(n_warehouses), where=a.capacity > 0)
+
+        self.total_units = float(self.on_hand.sum())
+        self.total_value = float(self.cost_value.sum())
+
+        self._compute_stock_age()
+        self._compute_turnover()
+
+    def _compute_stock_age(self):
+        a = self.arrays
+        n_products = a.product_ids.size
+        self.stock_age_days = np.zeros(n_products)
+
+        r_idx = self._product_index(a.receipt_product)
+        valid = (r_idx >= 0) & (a.receipt_date <= self.as_of)
+        r_idx = r_idx[valid]
+        if r_idx.size == 0:
+            return
+        r_age = (self.as_of - a.receipt_date[valid]).astype(np.float64)
+        r_qty = a.receipt_quantity[valid].astype(np.float64)
+
+        # Newest receipts first within each product, then the running total
+        # of received units tells how much of each receipt is still on hand.
+        order = np.lexsort((r_age, r_idx))
+        r_idx, r_age, r_qty = r_idx[order], r_age[order], r_qty[order]
+        cumulative = np.cumsum(r_qty)
+        group_start = np.concatenate(([True], r_idx[1:] != r_idx[:-1]))
+        offsets = np.maximum.accumulate(np.where(group_start, cumulative - r_qty, 0))
+        received_before = cumulative - r_qty - offsets
+        covered = np.clip(self.on_hand[r_idx] - received_before, 0, r_qty)
+
+        weighted_age = np.bincount(r_idx, covered * r_age, minlength=n_products)
+        covered_units = np.bincount(r_idx, covered, minlength=n_products)
+
+        # Stock older than the receipt history is aged as the oldest receipt.
+        oldest_age = np.zeros(n_products)
+        np.maximum.at(oldest_age, r_idx, r_age)
+        uncovered = np.maximum(self.on_hand - covered_units, 0)
+        weighted_age += uncovered * oldest_age
+        self.stock_age_days = np.divide(weighted_age, self.on_hand,
+                                        out=np.zeros(n_products), where=self.on_hand > 0)
+
+    def _compute_turnover(self):
+        a = self.arrays
+        n_products = a.product_ids.size
+        start = self.as_of - np.timedelta64(self.turnover_days, 'D')
+        s_idx = self._product_index(a.sale_product)
+        valid = (s_idx >= 0) & (a.sale_date > start) & (a.sale_date <= self.as_of)
+        self.units_sold = np.bincount(s_idx[valid], a.sale_quantity[valid].astype(np.float64),
+                                      minlength=n_products)
+        self.turnover = np.divide(self.units_sold, self.on_hand,
+                                  out=np.zeros(n_products), where=self.on_hand > 0)
+        daily_sales = self.units_sold / self.turnover_days
+        self.days_of_cover = np.divide(self.on_hand, daily_sales,
+                                       out=np.full(n_products, np.inf), where=daily_sales > 0)
+
+    def product_rows(self):
+        a = self.arrays
+        return [
+            (int(a.product_ids[i]), a.product_names[i], int(self.on_hand[i]),
+             round(float(self.average_cost[i]), 2), round(float(self.cost_value[i]), 2),
+             round(float(self.stock_age_days[i]), 1), round(float(self.turnover[i]), 2))
+            for i in range(a.product_ids.size)
+        ]
+
+    def warehouse_rows(self):
+        a = self.arrays
+        return [
+            (int(a.warehouse_ids[i]), int(self.warehouse_units[i]),
+             round(float(self.warehouse_value[i]), 2),
+             round(float(self.warehouse_retail_value[i]), 2),
+             round(float(self.warehouse_utilisation[i]) * 100, 1))
+            for i in range(a.warehouse_ids.size)
+        ]
+
+
+PRODUCT_HEADERS = ['Product ID', 'Product Name', 'On Hand', 'Average Cost',
+                   'Stock Value', 'Stock Age (days)', 'Turnover']
+WAREHOUSE_HEADERS = ['Warehouse ID', 'Units', 'Value at Cost', 'Value at Price',
+                     'Space Used %']
+
+
+def format_report(analytics, top=None):
+    lines = [f'Inventory analytics as of {analytics.as_of} '
+             f'(turnover window {analytics.turnover_days} days)',
+             f'Total units: {analytics.total_units:.0f}   '
+             f'Total value at cost: {analytics.total_value:,.2f}', '']
+
+    lines.append('{:>12} {:>10} {:>16} {:>16} {:>13}'.format(*WAREHOUSE_HEADERS))
+    for row in analytics.warehouse_rows():
+        lines.append('{:>12} {:>10} {:>16,.2f} {:>16,.2f} {:>13.1f}'.format(*row))
+    lines.append('')
+
+    rows = sorted(analytics.product_rows(), key=lambda r: r[4], reverse=True)
+    if top:
+        rows = rows[:top]
+    lines.append('{:>10}  {:<24} {:>8} {:>12} {:>14} {:>16} {:>9}'.format(*PRODUCT_HEADERS))
+    for row in rows:
+        lines.append('{:>10}  {:<24.24} {:>8} {:>12,.2f} {:>14,.2f} {:>16.1f} {:>9.2f}'.format(*row))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Inventory valuation and average cost report')
+    add_db_arguments(parser)
+    parser.add_argument('--as-of', default=None, help='YYYY-MM-DD, defaults to latest activity')
+    parser.add_argument('--turnover-days', type=int, default=90)
+    parser.add_argument('--top', type=int, default=None, help='only list the N most valuable products')
+    parser.add_argument('--csv', default=None, help='also write the product table to this file')
+    parser.add_argument('--snapshot', default=None,
+                        help='read a columnar snapshot directory instead of the database')
+    args = parser.parse_args(argv)
+
+    if args.snapshot:
+        arrays = load_arrays_from_snapshot(args.snapshot)
+    else:
+        import mysql.connector
+
+        conn = mysql.connector.connect(**db_config_from_args(args))
+        try:
+            arrays = load_arrays(conn)
+        finally:
+            conn.close()
+
+    analytics = InventoryAnalytics(arrays, args.as_of, args.turnover_days)
+    print(format_report(analytics, args.top))
+
+    if args.csv:
+        with open(args.csv, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(PRODUCT_HEADERS)
+            writer.writerows(analytics.product_rows())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
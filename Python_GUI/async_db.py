@@ -0,0 +1,234 @@
+# Asyncio data access for high-concurrency order intake
+# pip install aiomysql
+#
+# AsyncInventoryDB offers the order intake operations (fulfil a sale, create
+# a purchase order, reports) on an aiomysql connection pool, so thousands of
+# submissions can be in flight from one process while only `maxsize`
+# connections are open. SyncInventoryDB runs the same object on a background
+# event loop for blocking callers such as the Qt app, and has the same
+# method names and results as InventoryService.
+
+import asyncio
+import threading
+from datetime import date
+
+import aiomysql
+
+from inventory_service import (
+    PURCHASE_ALERT_SQL, PURCHASE_DETAIL_SQL, PURCHASE_INVENTORY_SQL, PURCHASE_ORDER_SQL,
+    PURCHASE_REJECT_SQL, PURCHASE_SHELF_SPACE_SQL, PURCHASE_SUPPLIERS_SQL, PURCHASE_TOTAL_SQL,
+    PURCHASE_WAREHOUSES_SQL, PRODUCT_STOCK_SQL, REPORTS, SALE_DETAIL_SQL, SALE_LINE_FILLED_SQL,
+    SALE_TOTAL_SQL, SUMMARY_QUERIES, ServiceError, plan_purchase, purchase_outcome)
+from movement_ledger import MOVEMENT_RECEIPT
+from pricing import (
+    PRICE_RULE_QUERIES, PricingEngine, PricingError, price_lines, price_rules_from_rows)
+from report_cache import PURCHASE_TABLES, SALE_TABLES, bump_tables
+from workload_capture import OP_PURCHASE, OP_REPORT, OP_SELL, captured
+
+
+# Base class of the errors aiomysql raises, the counterpart of
+# mysql.connector.Error.
+DatabaseError = aiomysql.Error
+
+
+class AsyncInventoryDB:
+    def __init__(self, db_config, minsize=1, maxsize=50, pricing=None):
+        self.db_config = db_config
+        self.minsize = minsize
+        self.maxsize = maxsize
+        self.pricing = pricing or PricingEngine()
+        self.pool = None
+
+    async def open(self):
+        if self.pool is None:
+            self.pool = await aiomysql.create_pool(
+                host=self.db_config['host'],
+                port=self.db_config.get('port', 3306),
+                user=self.db_config['user'],
+                password=self.db_config['password'],
+                db=self.db_config['database'],
+                minsize=self.minsize,
+                maxsize=self.maxsize,
+                autocommit=False)
+        return self
+
+    async def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            await self.pool.wait_closed()
+            self.pool = None
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _call_procedure(self, cursor, name, args):
+        # Returns the first column of every row of every result set.
+        await cursor.callproc(name, args)
+        messages = []
+        while True:
+            if cursor.description:
+                messages.extend(row[0] for row in await cursor.fetchall())
+            if not await cursor.nextset():
+                break
+        return messages
+
+    async def _load_price_rules(self):
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                results = []
+                for sql in PRICE_RULE_QUERIES:
+                    await cursor.execute(sql)
+                    results.append(await cursor.fetchall())
+            await conn.commit()
+        return price_rules_from_rows(*results)
+
+    async def _product_stock(self, cursor, product_id, lock=False):
+        await cursor.execute(PRODUCT_STOCK_SQL + (' FOR UPDATE;' if lock else ';'), (product_id,))
+        return sum(qty or 0 for qty, in await cursor.fetchall())
+
+    async def fulfil_sale(self, order_id, product_id, quantity):
+        # InventoryService.sell on aiomysql: a filled line is priced,
+        # recorded in SalesOrderDetails and added to the order total
+        try:
+            rules = await self.pricing.rules_async(self._load_price_rules)
+            line = price_lines(rules, [(product_id, quantity)], date.today()).lines[0]
+        except PricingError as err:
+            raise ServiceError(str(err)) from err
+        async with self.pool.acquire() as conn:
+            try:
+                async with conn.cursor() as cursor:
+                    before = await self._product_stock(cursor, product_id, lock=True)
+                    messages = await self._call_procedure(
+                        cursor, 'process_sales_order', (order_id, product_id, quantity))
+                    filled = before - await self._product_stock(cursor, product_id) == quantity
+                    if filled:
+                        await cursor.execute(SALE_LINE_FILLED_SQL, (1,))
+                        try:
+                            await cursor.execute(SALE_DETAIL_SQL, (
+                                order_id, product_id, quantity, line.line_total))
+                        finally:
+                            await cursor.execute(SALE_LINE_FILLED_SQL, (None,))
+                        await cursor.execute(SALE_TOTAL_SQL, (line.line_total, order_id))
+                await conn.commit()
+            except BaseException:
+                await conn.rollback()
+                raise
+        bump_tables(*SALE_TABLES)
+        return {'order_id': order_id, 'messages': messages,
+                'line_total': line.line_total if filled else None}
+
+    async def create_purchase_order(self, product_id, quantity):
+        # InventoryService._purchase on aiomysql: the same statements and
+        # plan_purchase, so both order backends return the same dict
+        async with self.pool.acquire() as conn:
+            try:
+                async with conn.cursor() as cursor:
+                    result = await self._purchase(cursor, product_id, quantity)
+                await conn.commit()
+            except BaseException:
+                await conn.rollback()
+                raise
+        bump_tables(*PURCHASE_TABLES)
+        return result
+
+    async def _purchase(self, cursor, product_id, quantity):
+        await cursor.execute(PURCHASE_SUPPLIERS_SQL, (product_id,))
+        suppliers = await cursor.fetchall()
+        await cursor.execute(PURCHASE_SHELF_SPACE_SQL, (product_id,))
+        row = await cursor.fetchone()
+        if not suppliers or row is None:
+            raise ServiceError(f'Product ID {product_id} has no supplier in the catalog')
+        product_shelf_space = row[0]
+
+        await cursor.execute(PURCHASE_ORDER_SQL, (suppliers[0][0],))
+        po_id = cursor.lastrowid
+        await cursor.execute(PURCHASE_WAREHOUSES_SQL, (product_shelf_space,))
+        plan = plan_purchase(quantity, suppliers, product_shelf_space, await cursor.fetchall())
+        status, message = purchase_outcome(po_id, product_id, quantity, plan)
+
+        if plan.unallocated:
+            await cursor.execute(PURCHASE_REJECT_SQL, (po_id,))
+            await cursor.execute(PURCHASE_ALERT_SQL, ('Product', product_id, message))
+            return {'po_id': po_id, 'status': status, 'message': message}
+
+        await cursor.executemany(PURCHASE_DETAIL_SQL, [
+            (po_id, catalog_id, supplier_quantity, price)
+            for catalog_id, supplier_quantity, price in plan.details])
+        await cursor.execute(PURCHASE_TOTAL_SQL, (plan.total_cost, po_id))
+
+        # Update Inventory based on allocations, recorded as a receipt of the PO
+        await cursor.execute('''
+            SET @movement_type = %s, @movement_source_type = 'PurchaseOrder', @movement_source_id = %s;
+        ''', (MOVEMENT_RECEIPT, po_id))
+        for warehouse_id, allocated in plan.allocations:
+            await cursor.execute(PURCHASE_INVENTORY_SQL, (
+                warehouse_id, product_id, allocated,
+                product_shelf_space * allocated, plan.catalog_id))
+        await cursor.execute('''
+            SET @movement_type = NULL, @movement_source_type = NULL, @movement_source_id = NULL;
+        ''')
+
+        await cursor.execute(PURCHASE_ALERT_SQL, ('PurchaseOrder', po_id, message))
+        return {'po_id': po_id, 'status': status, 'message': message}
+
+    async def report(self, name):
+        if name not in REPORTS:
+            raise ValueError(f'Unknown report: {name}')
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(REPORTS[name])
+                rows = await cursor.fetchall()
+            await conn.commit()
+        return list(rows)
+
+    async def inventory_summary(self):
+        summary = []
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                for label, sql in SUMMARY_QUERIES:
+                    await cursor.execute(sql)
+                    summary.append((label, (await cursor.fetchone())[0]))
+            await conn.commit()
+        return summary
+
+
+class SyncInventoryDB:
+    # Blocking facade over AsyncInventoryDB. The event loop lives in a daemon
+    # thread, so callers on the Qt main thread simply wait for the result.
+
+    def __init__(self, db_config, minsize=1, maxsize=10, timeout=30):
+        self.timeout = timeout
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name='async-db-loop', daemon=True)
+        self._thread.start()
+        self._db = AsyncInventoryDB(db_config, minsize, maxsize)
+        self._run(self._db.open())
+
+    def _run(self, coroutine):
+        future = asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+        return future.result(self.timeout)
+
+    def sell(self, order_id, product_id, quantity):
+        with captured(OP_SELL, {'order_id': order_id, 'product_id': product_id,
+                                'quantity': quantity}):
+            return self._run(self._db.fulfil_sale(order_id, product_id, quantity))
+
+    def purchase(self, product_id, quantity):
+        with captured(OP_PURCHASE, {'product_id': product_id, 'quantity': quantity}):
+            return self._run(self._db.create_purchase_order(product_id, quantity))
+
+    def report(self, name):
+        with captured(OP_REPORT, {'name': name}):
+            return self._run(self._db.report(name))
+
+    def inventory_summary(self):
+        return self._run(self._db.inventory_summary())
+
+    def close(self):
+        self._run(self._db.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(self.timeout)
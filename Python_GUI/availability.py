@@ -0,0 +1,320 @@
+# In-memory stock availability index for point-of-sale and storefront checks
+# pip install mysql-connector-python
+#
+# AvailabilityIndex keeps on-hand quantities per product and warehouse in
+# memory, plus reservations (units held for a cart or a quote, released or
+# expired after a TTL), so availability(product_ids) never touches MySQL:
+#   available = on hand - reserved
+#
+# It is kept current from the write paths: after a sale, purchase or
+# transfer commits, the writer calls touch(product_ids) and a background
+# thread re-reads just those products from Inventory, coalescing bursts of
+# writes into one query. A refresh only overwrites a product that was not
+# touched again after the refresh started, so a slow refresh cannot put back
+# older numbers. Every reconcile_interval seconds the whole index is
+# reloaded from Inventory, which also picks up writes made by other
+# processes; the number of products that had drifted is counted in stats.
+#
+# A sale made against a reservation passes its id to touch(); the
+# reservation is dropped once the refresh that reads the sale is applied, so
+# its units are neither counted twice (sold and still reserved) nor shown as
+# available in between.
+#
+# InventoryService holds reservations against its own sales: sell() and
+# place_sales_order() refuse a line when the locked stock less the units
+# reserved_for_others() is below the quantity. Reservations live in this
+# process only, so sales made by other processes (the GUI, the async order
+# backend) do not see them.
+#
+#   python availability.py 1 2 8
+#   python availability.py 1 2 8 --repeat 100000
+
+import argparse
+import heapq
+import itertools
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import mysql.connector
+
+from db_settings import add_db_arguments, db_config_from_args
+
+
+class AvailabilityIndex:
+    def __init__(self, connection, refresh_delay=0.05, reconcile_interval=300.0):
+        # connection: factory of a context manager that yields a connection,
+        # e.g. InventoryService.connection
+        self.connection = connection
+        self.refresh_delay = refresh_delay
+        self.reconcile_interval = reconcile_interval
+        self.stats = {'refreshes': 0, 'reconciliations': 0, 'drifted_products': 0}
+        self._stock = {}             # product_id -> {warehouse_id: quantity}
+        self._on_hand = {}           # product_id -> quantity
+        self._reservations = {}      # reservation_id -> (product_id, quantity, expires_at)
+        self._reserved = {}          # product_id -> quantity
+        self._expiries = []          # heap of (expires_at, reservation_id)
+        self._consumed = []          # (seq of the sale's touch, reservation_id)
+        self._reservation_ids = itertools.count(1)
+        self._seq = 0
+        self._touched = {}           # product_id -> seq of its last touch
+        self._pending = set()
+        self._done_seq = 0
+        self._last_reconcile = 0.0
+        self._stopping = False
+        self._thread = None
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    # ---------------------------- lifecycle ------------------------------
+
+    def start(self):
+        self.reconcile()
+        self._thread = threading.Thread(target=self._run, name='availability-index', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._changed:
+            self._stopping = True
+            self._changed.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    # ---------------------------- reads ----------------------------------
+
+    def availability(self, product_ids, warehouses=False):
+        now = time.monotonic()
+        result = {}
+        with self._lock:
+            self._expire_reservations(now)
+            for product_id in product_ids:
+                on_hand = self._on_hand.get(product_id, 0)
+                reserved = self._reserved.get(product_id, 0)
+                entry = {'on_hand': on_hand, 'reserved': reserved,
+                         'available': max(on_hand - reserved, 0)}
+                if warehouses:
+                    entry['warehouses'] = dict(self._stock.get(product_id, {}))
+                result[product_id] = entry
+        return result
+
+    # ---------------------------- reservations ---------------------------
+
+    def reserved_for_others(self, product_ids, reservation_ids=()):
+        # {product_id: units held by live reservations other than
+        # reservation_ids}. Reservations a committed sale used up are left
+        # out, their units are already gone from Inventory.
+        now = time.monotonic()
+        with self._lock:
+            self._expire_reservations(now)
+            held = {product_id: self._reserved.get(product_id, 0) for product_id in product_ids}
+            excluded = set(reservation_ids) | {rid for _, rid in self._consumed}
+            for reservation_id in excluded:
+                reservation = self._reservations.get(reservation_id)
+                if reservation is not None and reservation[0] in held:
+                    held[reservation[0]] -= reservation[1]
+        return held
+
+    def reserve(self, product_id, quantity, ttl=900.0):
+        # Returns a reservation id, or None if not enough is available
+        now = time.monotonic()
+        with self._lock:
+            self._expire_reservations(now)
+            reserved = self._reserved.get(product_id, 0)
+            if quantity <= 0 or self._on_hand.get(product_id, 0) - reserved < quantity:
+                return None
+            reservation_id = next(self._reservation_ids)
+            self._reservations[reservation_id] = (product_id, quantity, now + ttl)
+            heapq.heappush(self._expiries, (now + ttl, reservation_id))
+            self._reserved[product_id] = reserved + quantity
+            return reservation_id
+
+    def release(self, reservation_id):
+        with self._lock:
+            return self._drop_reservation(reservation_id)
+
+    def _drop_reservation(self, reservation_id):
+        reservation = self._reservations.pop(reservation_id, None)
+        if reservation is None:
+            return False
+        product_id, quantity, _ = reservation
+        remaining = self._reserved[product_id] - quantity
+        if remaining:
+            self._reserved[product_id] = remaining
+        else:
+            del self._reserved[product_id]
+        return True
+
+    def _drop_consumed(self):
+        # Called with the lock held, after _done_seq moved
+        consumed = []
+        for seq, reservation_id in self._consumed:
+            if seq <= self._done_seq:
+                self._drop_reservation(reservation_id)
+            else:
+                consumed.append((seq, reservation_id))
+        self._consumed = consumed
+
+    def _expire_reservations(self, now):
+        # Called with the lock held. Released reservations are still in the
+        # heap, dropping them again is a no-op.
+        while self._expiries and self._expiries[0][0] <= now:
+            self._drop_reservation(heapq.heappop(self._expiries)[1])
+
+    # ---------------------------- updates --------------------------------
+
+    def touch(self, product_ids, consumed=()):
+        # Called by the write paths after they commit. consumed: ids of the
+        # reservations a sale used up
+        with self._changed:
+            self._seq += 1
+            for product_id in product_ids:
+                self._touched[product_id] = self._seq
+                self._pending.add(product_id)
+            self._consumed.extend((self._seq, reservation_id) for reservation_id in consumed)
+            self._changed.notify_all()
+
+    def flush(self, timeout=None):
+        # Waits until every touch made so far is reflected in the index
+        with self._changed:
+            target = self._seq
+            return self._changed.wait_for(
+                lambda: self._done_seq >= target or self._stopping, timeout)
+
+    def _load(self, product_ids=None):
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                sql = 'SELECT product_id, warehouse_id, SUM(quantity) FROM Inventory'
+                params = ()
+                if product_ids is not None:
+                    sql += f" WHERE product_id IN ({', '.join(['%s'] * len(product_ids))})"
+                    params = tuple(product_ids)
+                cursor.execute(sql + ' GROUP BY product_id, warehouse_id;', params)
+                rows = cursor.fetchall()
+                conn.commit()
+            finally:
+                cursor.close()
+        stock = {product_id: {} for product_id in product_ids or ()}
+        for product_id, warehouse_id, quantity in rows:
+            stock.setdefault(product_id, {})[warehouse_id] = int(quantity or 0)
+        return stock
+
+    def _apply(self, stock, start_seq, full):
+        # Called with the lock held. Returns how many products changed.
+        changed = 0
+        products = set(stock)
+        if full:
+            products |= set(self._stock)
+        for product_id in products:
+            if self._touched.get(product_id, 0) > start_seq:
+                continue  # touched while loading, a later refresh has it
+            warehouses = stock.get(product_id, {})
+            on_hand = sum(warehouses.values())
+            if self._stock.get(product_id, {}) != warehouses:
+                changed += 1
+            if warehouses:
+                self._stock[product_id] = warehouses
+                self._on_hand[product_id] = on_hand
+            else:
+                self._stock.pop(product_id, None)
+                self._on_hand.pop(product_id, None)
+        return changed
+
+    def _refresh(self, product_ids, start_seq):
+        # start_seq: the seq when product_ids were taken from _pending
+        stock = self._load(sorted(product_ids))
+        with self._changed:
+            self._apply(stock, start_seq, full=False)
+            self.stats['refreshes'] += 1
+            self._done_seq = max(self._done_seq, start_seq)
+            self._drop_consumed()
+            self._changed.notify_all()
+
+    def reconcile(self):
+        with self._lock:
+            start_seq = self._seq
+            pending = set(self._pending)
+        stock = self._load()
+        with self._changed:
+            drifted = self._apply(stock, start_seq, full=True)
+            # Products touched before the reload started are now current
+            self._pending -= {pid for pid in pending if self._touched[pid] <= start_seq}
+            if not self._pending:
+                self._done_seq = max(self._done_seq, start_seq)
+                self._drop_consumed()
+            if self._last_reconcile:
+                self.stats['drifted_products'] += drifted
+            self.stats['reconciliations'] += 1
+            self._last_reconcile = time.monotonic()
+            self._changed.notify_all()
+        return drifted
+
+    def _run(self):
+        while True:
+            with self._changed:
+                self._changed.wait_for(
+                    lambda: self._pending or self._stopping,
+                    max(self._last_reconcile + self.reconcile_interval - time.monotonic(), 0))
+                if self._stopping:
+                    return
+                reconcile_due = time.monotonic() >= self._last_reconcile + self.reconcile_interval
+            try:
+                if reconcile_due:
+                    self.reconcile()
+                    continue
+                # Let a burst of writes collect into one query
+                time.sleep(self.refresh_delay)
+                with self._lock:
+                    product_ids, self._pending = self._pending, set()
+                    start_seq = self._seq
+                if product_ids:
+                    try:
+                        self._refresh(product_ids, start_seq)
+                    except BaseException:
+                        with self._lock:
+                            self._pending |= product_ids
+                        raise
+            except mysql.connector.Error as err:
+                print(f"Error: availability refresh failed: {err}")
+                time.sleep(1.0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Stock availability from the in-memory index')
+    add_db_arguments(parser)
+    parser.add_argument('product_ids', nargs='+', type=int)
+    parser.add_argument('--repeat', type=int, default=1, help='time this many lookups')
+    args = parser.parse_args(argv)
+
+    db_config = db_config_from_args(args)
+
+    @contextmanager
+    def connection():
+        conn = mysql.connector.connect(**db_config)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    start = time.perf_counter()
+    index = AvailabilityIndex(connection).start()
+    print(f'Index loaded in {(time.perf_counter() - start) * 1000:.1f} ms')
+    try:
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            result = index.availability(args.product_ids, warehouses=True)
+        elapsed = time.perf_counter() - start
+    finally:
+        index.stop()
+    for product_id, entry in result.items():
+        print(f"{product_id}\ton hand {entry['on_hand']}\treserved {entry['reserved']}\t"
+              f"available {entry['available']}\t{entry['warehouses']}")
+    print(f'Lookup of {len(args.product_ids)} products: '
+          f'{elapsed / args.repeat * 1e6:.1f} us on average over {args.repeat} runs')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,107 @@
+# Async vs threaded order intake benchmark
+#
+#   python bench_async_db.py --submissions 5000 --connections 32
+#   python bench_async_db.py --operation sale --product-id 8 --database inventory_bench
+#
+# The same number of submissions is pushed through
+#   async:    one asyncio task per submission on an aiomysql pool
+#   threaded: a ThreadPoolExecutor with one thread per pooled
+#             mysql.connector connection (InventoryService)
+# and throughput and latency are compared. --operation sale really sells one
+# unit per submission, so use a scratch copy of the database for it; the
+# default operation is the read-only dashboard summary.
+
+import argparse
+import asyncio
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from db_settings import add_db_arguments, db_config_from_args
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(int(fraction * len(sorted_values)), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def report(name, elapsed, latencies, errors):
+    latencies.sort()
+    print(f'{name:>9}: {len(latencies) / elapsed:8,.0f} ops/s   '
+          'p50 {:.1f} ms  p95 {:.1f} ms  p99 {:.1f} ms   errors {}'.format(
+              *(percentile(latencies, f) * 1000 for f in (0.5, 0.95, 0.99)), errors))
+
+
+async def run_async(args, db_config):
+    from async_db import AsyncInventoryDB
+
+    latencies = []
+    errors = 0
+
+    async with AsyncInventoryDB(db_config, maxsize=args.connections) as db:
+        async def submit(i):
+            nonlocal errors
+            start = time.perf_counter()
+            try:
+                if args.operation == 'sale':
+                    await db.fulfil_sale(args.order_id, args.product_id, 1)
+                else:
+                    await db.inventory_summary()
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[submit(i) for i in range(args.submissions)])
+        elapsed = time.perf_counter() - start
+    return elapsed, latencies, errors
+
+
+def run_threaded(args, db_config):
+    from inventory_service import InventoryService
+
+    service = InventoryService(db_config, pool_size=min(args.connections, 32),
+                               pool_name='bench_threaded')
+    latencies = []
+    errors = 0
+
+    def submit(i):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            if args.operation == 'sale':
+                service.sell(args.order_id, args.product_id, 1)
+            else:
+                service.inventory_summary()
+        except Exception:
+            errors += 1
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=min(args.connections, 32)) as executor:
+        list(executor.map(submit, range(args.submissions)))
+    elapsed = time.perf_counter() - start
+    return elapsed, latencies, errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Async vs threaded order intake benchmark')
+    add_db_arguments(parser)
+    parser.add_argument('--operation', choices=['summary', 'sale'], default='summary')
+    parser.add_argument('--submissions', type=int, default=2000)
+    parser.add_argument('--connections', type=int, default=32)
+    parser.add_argument('--order-id', type=int, default=1)
+    parser.add_argument('--product-id', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    db_config = db_config_from_args(args)
+    print(f'{args.submissions} x {args.operation}, {args.connections} connections')
+    report('async', *asyncio.run(run_async(args, db_config)))
+    report('threaded', *run_threaded(args, db_config))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
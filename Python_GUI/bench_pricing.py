@@ -0,0 +1,90 @@
+# Pricing throughput benchmark for large baskets
+#
+# Prices synthetic orders against synthetic rule tables, no database needed:
+#   python bench_pricing.py --lines 10000 --orders 20 --products 5000
+#
+# With --mysql the rules are read from the database instead (one load, then
+# served from the engine's cache like in InventoryService):
+#   python bench_pricing.py --mysql --lines 2000
+
+import argparse
+import random
+import sys
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from db_settings import add_db_arguments, db_config_from_args
+from pricing import PriceRules, PricingEngine, price_lines
+
+ORDER_DATE = date(2024, 8, 20)
+
+
+def synthetic_rules(products, rng):
+    selling_prices = {pid: Decimal(rng.randint(500, 200000)) / 100
+                      for pid in range(1, products + 1)}
+    breaks = []
+    for pid in rng.sample(range(1, products + 1), products // 3):
+        price = selling_prices[pid]
+        for min_quantity, factor in ((10, Decimal('0.95')), (50, Decimal('0.90')),
+                                     (200, Decimal('0.85'))):
+            breaks.append((pid, min_quantity, (price * factor).quantize(Decimal('0.01'))))
+    promotions = []
+    for promotion_id in range(1, products // 20 + 2):
+        starts_on = ORDER_DATE + timedelta(days=rng.randint(-60, 30))
+        product_id = None if promotion_id == 1 else rng.randint(1, products)
+        promotions.append((promotion_id, product_id, Decimal(rng.choice((5, 10, 15, 20))),
+                           starts_on, starts_on + timedelta(days=rng.randint(1, 60))))
+    return PriceRules(selling_prices, breaks, promotions)
+
+
+def random_basket(lines, product_ids, rng):
+    return [(rng.choice(product_ids), rng.randint(1, 60)) for _ in range(lines)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Pricing engine throughput benchmark')
+    add_db_arguments(parser)
+    parser.add_argument('--mysql', action='store_true', help='read the rules from MySQL')
+    parser.add_argument('--lines', type=int, default=10000, help='lines per order')
+    parser.add_argument('--orders', type=int, default=20)
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=5200)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    if args.mysql:
+        import mysql.connector
+
+        conn = mysql.connector.connect(**db_config_from_args(args))
+        engine = PricingEngine()
+        try:
+            start = time.perf_counter()
+            rules = engine.rules(conn)
+            print(f'Rules loaded in {(time.perf_counter() - start) * 1000:.1f} ms')
+        finally:
+            conn.close()
+    else:
+        rules = synthetic_rules(args.products, rng)
+    product_ids = sorted(rules.selling_prices)
+
+    timings = []
+    total = Decimal(0)
+    for _ in range(args.orders):
+        basket = random_basket(args.lines, product_ids, rng)
+        start = time.perf_counter()
+        order = price_lines(rules, basket, ORDER_DATE)
+        timings.append(time.perf_counter() - start)
+        total += order.total
+
+    total_lines = args.lines * len(timings)
+    print(f'Rules: {len(product_ids)} products, {len(rules.promotions)} promotions')
+    print(f'Orders: {len(timings)} x {args.lines} lines, value {total:,.2f}')
+    print(f'Best order: {min(timings) * 1000:.2f} ms, worst: {max(timings) * 1000:.2f} ms')
+    print(f'Throughput: {total_lines / sum(timings):,.0f} lines/s, '
+          f'{len(timings) / sum(timings):,.1f} orders/s')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
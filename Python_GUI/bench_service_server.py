@@ -0,0 +1,91 @@
+# Throughput benchmark for service_server.py
+#
+# Start the server first, then:
+#   python bench_service_server.py --requests 20000 --concurrency 64
+#   python bench_service_server.py --method report --params '{"name": "low_stock"}'
+#
+# Each client keeps one HTTP connection open and sends its share of the
+# requests back to back.
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+
+async def client(host, port, payloads, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for payload in payloads:
+            request = (f'POST /rpc HTTP/1.1\r\nHost: {host}\r\n'
+                       f'Content-Type: application/json\r\n'
+                       f'Content-Length: {len(payload)}\r\n\r\n').encode('latin-1') + payload
+            start = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+
+            length = 0
+            status = await reader.readline()
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                if name.strip().lower() == 'content-length':
+                    length = int(value)
+            body = await reader.readexactly(length) if length else b''
+            latencies.append(time.perf_counter() - start)
+
+            if b' 200 ' not in status or b'"error"' in body:
+                errors.append(body[:200])
+    finally:
+        writer.close()
+
+
+async def run(args):
+    params = json.loads(args.params)
+    payloads = [json.dumps({'jsonrpc': '2.0', 'id': i, 'method': args.method,
+                            'params': params}).encode('utf-8')
+                for i in range(args.requests)]
+    shares = [payloads[i::args.concurrency] for i in range(args.concurrency)]
+    latencies = []
+    errors = []
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client(args.host, args.port, share, latencies, errors)
+                           for share in shares if share])
+    elapsed = time.perf_counter() - start
+    return elapsed, sorted(latencies), errors
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(int(fraction * len(sorted_values)), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Inventory service throughput benchmark')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--method', default='stock')
+    parser.add_argument('--params', default='{"product_id": 1}')
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    args = parser.parse_args(argv)
+
+    elapsed, latencies, errors = asyncio.run(run(args))
+    print(f'{args.method}: {len(latencies)} requests in {elapsed:.2f}s '
+          f'with {args.concurrency} clients')
+    print(f'Throughput: {len(latencies) / elapsed:,.0f} req/s')
+    print('Latency ms: p50 {:.2f}  p95 {:.2f}  p99 {:.2f}  max {:.2f}'.format(
+        *(percentile(latencies, f) * 1000 for f in (0.5, 0.95, 0.99, 1.0))))
+    if errors:
+        print(f'{len(errors)} errors, first: {errors[0]!r}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
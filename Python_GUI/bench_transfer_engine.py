@@ -0,0 +1,120 @@
+# Throughput benchmark for the warehouse transfer engine
+#
+# By default the planning step (validation against one snapshot) is timed on
+# synthetic data, no database server needed:
+#   python bench_transfer_engine.py --moves 5000 --warehouses 50 --products 2000
+#
+# With --mysql the full engine runs against a database. The moves are real,
+# so point it at a scratch copy of inventory_mgmt:
+#   python bench_transfer_engine.py --mysql --moves 2000 --database inventory_bench
+
+import argparse
+import random
+import sys
+import time
+
+from db_settings import add_db_arguments, db_config_from_args
+from transfer_engine import STATUS_COMPLETED, TransferEngine, plan_transfers
+
+
+def synthetic_snapshot(warehouses, products, rng):
+    capacity = {wh: rng.randint(50000, 100000) for wh in range(1, warehouses + 1)}
+    shelf_space = {pid: rng.randint(1, 12) for pid in range(1, products + 1)}
+    stock_rows = {}
+    used_space = {wh: 0 for wh in capacity}
+    inventory_id = 1
+    for wh in capacity:
+        for pid in rng.sample(range(1, products + 1), min(products, 200)):
+            quantity = rng.randint(0, 40)
+            stock_rows[(wh, pid)] = [[inventory_id, quantity, pid]]
+            used_space[wh] += quantity * shelf_space[pid]
+            inventory_id += 1
+    return capacity, used_space, shelf_space, stock_rows
+
+
+def random_moves(count, warehouse_ids, product_ids, rng):
+    moves = []
+    for _ in range(count):
+        from_wh, to_wh = rng.sample(warehouse_ids, 2)
+        moves.append((from_wh, to_wh, rng.choice(product_ids), rng.randint(1, 5)))
+    return moves
+
+
+def bench_plan(args, rng):
+    timings = []
+    completed = 0
+    for _ in range(args.batches):
+        capacity, used_space, shelf_space, stock_rows = synthetic_snapshot(
+            args.warehouses, args.products, rng)
+        pairs = list(stock_rows.keys())
+        moves = []
+        for i in range(args.moves):
+            from_wh, pid = rng.choice(pairs)
+            to_wh = rng.choice([wh for wh in (from_wh - 1, from_wh + 1) if wh in capacity])
+            moves.append((i + 1, from_wh, to_wh, pid, rng.randint(1, 5)))
+        start = time.perf_counter()
+        _, results = plan_transfers(moves, capacity, used_space, shelf_space, stock_rows)
+        timings.append(time.perf_counter() - start)
+        completed += sum(1 for r in results if r['status'] == STATUS_COMPLETED)
+    return timings, completed
+
+
+def bench_mysql(args, rng):
+    import mysql.connector
+
+    db_config = db_config_from_args(args)
+    conn = mysql.connector.connect(**db_config)
+    cursor = conn.cursor()
+    cursor.execute('SELECT warehouse_id FROM Warehouses')
+    warehouse_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute('SELECT DISTINCT product_id FROM Inventory WHERE quantity > 0')
+    product_ids = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    conn.commit()
+
+    engine = TransferEngine(conn, db_config)
+    timings = []
+    completed = 0
+    try:
+        for _ in range(args.batches):
+            moves = random_moves(args.moves, warehouse_ids, product_ids, rng)
+            start = time.perf_counter()
+            results = engine.execute_batch(moves)
+            timings.append(time.perf_counter() - start)
+            completed += sum(1 for r in results if r['status'] == STATUS_COMPLETED)
+    finally:
+        conn.close()
+    return timings, completed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Transfer engine throughput benchmark')
+    add_db_arguments(parser)
+    parser.add_argument('--mysql', action='store_true',
+                        help='run the full engine against MySQL')
+    parser.add_argument('--moves', type=int, default=5000, help='moves per batch')
+    parser.add_argument('--batches', type=int, default=5)
+    parser.add_argument('--warehouses', type=int, default=50)
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=5200)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    if args.mysql:
+        timings, completed = bench_mysql(args, rng)
+        mode = 'mysql'
+    else:
+        timings, completed = bench_plan(args, rng)
+        mode = 'plan only'
+
+    total_moves = args.moves * len(timings)
+    total_time = sum(timings)
+    print(f'Mode: {mode}')
+    print(f'Batches: {len(timings)} x {args.moves} moves, completed: {completed}')
+    print(f'Best batch: {min(timings) * 1000:.1f} ms, worst: {max(timings) * 1000:.1f} ms')
+    print(f'Throughput: {total_moves / total_time:,.0f} moves/s')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
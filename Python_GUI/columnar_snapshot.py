@@ -0,0 +1,419 @@
+# Columnar snapshots of inventory history for offline analysis
+# pip install numpy mysql-connector-python
+#
+# export() copies tables into a snapshot directory as typed NumPy columns,
+# one .npy file per column and segment, listed in manifest.json:
+#   history tables      WarehouseTransfers, SalesOrderDetails (with the order
+#                       date and customer), PurchaseOrderDetails (with the
+#                       product, order dates and PO status), InventoryMovements
+#                       are exported incrementally: each run appends one or
+#                       more segments with the rows above the primary-key
+#                       watermark of the previous run.
+#   current state       Inventory and the small dimension tables Products,
+#                       Warehouses and Catalog are rewritten in full, since
+#                       their rows change in place. Their history is
+#                       InventoryMovements.
+# Columns are stored in the narrowest type that fits: int32 ids and
+# quantities, money as int64 cents, dates as datetime64, and repeated
+# strings (statuses, movement types) as uint8 codes into a category list
+# kept in the manifest. NULL numbers are stored as 0, NULL dates as NaT.
+# The files are not compressed so that SnapshotReader can memory-map them;
+# compact() merges the segments of a table into one.
+#
+# Rows that take an AUTO_INCREMENT id but commit after a later id was
+# exported are missed by the watermark. InventoryMovements rows are only
+# exported once they are older than a grace period, for the other history
+# tables run the export when no orders are being written.
+#
+#   python columnar_snapshot.py export snapshots/inventory
+#   python columnar_snapshot.py info snapshots/inventory
+#   python columnar_snapshot.py compact snapshots/inventory
+#   python analytics.py --snapshot snapshots/inventory
+
+import argparse
+import json
+import os
+import shutil
+import sys
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+
+from db_settings import add_db_arguments, db_config_from_args
+
+
+FORMAT_VERSION = 1
+MANIFEST = 'manifest.json'
+MOVEMENT_GRACE_SECONDS = 60
+
+# mode is 'full' or 'incremental'. Incremental queries take the watermark as
+# their only parameter and return rows in key order.
+Table = namedtuple('Table', 'name mode key sql columns')
+
+TABLES = [
+    Table('Products', 'full', 'product_id', '''
+        SELECT product_id, name, selling_price, safe_stock_level, healthy_stock_level, shelf_space
+        FROM Products
+        ORDER BY product_id;
+    ''', [('product_id', 'int32'), ('name', 'text'), ('selling_price', 'cents'),
+          ('safe_stock_level', 'int32'), ('healthy_stock_level', 'int32'),
+          ('shelf_space', 'int32')]),
+    Table('Warehouses', 'full', 'warehouse_id', '''
+        SELECT warehouse_id, capacity FROM Warehouses ORDER BY warehouse_id;
+    ''', [('warehouse_id', 'int32'), ('capacity', 'int64')]),
+    Table('Catalog', 'full', 'catalog_id', '''
+        SELECT catalog_id, supplier_id, product_id, max_quantity, price
+        FROM Catalog
+        ORDER BY catalog_id;
+    ''', [('catalog_id', 'int32'), ('supplier_id', 'int32'), ('product_id', 'int32'),
+          ('max_quantity', 'int32'), ('price', 'cents')]),
+    Table('Inventory', 'full', 'inventory_id', '''
+        SELECT inventory_id, warehouse_id, product_id, quantity, shelf_space, catalog_id
+        FROM Inventory
+        ORDER BY inventory_id;
+    ''', [('inventory_id', 'int32'), ('warehouse_id', 'int32'), ('product_id', 'int32'),
+          ('quantity', 'int32'), ('shelf_space', 'int32'), ('catalog_id', 'int32')]),
+    Table('WarehouseTransfers', 'incremental', 'transfer_id', '''
+        SELECT transfer_id, from_warehouse_id, to_warehouse_id, product_id, quantity,
+               transfer_date, status
+        FROM WarehouseTransfers
+        WHERE transfer_id > %s
+        ORDER BY transfer_id;
+    ''', [('transfer_id', 'int32'), ('from_warehouse_id', 'int32'),
+          ('to_warehouse_id', 'int32'), ('product_id', 'int32'), ('quantity', 'int32'),
+          ('transfer_date', 'date'), ('status', 'category')]),
+    Table('SalesOrderDetails', 'incremental', 'order_detail_id', '''
+        SELECT d.order_detail_id, d.order_id, d.product_id, d.quantity, d.price_for_product,
+               o.customer_id, o.order_date
+        FROM SalesOrderDetails d
+        LEFT JOIN SalesOrders o ON d.order_id = o.order_id
+        WHERE d.order_detail_id > %s
+        ORDER BY d.order_detail_id;
+    ''', [('order_detail_id', 'int32'), ('order_id', 'int32'), ('product_id', 'int32'),
+          ('quantity', 'int32'), ('price_for_product', 'cents'), ('customer_id', 'int32'),
+          ('order_date', 'date')]),
+    Table('PurchaseOrderDetails', 'incremental', 'pod_id', '''
+        SELECT d.pod_id, d.po_id, d.catalog_id, c.product_id, d.quantity, d.cost_for_product,
+               po.order_date, po.expected_delivery_date, po.status
+        FROM PurchaseOrderDetails d
+        LEFT JOIN PurchaseOrders po ON d.po_id = po.po_id
+        LEFT JOIN Catalog c ON d.catalog_id = c.catalog_id
+        WHERE d.pod_id > %s
+        ORDER BY d.pod_id;
+    ''', [('pod_id', 'int32'), ('po_id', 'int32'), ('catalog_id', 'int32'),
+          ('product_id', 'int32'), ('quantity', 'int32'), ('cost_for_product', 'cents'),
+          ('order_date', 'date'), ('expected_delivery_date', 'date'),
+          ('status', 'category')]),
+    Table('InventoryMovements', 'incremental', 'movement_id', f'''
+        SELECT movement_id, movement_time, movement_type, warehouse_id, product_id,
+               quantity_change, source_type, source_id
+        FROM InventoryMovements
+        WHERE movement_id > %s
+          AND movement_time <= NOW() - INTERVAL {MOVEMENT_GRACE_SECONDS} SECOND
+        ORDER BY movement_id;
+    ''', [('movement_id', 'int64'), ('movement_time', 'datetime'),
+          ('movement_type', 'category'), ('warehouse_id', 'int32'), ('product_id', 'int32'),
+          ('quantity_change', 'int32'), ('source_type', 'category'), ('source_id', 'int32')]),
+]
+
+TABLES_BY_NAME = {table.name: table for table in TABLES}
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _convert(values, kind, categories):
+    # values: one column of a fetched batch
+    if kind in ('int32', 'int64'):
+        return np.array([0 if v is None else v for v in values], dtype=kind)
+    if kind == 'cents':
+        return np.array([0 if v is None else round(v * 100) for v in values], dtype=np.int64)
+    if kind == 'date':
+        return np.array(['NaT' if v is None else str(v) for v in values], dtype='datetime64[D]')
+    if kind == 'datetime':
+        return np.array(['NaT' if v is None else v.isoformat() for v in values],
+                        dtype='datetime64[s]')
+    if kind == 'text':
+        return np.array(['' if v is None else str(v) for v in values], dtype=str)
+    if kind == 'category':
+        # Codes into the table's category list, which only ever grows, so
+        # codes of older segments stay valid. Code 0 is NULL.
+        index = {value: code for code, value in enumerate(categories, 1)}
+        codes = []
+        for v in values:
+            if v is None:
+                codes.append(0)
+                continue
+            if v not in index:
+                if len(categories) >= 255:
+                    raise SnapshotError(f'More than 255 distinct values in a category column: {v}')
+                categories.append(v)
+                index[v] = len(categories)
+            codes.append(index[v])
+        return np.array(codes, dtype=np.uint8)
+    raise SnapshotError(f'Unknown column type {kind}')
+
+
+def _empty(kind):
+    return _convert([], kind, [])
+
+
+def _load_manifest(path):
+    manifest_path = os.path.join(path, MANIFEST)
+    if not os.path.exists(manifest_path):
+        return {'format': FORMAT_VERSION, 'tables': {}}
+    with open(manifest_path, encoding='utf-8') as file:
+        manifest = json.load(file)
+    if manifest.get('format') != FORMAT_VERSION:
+        raise SnapshotError(f'Unsupported snapshot format {manifest.get("format")} in {path}')
+    return manifest
+
+
+def _save_manifest(path, manifest):
+    # Readers only ever see a complete manifest
+    temp_path = os.path.join(path, MANIFEST + '.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=1)
+    os.replace(temp_path, os.path.join(path, MANIFEST))
+
+
+def _write_segment(path, table, name, chunks):
+    segment_dir = os.path.join(path, table.name, name)
+    temp_dir = segment_dir + '.tmp'
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    os.makedirs(temp_dir)
+    rows = 0
+    for i, (column, kind) in enumerate(table.columns):
+        array = (np.concatenate([chunk[i] for chunk in chunks]) if chunks else _empty(kind))
+        rows = len(array)
+        np.save(os.path.join(temp_dir, column + '.npy'), array, allow_pickle=False)
+    os.replace(temp_dir, segment_dir)
+    return rows
+
+
+def _remove_unlisted_segments(path, table_name, entry):
+    # An interrupted export or compact leaves segments the manifest does not
+    # list. They would take the names the next run picks, so they go first.
+    table_dir = os.path.join(path, table_name)
+    if not os.path.isdir(table_dir):
+        return
+    listed = {segment['name'] for segment in entry['segments']}
+    for name in os.listdir(table_dir):
+        if name not in listed:
+            shutil.rmtree(os.path.join(table_dir, name), ignore_errors=True)
+
+
+def _next_segment_name(entry):
+    number = max((int(s['name'][1:]) for s in entry['segments']), default=0) + 1
+    return f's{number:06d}'
+
+
+def export_table(conn, path, table, manifest, batch_size=10000, segment_rows=1000000):
+    # Returns (rows written, segments the manifest no longer lists). Those
+    # are deleted by the caller once the manifest is saved.
+    entry = manifest['tables'].setdefault(table.name, {
+        'mode': table.mode, 'key': table.key, 'watermark': 0,
+        'columns': dict(table.columns), 'categories': {}, 'segments': []})
+    if entry['columns'] != dict(table.columns):
+        raise SnapshotError(f'Columns of {table.name} changed, export into a new snapshot directory')
+    _remove_unlisted_segments(path, table.name, entry)
+    categories = {column: entry['categories'].setdefault(column, [])
+                  for column, kind in table.columns if kind == 'category'}
+    key_index = [column for column, _ in table.columns].index(table.key)
+    exported_at = datetime.now().isoformat(timespec='seconds')
+
+    old_segments = entry['segments'] if table.mode == 'full' else []
+    new_segments = []
+    watermark = entry['watermark'] if table.mode == 'incremental' else 0
+    added = 0
+
+    def flush(chunks, rows):
+        name = _next_segment_name({'segments': entry['segments'] + new_segments})
+        _write_segment(path, table, name, chunks)
+        new_segments.append({'name': name, 'rows': rows, 'exported_at': exported_at})
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(table.sql, (watermark,) if table.mode == 'incremental' else ())
+        chunks, chunk_rows = [], 0
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            columns = list(zip(*batch))
+            chunks.append([_convert(columns[i], kind, categories.get(column))
+                           for i, (column, kind) in enumerate(table.columns)])
+            chunk_rows += len(batch)
+            watermark = max(watermark, batch[-1][key_index])
+            if chunk_rows >= segment_rows:
+                flush(chunks, chunk_rows)
+                added += chunk_rows
+                chunks, chunk_rows = [], 0
+        if chunk_rows or (table.mode == 'full' and not new_segments):
+            flush(chunks, chunk_rows)
+            added += chunk_rows
+        conn.commit()
+    finally:
+        cursor.close()
+
+    if table.mode == 'full':
+        entry['segments'] = new_segments
+    else:
+        entry['segments'].extend(new_segments)
+        entry['watermark'] = watermark
+    entry['exported_at'] = exported_at
+    return added, old_segments
+
+
+def _remove_segments(path, table_name, segments):
+    for segment in segments:
+        shutil.rmtree(os.path.join(path, table_name, segment['name']), ignore_errors=True)
+
+
+def export(conn, path, table_names=None, batch_size=10000, segment_rows=1000000):
+    # Returns {table name: rows written}. The manifest is saved after each
+    # table, so an interrupted export resumes from the last finished one.
+    os.makedirs(path, exist_ok=True)
+    manifest = _load_manifest(path)
+    written = {}
+    for name in table_names or [table.name for table in TABLES]:
+        if name not in TABLES_BY_NAME:
+            raise SnapshotError(f'Unknown table {name}')
+        written[name], replaced = export_table(conn, path, TABLES_BY_NAME[name], manifest,
+                                               batch_size, segment_rows)
+        _save_manifest(path, manifest)
+        _remove_segments(path, name, replaced)
+    return written
+
+
+def compact(path, table_names=None):
+    # Merges the segments of each table into one, so reads of it are a
+    # single memory map per column.
+    manifest = _load_manifest(path)
+    reader = SnapshotReader(path, manifest)
+    merged = []
+    for name in table_names or list(manifest['tables']):
+        entry = manifest['tables'][name]
+        if len(entry['segments']) <= 1:
+            continue
+        table = TABLES_BY_NAME[name]
+        _remove_unlisted_segments(path, name, entry)
+        columns = reader.columns(name)
+        chunk = [np.asarray(columns[column]) for column, _ in table.columns]
+        old_segments = entry['segments']
+        segment_name = _next_segment_name(entry)
+        rows = _write_segment(path, table, segment_name, [chunk])
+        entry['segments'] = [{'name': segment_name, 'rows': rows,
+                              'exported_at': old_segments[-1]['exported_at']}]
+        _save_manifest(path, manifest)
+        _remove_segments(path, name, old_segments)
+        merged.append(name)
+    return merged
+
+
+class SnapshotReader:
+    # Read-only access to a snapshot directory. Columns are memory-mapped,
+    # tables with several segments are concatenated on read.
+
+    def __init__(self, path, manifest=None):
+        if not os.path.exists(os.path.join(path, MANIFEST)):
+            raise SnapshotError(f'No snapshot in {path}')
+        self.path = path
+        self.manifest = manifest or _load_manifest(path)
+
+    def table_names(self):
+        return sorted(self.manifest['tables'])
+
+    def _entry(self, table):
+        try:
+            return self.manifest['tables'][table]
+        except KeyError:
+            raise SnapshotError(f'Table {table} is not in the snapshot') from None
+
+    def rows(self, table):
+        return sum(segment['rows'] for segment in self._entry(table)['segments'])
+
+    def watermark(self, table):
+        return self._entry(table)['watermark']
+
+    def segments(self, table, names=None):
+        # Yields {column: memory-mapped array} per segment
+        entry = self._entry(table)
+        names = names or list(entry['columns'])
+        for segment in entry['segments']:
+            segment_dir = os.path.join(self.path, table, segment['name'])
+            yield {name: np.load(os.path.join(segment_dir, name + '.npy'), mmap_mode='r')
+                   for name in names}
+
+    def columns(self, table, names=None):
+        entry = self._entry(table)
+        names = names or list(entry['columns'])
+        segments = list(self.segments(table, names))
+        if len(segments) == 1:
+            return segments[0]
+        if not segments:
+            return {name: _empty(entry['columns'][name]) for name in names}
+        return {name: np.concatenate([segment[name] for segment in segments]) for name in names}
+
+    def categories(self, table, column):
+        # Value of each code; code 0 (NULL) maps to None
+        return [None] + self._entry(table)['categories'].get(column, [])
+
+    def category_code(self, table, column, value):
+        # Code of a value, -1 if it never occurs (so comparisons match nothing)
+        try:
+            return self.categories(table, column).index(value)
+        except ValueError:
+            return -1
+
+    def decode(self, table, column, codes):
+        return np.array(self.categories(table, column), dtype=object)[codes]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Columnar snapshots of inventory history')
+    add_db_arguments(parser)
+    commands = parser.add_subparsers(dest='command', required=True)
+    export_parser = commands.add_parser('export', help='export new rows into a snapshot')
+    export_parser.add_argument('path')
+    export_parser.add_argument('--tables', nargs='+', choices=sorted(TABLES_BY_NAME))
+    export_parser.add_argument('--batch-size', type=int, default=10000)
+    export_parser.add_argument('--segment-rows', type=int, default=1000000)
+    info_parser = commands.add_parser('info', help='tables, rows and watermarks of a snapshot')
+    info_parser.add_argument('path')
+    compact_parser = commands.add_parser('compact', help='merge the segments of each table')
+    compact_parser.add_argument('path')
+    compact_parser.add_argument('--tables', nargs='+', choices=sorted(TABLES_BY_NAME))
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'export':
+            import mysql.connector
+
+            conn = mysql.connector.connect(**db_config_from_args(args))
+            try:
+                written = export(conn, args.path, args.tables, args.batch_size, args.segment_rows)
+            finally:
+                conn.close()
+            for name, rows in written.items():
+                print(f'{name}: {rows} rows')
+        elif args.command == 'info':
+            reader = SnapshotReader(args.path)
+            for name in reader.table_names():
+                entry = reader.manifest['tables'][name]
+                print(f"{name:<22} {entry['mode']:<12} rows {reader.rows(name):>10}   "
+                      f"segments {len(entry['segments']):>4}   watermark {entry['watermark']}   "
+                      f"exported {entry.get('exported_at')}")
+        else:
+            merged = compact(args.path, args.tables)
+            print(f'Compacted: {", ".join(merged) or "nothing to merge"}')
+    except SnapshotError as err:
+        print(f'Error: {err}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,51 @@
+# Shared database settings for the GUI and the command line tools
+# pip install mysql-connector-python
+
+
+DEFAULT_DB_CONFIG = {
+    'host': 'localhost',
+    'user': 'root',
+    # Password needs to entered to connect to the server.
+    'password': '',
+    'database': 'inventory_mgmt'
+}
+
+# How the GUI submits sales and purchase orders:
+#   'pool'  - InventoryService on a mysql.connector pool
+#   'async' - async_db.SyncInventoryDB on an aiomysql pool (pip install aiomysql)
+ORDER_BACKEND = 'pool'
+
+# Read-only reports and the dashboard go to this replica when it is set and
+# no more than REPLICA_MAX_LAG_SECONDS behind (see read_routing.py), e.g.
+# {'host': '127.0.0.1', 'port': 3307, 'user': 'root', 'password': '', 'database': 'inventory_mgmt'}
+REPLICA_DB_CONFIG = None
+REPLICA_MAX_LAG_SECONDS = 5
+
+# When set, the GUI logs every sale, purchase, transfer and report open to
+# this file for workload_replay.py (see workload_capture.py), e.g.
+# 'workload.jsonl.gz'
+WORKLOAD_CAPTURE_PATH = None
+
+
+def get_db_config():
+    return dict(DEFAULT_DB_CONFIG)
+
+
+def get_replica_config():
+    return dict(REPLICA_DB_CONFIG) if REPLICA_DB_CONFIG else None
+
+
+def add_db_arguments(parser):
+    parser.add_argument('--host', default=DEFAULT_DB_CONFIG['host'])
+    parser.add_argument('--user', default=DEFAULT_DB_CONFIG['user'])
+    parser.add_argument('--password', default=DEFAULT_DB_CONFIG['password'])
+    parser.add_argument('--database', default=DEFAULT_DB_CONFIG['database'])
+
+
+def db_config_from_args(args):
+    return {
+        'host': args.host,
+        'user': args.user,
+        'password': args.password,
+        'database': args.database
+    }
@@ -0,0 +1,214 @@
+# Demand forecasting and safety stock recalculation from sales history
+# pip install numpy mysql-connector-python
+#
+# Sales history (SalesOrderDetails joined to SalesOrders) is read once, in
+# chunks, into a products x days demand matrix. Rolling window mean and
+# standard deviation of daily demand are computed for every product at once
+# from cumulative sums, and the levels in Products are recalculated as
+#
+#   safe_stock_level    = z * sigma_daily * sqrt(lead time)
+#   healthy_stock_level = safe_stock_level + mean_daily * (lead time + review period)
+#
+# where z comes from the target service level, mean_daily is the latest
+# window, sigma_daily is the average over all windows and the lead time is
+# the average PurchaseOrders delivery time. Products without sales in the
+# history keep their current levels.
+
+import argparse
+import math
+import sys
+from statistics import NormalDist
+
+import numpy as np
+
+from db_settings import add_db_arguments, db_config_from_args
+
+
+DEFAULT_LEAD_TIME_DAYS = 10
+
+
+class DemandHistory:
+    def __init__(self, product_ids, start, days):
+        self.product_ids = np.asarray(product_ids, dtype=np.int64)
+        self.start = np.datetime64(start, 'D')
+        self.days = days
+        self.demand = np.zeros((self.product_ids.size, days), dtype=np.float64)
+
+    def add(self, product_ids, dates, quantities):
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        if product_ids.size == 0:
+            return
+        rows = np.searchsorted(self.product_ids, product_ids)
+        rows = np.minimum(rows, self.product_ids.size - 1)
+        cols = (np.asarray(dates, dtype='datetime64[D]') - self.start).astype(np.int64)
+        valid = (self.product_ids[rows] == product_ids) & (cols >= 0) & (cols < self.days)
+        np.add.at(self.demand, (rows[valid], cols[valid]),
+                  np.asarray(quantities, dtype=np.float64)[valid])
+
+
+def rolling_mean_std(demand, window):
+    # Rolling mean and population std over the last `window` days, for every
+    # product and every window end. Returns two (products, days - window + 1)
+    # arrays.
+    window = min(window, demand.shape[1])
+    padded = np.zeros((demand.shape[0], demand.shape[1] + 1))
+    padded_sq = np.zeros_like(padded)
+    np.cumsum(demand, axis=1, out=padded[:, 1:])
+    np.cumsum(demand * demand, axis=1, out=padded_sq[:, 1:])
+    total = padded[:, window:] - padded[:, :-window]
+    total_sq = padded_sq[:, window:] - padded_sq[:, :-window]
+    mean = total / window
+    variance = np.maximum(total_sq / window - mean * mean, 0)
+    return mean, np.sqrt(variance)
+
+
+def read_history(conn, history_days, chunk_size=50000):
+    cursor = conn.cursor()
+    cursor.execute('SELECT product_id FROM Products ORDER BY product_id;')
+    product_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute('SELECT MAX(order_date) FROM SalesOrders;')
+    end = cursor.fetchone()[0]
+    if end is None:
+        cursor.close()
+        conn.commit()
+        return None
+
+    end = np.datetime64(str(end), 'D')
+    start = end - np.timedelta64(history_days - 1, 'D')
+    history = DemandHistory(product_ids, start, history_days)
+
+    # One pass over the history, streamed in chunks.
+    cursor.execute('''
+        SELECT d.product_id, o.order_date, d.quantity
+        FROM SalesOrderDetails d
+        JOIN SalesOrders o ON d.order_id = o.order_id
+        WHERE o.order_date BETWEEN %s AND %s;
+    ''', (str(start), str(end)))
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        product_col, date_col, quantity_col = zip(*rows)
+        history.add(product_col, [str(d) for d in date_col],
+                    [q or 0 for q in quantity_col])
+    cursor.close()
+    conn.commit()
+    return history
+
+
+def average_lead_time(conn):
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT AVG(DATEDIFF(expected_delivery_date, order_date))
+        FROM PurchaseOrders
+        WHERE expected_delivery_date IS NOT NULL AND order_date IS NOT NULL;
+    ''')
+    lead_time = cursor.fetchone()[0]
+    cursor.close()
+    conn.commit()
+    return float(lead_time) if lead_time else DEFAULT_LEAD_TIME_DAYS
+
+
+def compute_levels(history, lead_time, window=28, service_level=0.95, review_days=7):
+    # Returns (product_ids, demand_rate, demand_std, safe_levels, healthy_levels, has_demand)
+    mean, std = rolling_mean_std(history.demand, window)
+    # The rate follows the most recent window; variability is averaged over
+    # every window in the history so one quiet month does not zero it.
+    demand_rate = mean[:, -1]
+    demand_std = std.mean(axis=1)
+    z = NormalDist().inv_cdf(service_level)
+
+    safe = np.ceil(z * demand_std * math.sqrt(lead_time))
+    healthy = np.ceil(safe + demand_rate * (lead_time + review_days))
+    healthy = np.maximum(healthy, safe)
+    has_demand = history.demand.sum(axis=1) > 0
+    return (history.product_ids, demand_rate, demand_std,
+            safe.astype(np.int64), healthy.astype(np.int64), has_demand)
+
+
+def current_levels(conn):
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT product_id, name, safe_stock_level, healthy_stock_level
+        FROM Products;
+    ''')
+    levels = {row[0]: (row[1], row[2], row[3]) for row in cursor.fetchall()}
+    cursor.close()
+    conn.commit()
+    return levels
+
+
+def apply_levels(conn, updates, batch_size=1000):
+    # updates: list of (safe_stock_level, healthy_stock_level, product_id)
+    cursor = conn.cursor()
+    try:
+        for i in range(0, len(updates), batch_size):
+            cursor.executemany('''
+                UPDATE Products
+                SET safe_stock_level = %s, healthy_stock_level = %s
+                WHERE product_id = %s;
+            ''', updates[i:i + batch_size])
+            conn.commit()
+        cursor.execute('''
+            INSERT INTO Alerts (entity_type, entity_id, message, alert_date)
+            VALUES ('Product', NULL, %s, NOW());
+        ''', (f'Safety and healthy stock levels recalculated for {len(updates)} products.',))
+        conn.commit()
+    finally:
+        cursor.close()
+
+
+def main(argv=None):
+    import mysql.connector
+
+    parser = argparse.ArgumentParser(
+        description='Recalculate safe and healthy stock levels from sales history')
+    add_db_arguments(parser)
+    parser.add_argument('--history-days', type=int, default=180)
+    parser.add_argument('--window', type=int, default=28, help='rolling window in days')
+    parser.add_argument('--service-level', type=float, default=0.95)
+    parser.add_argument('--review-days', type=int, default=7)
+    parser.add_argument('--lead-time', type=float, default=None,
+                        help='days, defaults to the average purchase order lead time')
+    parser.add_argument('--apply', action='store_true', help='write the new levels to Products')
+    args = parser.parse_args(argv)
+
+    conn = mysql.connector.connect(**db_config_from_args(args))
+    try:
+        history = read_history(conn, args.history_days)
+        if history is None:
+            print('No sales history found.')
+            return 0
+        lead_time = args.lead_time or average_lead_time(conn)
+        product_ids, rate, std, safe, healthy, has_demand = compute_levels(
+            history, lead_time, args.window, args.service_level, args.review_days)
+        current = current_levels(conn)
+
+        updates = []
+        print(f'Lead time {lead_time:.1f} days, window {args.window} days, '
+              f'service level {args.service_level:.0%}')
+        print('{:>10}  {:<24} {:>10} {:>10} {:>12} {:>12}'.format(
+            'Product ID', 'Product Name', 'Demand/day', 'Std/day', 'Safe', 'Healthy'))
+        for i, product_id in enumerate(product_ids.tolist()):
+            if not has_demand[i] or product_id not in current:
+                continue
+            name, old_safe, old_healthy = current[product_id]
+            new_safe, new_healthy = int(safe[i]), int(healthy[i])
+            if (new_safe, new_healthy) == (old_safe, old_healthy):
+                continue
+            updates.append((new_safe, new_healthy, product_id))
+            print('{:>10}  {:<24.24} {:>10.2f} {:>10.2f} {:>12} {:>12}'.format(
+                product_id, name or '', rate[i], std[i],
+                f'{old_safe}->{new_safe}', f'{old_healthy}->{new_healthy}'))
+
+        print(f'{len(updates)} products with changed levels.')
+        if args.apply and updates:
+            apply_levels(conn, updates)
+            print('New levels written to Products.')
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,642 @@
+# Headless service layer: buy, sell, transfer, stock lookups and reports
+# pip install mysql-connector-python
+#
+# Everything here works without Qt. ProductApp, service_server.py and the
+# command line tools all go through InventoryService, which hands out
+# connections from one shared mysql.connector pool.
+
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+from mysql.connector import pooling
+
+from availability import AvailabilityIndex
+from movement_ledger import MOVEMENT_RECEIPT, clear_movement_source, set_movement_source
+from pricing import PricingEngine, PricingError
+from report_cache import (
+    PURCHASE_TABLES, SALE_TABLES, TRANSFER_TABLES, ReportCache, bump_tables)
+from transfer_engine import TransferEngine
+from workload_capture import (
+    OP_PLACE_SALES_ORDER, OP_PURCHASE, OP_REPORT, OP_SELL, OP_TRANSFER, captured)
+
+
+REPORTS = {
+    'products': '''
+        SELECT * FROM Products
+    ''',
+    'stock_list': '''
+        SELECT
+            Inventory.product_id,
+            Products.name AS product_name,
+            Inventory.warehouse_id,
+            Inventory.quantity,
+            Inventory.shelf_space,
+            Inventory.catalog_id,
+            Catalog.price
+        FROM Inventory
+        JOIN Catalog ON Inventory.catalog_id = Catalog.catalog_id
+        JOIN Products ON Inventory.product_id = Products.product_id
+        ORDER BY Inventory.product_id
+    ''',
+    'catalog': '''
+        SELECT
+            Catalog.catalog_id,
+            Products.name AS product_name,
+            Products.description,
+            Suppliers.name AS supplier_name,
+            Catalog.max_quantity,
+            Catalog.price
+        FROM Catalog
+        JOIN Products ON Catalog.product_id = Products.product_id
+        JOIN Suppliers ON Catalog.supplier_id = Suppliers.supplier_id
+        ORDER BY Catalog.catalog_id
+    ''',
+    'orders': '''
+        SELECT
+            SalesOrders.order_id,
+            Customers.name AS customer_name,
+            SalesOrders.order_date,
+            SalesOrders.total_price,
+            SalesOrders.delivery_date,
+            SalesOrders.status,
+            Products.name AS product_name,
+            SalesOrderDetails.quantity,
+            SalesOrderDetails.price_for_product
+        FROM SalesOrders
+        JOIN Customers ON SalesOrders.customer_id = Customers.customer_id
+        JOIN SalesOrderDetails ON SalesOrders.order_id = SalesOrderDetails.order_id
+        JOIN Products ON SalesOrderDetails.product_id = Products.product_id
+        ORDER BY SalesOrders.order_id
+    ''',
+    'most_transferred': '''
+        SELECT
+            t.warehouse_id,
+            t.product_id,
+            t.total_transferred,
+            p.name AS product_name
+        FROM (
+            SELECT
+                warehouse_id,
+                product_id,
+                SUM(total_transferred) AS total_transferred,
+                ROW_NUMBER() OVER (PARTITION BY warehouse_id ORDER BY SUM(total_transferred) DESC) AS row_order
+            FROM (
+                SELECT
+                    from_warehouse_id AS warehouse_id,
+                    product_id,
+                    SUM(quantity) AS total_transferred
+                FROM
+                    WarehouseTransfers
+                GROUP BY
+                    1,2
+
+                UNION ALL
+
+                SELECT
+                    to_warehouse_id AS warehouse_id,
+                    product_id,
+                    SUM(quantity) AS total_transferred
+                FROM
+                    WarehouseTransfers
+                GROUP BY
+                    1,2
+            ) AS transfers
+            GROUP BY
+                1,2
+        ) AS t
+        JOIN Products p ON t.product_id = p.product_id
+        WHERE row_order <= 5
+        ORDER BY t.warehouse_id, row_order;
+    ''',
+    'monthly_changes': '''
+        SELECT
+            i.warehouse_id,
+            i.product_id,
+            DATE_FORMAT(t.transfer_date, '%Y-%m') AS month_and_year,
+            COALESCE(SUM(CASE
+                WHEN t.from_warehouse_id = i.warehouse_id THEN -t.quantity
+                WHEN t.to_warehouse_id = i.warehouse_id THEN t.quantity
+                ELSE 0
+            END), 0) AS quantity_change,
+            p.name AS product_name
+        FROM
+            Inventory i
+        LEFT JOIN
+            WarehouseTransfers t ON i.product_id = t.product_id
+        JOIN Products p ON i.product_id = p.product_id
+        GROUP BY
+            i.warehouse_id, i.product_id, month_and_year
+        HAVING
+            quantity_change <> 0
+        ORDER BY
+            i.warehouse_id, i.product_id, month_and_year;
+    ''',
+    'monthly_movements': '''
+        SELECT
+            m.warehouse_id,
+            m.product_id,
+            DATE_FORMAT(m.movement_time, '%Y-%m') AS month_and_year,
+            SUM(m.quantity_change) AS quantity_change,
+            p.name AS product_name
+        FROM
+            InventoryMovements m
+        JOIN Products p ON m.product_id = p.product_id
+        GROUP BY
+            m.warehouse_id, m.product_id, month_and_year, p.name
+        HAVING
+            quantity_change <> 0
+        ORDER BY
+            m.warehouse_id, m.product_id, month_and_year;
+    ''',
+    'low_stock': '''
+        SELECT
+            P.product_id,
+            P.name AS product_name,
+            P.safe_stock_level,
+            SUM(I.quantity) AS current_stock,
+            (P.safe_stock_level - SUM(I.quantity)) AS restock_needed
+        FROM
+            Products P
+        LEFT JOIN
+            Inventory I ON P.product_id = I.product_id
+        GROUP BY
+            P.product_id, P.name, P.safe_stock_level
+        HAVING
+            current_stock < P.safe_stock_level;
+    ''',
+}
+
+
+def run_report(conn, name):
+    if name not in REPORTS:
+        raise ValueError(f'Unknown report: {name}')
+    cursor = conn.cursor()
+    try:
+        cursor.execute(REPORTS[name])
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+SUMMARY_QUERIES = [
+    ("Inventory remaining", '''
+        SELECT SUM(quantity) AS total_inventory
+        FROM Inventory;
+    '''),
+    ("Products on sale", '''
+        SELECT
+            COUNT(DISTINCT product_id) AS on_sale_products
+        FROM
+            Catalog;
+    '''),
+    ("Warehouse quantity", '''
+        SELECT
+            COUNT(*) AS warehouse_count
+        FROM
+            Warehouses;
+    '''),
+    ("Total inventory value", '''
+        SELECT
+            SUM(Inventory.quantity * Catalog.price) AS total_inventory_value
+        FROM
+            Inventory
+        JOIN
+            Catalog ON Inventory.catalog_id = Catalog.catalog_id;
+    '''),
+]
+
+
+def inventory_summary(conn):
+    cursor = conn.cursor()
+    try:
+        summary = []
+        for label, sql in SUMMARY_QUERIES:
+            cursor.execute(sql)
+            summary.append((label, cursor.fetchone()[0]))
+        return summary
+    finally:
+        cursor.close()
+
+
+# Purchase order with warehouse allocation, shared by InventoryService and
+# async_db: the statements each backend runs, and the planning in between.
+PurchasePlan = namedtuple('PurchasePlan', 'allocations unallocated details total_cost catalog_id')
+
+PURCHASE_SUPPLIERS_SQL = '''
+    SELECT supplier_id, catalog_id, price, max_quantity
+    FROM Catalog
+    WHERE product_id = %s
+    ORDER BY price;
+'''
+PURCHASE_SHELF_SPACE_SQL = 'SELECT shelf_space FROM Products WHERE product_id = %s;'
+PURCHASE_ORDER_SQL = '''
+    INSERT INTO PurchaseOrders (supplier_id, order_date, status, total_cost)
+    VALUES (%s, CURDATE(), 'Pending', 0);
+'''
+# Warehouses with room for a unit, largest first
+PURCHASE_WAREHOUSES_SQL = '''
+    SELECT warehouse_id, free_space
+    FROM WarehouseSpace
+    WHERE free_space >= %s
+    ORDER BY capacity DESC;
+'''
+PURCHASE_REJECT_SQL = "UPDATE PurchaseOrders SET status = 'Rejected' WHERE po_id = %s;"
+PURCHASE_DETAIL_SQL = '''
+    INSERT INTO PurchaseOrderDetails (po_id, catalog_id, quantity, cost_for_product)
+    VALUES (%s, %s, %s, %s);
+'''
+PURCHASE_TOTAL_SQL = '''
+    UPDATE PurchaseOrders
+    SET total_cost = %s, status = 'Add to Inventory'
+    WHERE po_id = %s;
+'''
+PURCHASE_INVENTORY_SQL = '''
+    INSERT INTO Inventory (warehouse_id, product_id, quantity, shelf_space, catalog_id)
+    VALUES (%s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        Inventory.quantity = Inventory.quantity + VALUES(Inventory.quantity),
+        Inventory.shelf_space = Inventory.shelf_space + VALUES(Inventory.shelf_space);
+'''
+PURCHASE_ALERT_SQL = '''
+    INSERT INTO Alerts (entity_type, entity_id, message, alert_date)
+    VALUES (%s, %s, %s, NOW());
+'''
+
+
+def plan_purchase(quantity, suppliers, product_shelf_space, warehouses):
+    # suppliers: [(supplier_id, catalog_id, price, max_quantity)], cheapest
+    # first. warehouses: [(warehouse_id, free_space)] in allocation order.
+    # The quantity goes to the warehouses in order, as much as fits in each,
+    # and is bought from the cheapest suppliers up to their max_quantity.
+    # unallocated > 0 means it does not fit and the order is rejected.
+    remaining_quantity = quantity
+    allocations = []
+    for warehouse_id, free_space in warehouses:
+        allocatable_quantity = int(free_space // product_shelf_space)
+        if allocatable_quantity > 0:
+            take = min(allocatable_quantity, remaining_quantity)
+            allocations.append((warehouse_id, take))
+            remaining_quantity -= take
+            if remaining_quantity == 0:
+                break
+    if remaining_quantity > 0:
+        return PurchasePlan(allocations, remaining_quantity, [], 0, None)
+
+    details = []
+    total_cost = 0
+    remaining_quantity = quantity
+    catalog_id = None
+    for _, catalog_id, price, max_quantity in suppliers:
+        supplier_quantity = min(max_quantity, remaining_quantity)
+        total_cost += price * supplier_quantity
+        details.append((catalog_id, supplier_quantity, price))
+        remaining_quantity -= supplier_quantity
+        if remaining_quantity == 0:
+            break
+    # New Inventory rows take the catalog entry of the last supplier used
+    return PurchasePlan(allocations, 0, details, total_cost, catalog_id)
+
+
+def purchase_outcome(po_id, product_id, quantity, plan):
+    # Returns (status, message) of a planned purchase order
+    if plan.unallocated:
+        return 'Rejected', (
+            f'Warning: Not enough warehouse capacity for the entire order of {quantity} '
+            f'units of product ID {product_id}. PO rejected. '
+            f'Unallocated quantity: {plan.unallocated}')
+    return 'Add to Inventory', (
+        f'Purchase Order created with ID: {po_id} for {quantity} units of product ID '
+        f'{product_id}. Inventory allocated across multiple warehouses.')
+
+
+# One line sold through process_sales_order, shared by InventoryService.sell
+# and async_db. The product's stock is read before (locked) and after the
+# call. A filled line is then recorded as a SalesOrderDetails row with
+# @sales_line_filled set, which keeps trg_after_insert_sales_order_details
+# from selling it a second time, and added to the order total.
+PRODUCT_STOCK_SQL = '''
+    SELECT quantity
+    FROM Inventory
+    WHERE product_id = %s
+    ORDER BY inventory_id
+'''
+SALE_LINE_FILLED_SQL = 'SET @sales_line_filled = %s;'
+SALE_DETAIL_SQL = '''
+    INSERT INTO SalesOrderDetails (order_id, product_id, quantity, price_for_product)
+    VALUES (%s, %s, %s, %s);
+'''
+SALE_TOTAL_SQL = '''
+    UPDATE SalesOrders
+    SET total_price = IFNULL(total_price, 0) + %s
+    WHERE order_id = %s;
+'''
+
+
+def _product_stock(cursor, product_id, lock=False):
+    cursor.execute(PRODUCT_STOCK_SQL + (' FOR UPDATE;' if lock else ';'), (product_id,))
+    return sum(qty or 0 for qty, in cursor.fetchall())
+
+
+def _record_sale_line(cursor, order_id, line):
+    cursor.execute(SALE_LINE_FILLED_SQL, (1,))
+    try:
+        cursor.execute(SALE_DETAIL_SQL, (order_id, line.product_id, line.quantity, line.line_total))
+    finally:
+        cursor.execute(SALE_LINE_FILLED_SQL, (None,))
+    cursor.execute(SALE_TOTAL_SQL, (line.line_total, order_id))
+
+
+class ServiceError(Exception):
+    # Business rule failures (unknown product, not enough stock, ...), as
+    # opposed to mysql.connector.Error for database failures.
+    pass
+
+
+class InventoryService:
+    def __init__(self, db_config, pool_size=8, pool_name='inventory_service',
+                 cache_reports=True):
+        self.db_config = db_config
+        self.pool_size = pool_size
+        self.pool = pooling.MySQLConnectionPool(
+            pool_name=pool_name, pool_size=pool_size, **db_config)
+        # The pool raises instead of waiting when it runs dry, so callers
+        # queue here for a free connection.
+        self._slots = threading.BoundedSemaphore(pool_size)
+        # report() answers from memory until a write below changes a table
+        # the report reads (see report_cache.py)
+        self.reports = ReportCache(self._load_report) if cache_reports else None
+        self.pricing = PricingEngine()
+        # Started by the first availability() call
+        self.availability_index = None
+        self._availability_lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        with self._slots:
+            conn = self.pool.get_connection()
+            try:
+                yield conn
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+                conn.close()  # returns the connection to the pool
+
+    # ---------------------------- reads ----------------------------------
+
+    def report(self, name):
+        with captured(OP_REPORT, {'name': name}):
+            if self.reports is None:
+                return self._load_report(name)
+            return self.reports.get(name)
+
+    def _load_report(self, name):
+        with self.connection() as conn:
+            rows = run_report(conn, name)
+            conn.commit()
+            return rows
+
+    def report_names(self):
+        return sorted(REPORTS)
+
+    def inventory_summary(self):
+        with self.connection() as conn:
+            summary = inventory_summary(conn)
+            conn.commit()
+            return summary
+
+    def stock(self, product_id):
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute('''
+                    SELECT
+                        i.warehouse_id,
+                        i.quantity,
+                        i.catalog_id,
+                        s.name AS supplier_name,
+                        c.price
+                    FROM Inventory i
+                    JOIN Catalog c ON i.catalog_id = c.catalog_id
+                    JOIN Suppliers s ON c.supplier_id = s.supplier_id
+                    WHERE i.product_id = %s
+                    ORDER BY i.warehouse_id;
+                ''', (product_id,))
+                rows = cursor.fetchall()
+                conn.commit()
+            finally:
+                cursor.close()
+        return {
+            'product_id': product_id,
+            'total_quantity': sum(row[1] or 0 for row in rows),
+            'locations': [
+                {'warehouse_id': wh, 'quantity': qty, 'catalog_id': catalog_id,
+                 'supplier_name': supplier, 'price': price}
+                for wh, qty, catalog_id, supplier, price in rows
+            ],
+        }
+
+    def availability(self, product_ids, warehouses=False):
+        return self._availability().availability(product_ids, warehouses)
+
+    def reserve(self, product_id, quantity, ttl=900.0):
+        reservation_id = self._availability().reserve(product_id, quantity, ttl)
+        if reservation_id is None:
+            raise ServiceError(f'Not enough stock of product ID {product_id} to reserve {quantity}')
+        return {'reservation_id': reservation_id}
+
+    def release(self, reservation_id):
+        return {'released': self._availability().release(reservation_id)}
+
+    def _availability(self):
+        with self._availability_lock:
+            if self.availability_index is None:
+                self.availability_index = AvailabilityIndex(self.connection).start()
+            return self.availability_index
+
+    def _reserved_for_others(self, product_ids, reservation_ids=()):
+        # Reservations only exist once the availability index is running
+        if self.availability_index is None:
+            return {}
+        return self.availability_index.reserved_for_others(
+            product_ids, [rid for rid in reservation_ids if rid is not None])
+
+    def _stock_changed(self, tables, product_ids, reservation_ids=()):
+        # reservation_ids: reservations the write used up
+        bump_tables(*tables)
+        if self.availability_index is not None:
+            self.availability_index.touch(
+                product_ids, [rid for rid in reservation_ids if rid is not None])
+
+    # ---------------------------- writes ---------------------------------
+
+    def price_order(self, lines, on_date=None):
+        with self.connection() as conn:
+            order = self._price(conn, lines, on_date)
+        return {
+            'lines': [line._asdict() for line in order.lines],
+            'total_price': order.total,
+        }
+
+    def _price(self, conn, lines, on_date=None):
+        try:
+            return self.pricing.price_order(conn, lines, on_date)
+        except PricingError as err:
+            raise ServiceError(str(err)) from err
+
+    def sell(self, order_id, product_id, quantity, reservation_id=None):
+        # Fulfil one line through process_sales_order, as the Sell button does.
+        # A filled line is priced, recorded in SalesOrderDetails and added to
+        # the order total in the same transaction, and uses up reservation_id
+        # if one is given. Units reserved by other carts are not sold: the
+        # line is refused when what is left of the stock does not cover it.
+        # The procedure does not raise when it cannot fill a line: it reports
+        # a shortfall, and does nothing at all for a product without
+        # Inventory rows, so the line counts as filled when the product's
+        # stock went down by the quantity.
+        with captured(OP_SELL, {'order_id': order_id, 'product_id': product_id,
+                                'quantity': quantity}):
+            with self.connection() as conn:
+                line = self._price(conn, [(product_id, quantity)]).lines[0]
+                cursor = conn.cursor()
+                try:
+                    before = _product_stock(cursor, product_id, lock=True)
+                    held = self._reserved_for_others(
+                        [product_id], [reservation_id]).get(product_id, 0)
+                    if held and before - held < quantity:
+                        conn.rollback()
+                        raise ServiceError(
+                            f'Not enough unreserved stock of product ID {product_id}: '
+                            f'{max(before - held, 0)} available ({held} reserved), '
+                            f'{quantity} requested')
+                    cursor.callproc('process_sales_order', [order_id, product_id, quantity])
+                    messages = [row[0] for result in cursor.stored_results()
+                                for row in result.fetchall()]
+                    filled = before - _product_stock(cursor, product_id) == quantity
+                    if filled:
+                        _record_sale_line(cursor, order_id, line)
+                    conn.commit()
+                finally:
+                    cursor.close()
+            self._stock_changed(SALE_TABLES, [product_id], [reservation_id] if filled else ())
+            return {'order_id': order_id, 'messages': messages,
+                    'line_total': line.line_total if filled else None}
+
+    def place_sales_order(self, customer_id, lines, delivery_date=None, reservation_ids=()):
+        # lines: list of (product_id, quantity). The order is only placed
+        # when every line can be filled; the SalesOrderDetails trigger then
+        # runs process_sales_order for each line in the same transaction.
+        # A placed order uses up reservation_ids, the reservations of its cart,
+        # and cannot take units reserved by other carts.
+        lines = [(int(pid), int(qty)) for pid, qty in lines]
+        with captured(OP_PLACE_SALES_ORDER, {'customer_id': customer_id, 'lines': lines,
+                                             'delivery_date': delivery_date}) as capture:
+            if not lines or any(qty <= 0 for _, qty in lines):
+                raise ServiceError('An order needs at least one line with a positive quantity')
+
+            with self.connection() as conn:
+                order = self._price(conn, lines)
+                cursor = conn.cursor()
+                try:
+                    conn.start_transaction()
+                    requested = {}
+                    for pid, qty in lines:
+                        requested[pid] = requested.get(pid, 0) + qty
+                    marks = ', '.join(['%s'] * len(requested))
+                    cursor.execute(f'''
+                        SELECT product_id, quantity
+                        FROM Inventory
+                        WHERE product_id IN ({marks})
+                        ORDER BY inventory_id
+                        FOR UPDATE;
+                    ''', sorted(requested))
+                    on_hand = {}
+                    for pid, qty in cursor.fetchall():
+                        on_hand[pid] = on_hand.get(pid, 0) + (qty or 0)
+                    held = self._reserved_for_others(sorted(requested), reservation_ids)
+                    available = {pid: max(on_hand.get(pid, 0) - held.get(pid, 0), 0)
+                                 for pid in requested}
+                    short = {pid: qty for pid, qty in requested.items()
+                             if available[pid] < qty}
+                    if short:
+                        conn.rollback()
+                        raise ServiceError('Insufficient stock for products: ' + ', '.join(
+                            f'{pid} ({available[pid]} available, {qty} requested)'
+                            for pid, qty in sorted(short.items())))
+
+                    cursor.execute('''
+                        INSERT INTO SalesOrders (customer_id, order_date, total_price, delivery_date, status)
+                        VALUES (%s, CURDATE(), %s, %s, 'Pending');
+                    ''', (customer_id, order.total, delivery_date))
+                    order_id = cursor.lastrowid
+                    cursor.executemany('''
+                        INSERT INTO SalesOrderDetails (order_id, product_id, quantity, price_for_product)
+                        VALUES (%s, %s, %s, %s);
+                    ''', [(order_id, line.product_id, line.quantity, line.line_total)
+                          for line in order.lines])
+                    conn.commit()
+                finally:
+                    cursor.close()
+            self._stock_changed(SALE_TABLES, requested, reservation_ids)
+            capture['order_id'] = order_id
+            return {'order_id': order_id, 'lines': len(lines), 'total_price': order.total}
+
+    def purchase(self, product_id, quantity):
+        # Purchase order with warehouse allocation, as the Buy button does:
+        # cheapest suppliers first, largest warehouses first.
+        with captured(OP_PURCHASE, {'product_id': product_id, 'quantity': quantity}):
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    result = self._purchase(conn, cursor, product_id, quantity)
+                finally:
+                    cursor.close()
+            self._stock_changed(PURCHASE_TABLES, [product_id])
+            return result
+
+    def _purchase(self, conn, cursor, product_id, quantity):
+        cursor.execute(PURCHASE_SUPPLIERS_SQL, (product_id,))
+        suppliers = cursor.fetchall()
+        cursor.execute(PURCHASE_SHELF_SPACE_SQL, (product_id,))
+        row = cursor.fetchone()
+        if not suppliers or row is None:
+            conn.rollback()
+            raise ServiceError(f'Product ID {product_id} has no supplier in the catalog')
+        product_shelf_space = row[0]
+
+        cursor.execute(PURCHASE_ORDER_SQL, (suppliers[0][0],))
+        po_id = cursor.lastrowid
+        cursor.execute(PURCHASE_WAREHOUSES_SQL, (product_shelf_space,))
+        plan = plan_purchase(quantity, suppliers, product_shelf_space, cursor.fetchall())
+        status, message = purchase_outcome(po_id, product_id, quantity, plan)
+
+        if plan.unallocated:
+            cursor.execute(PURCHASE_REJECT_SQL, (po_id,))
+            cursor.execute(PURCHASE_ALERT_SQL, ('Product', product_id, message))
+            conn.commit()
+            return {'po_id': po_id, 'status': status, 'message': message}
+
+        cursor.executemany(PURCHASE_DETAIL_SQL, [
+            (po_id, catalog_id, supplier_quantity, price)
+            for catalog_id, supplier_quantity, price in plan.details])
+        cursor.execute(PURCHASE_TOTAL_SQL, (plan.total_cost, po_id))
+
+        # Update Inventory based on allocations with shelf space
+        set_movement_source(cursor, MOVEMENT_RECEIPT, 'PurchaseOrder', po_id)
+        for warehouse_id, allocated in plan.allocations:
+            cursor.execute(PURCHASE_INVENTORY_SQL, (
+                warehouse_id, product_id, allocated,
+                product_shelf_space * allocated, plan.catalog_id))
+        clear_movement_source(cursor)
+
+        cursor.execute(PURCHASE_ALERT_SQL, ('PurchaseOrder', po_id, message))
+        conn.commit()
+        return {'po_id': po_id, 'status': status, 'message': message}
+
+    def transfer(self, transfers):
+        # transfers: list of (from_warehouse_id, to_warehouse_id, product_id, quantity)
+        with captured(OP_TRANSFER, {'transfers': [list(move) for move in transfers]}):
+            with self.connection() as conn:
+                results = TransferEngine(conn, self.db_config).execute_batch(transfers)
+            self._stock_changed(TRANSFER_TABLES, {move[2] for move in transfers})
+            return results
@@ -0,0 +1,367 @@
+# Nightly report and reconciliation jobs on a process pool
+# pip install numpy mysql-connector-python
+#
+# The nightly jobs form a dependency graph. Every job whose dependencies
+# are done runs at once in a worker process, and each worker process opens
+# its own connection (calculate_average_price_per_product uses a temporary
+# table, so the calls must not share one).
+#
+#   ledger_snapshot       movement_ledger.take_snapshot
+#   low_stock             CALL GetLowStockProducts()
+#   monthly_changes       CALL MonthlyInventoryChanges()
+#   most_transferred      CALL MostTransferredProducts()
+#   average_price.NNNN    CALL calculate_average_price_per_product for one
+#                         chunk of products
+#   average_price         the chunks merged            after average_price.*
+#   valuation             analytics.InventoryAnalytics
+#   warehouse_space       warehouse_space.rebuild, lists the warehouses whose
+#                         space ledger had drifted
+#   average_cost_check    products whose procedure average price and
+#                         valuation average cost differ
+#                                                      after average_price,
+#                                                      valuation
+#
+# Progress is printed as jobs finish. Each job's output is written to
+# <output>/<run id>/<job>.json, and run.json lists the status, dependencies
+# and timings of every job. A failed job skips the jobs that depend on it.
+#   python job_runner.py --workers 4 --chunk-size 25
+#   python job_runner.py --only average_cost_check
+
+import argparse
+import datetime
+import decimal
+import json
+import os
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import mysql.connector
+
+from db_settings import add_db_arguments, db_config_from_args
+from movement_ledger import take_snapshot
+from warehouse_space import rebuild as rebuild_warehouse_space
+
+
+# func(connection, inputs, *args): connection() returns the worker's
+# connection, inputs maps each dependency to its output.
+Job = namedtuple('Job', 'name func args depends')
+JobResult = namedtuple('JobResult', 'name status started seconds output_path error')
+
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+STATUS_SKIPPED = 'skipped'
+
+
+class JobError(Exception):
+    pass
+
+
+# ---------------------------- jobs -----------------------------------------
+
+def _call_procedure(conn, name, args=()):
+    cursor = conn.cursor()
+    try:
+        cursor.callproc(name, args)
+        rows = [list(row) for result in cursor.stored_results() for row in result.fetchall()]
+        conn.commit()
+    finally:
+        cursor.close()
+    return rows
+
+
+def ledger_snapshot_job(connection, inputs):
+    return {'snapshot_id': take_snapshot(connection())}
+
+
+def low_stock_job(connection, inputs):
+    return _call_procedure(connection(), 'GetLowStockProducts')
+
+
+def monthly_changes_job(connection, inputs):
+    return _call_procedure(connection(), 'MonthlyInventoryChanges')
+
+
+def most_transferred_job(connection, inputs):
+    return _call_procedure(connection(), 'MostTransferredProducts')
+
+
+def average_price_chunk_job(connection, inputs, product_ids):
+    conn = connection()
+    rows = []
+    for product_id in product_ids:
+        rows.extend(_call_procedure(conn, 'calculate_average_price_per_product', (product_id,)))
+    return rows
+
+
+def average_price_job(connection, inputs):
+    return sorted((row for rows in inputs.values() for row in rows), key=lambda row: row[0])
+
+
+def valuation_job(connection, inputs):
+    # numpy is only needed by this job
+    from analytics import InventoryAnalytics, load_arrays
+
+    analytics = InventoryAnalytics(load_arrays(connection()))
+    return {
+        'as_of': str(analytics.as_of),
+        'total_units': analytics.total_units,
+        'total_value': analytics.total_value,
+        'warehouses': analytics.warehouse_rows(),
+        'products': analytics.product_rows(),
+    }
+
+
+def warehouse_space_job(connection, inputs):
+    return [row._asdict() for row in rebuild_warehouse_space(connection())]
+
+
+def average_cost_check_job(connection, inputs, tolerance=0.01):
+    valuation_cost = {row[0]: row[3] for row in inputs['valuation']['products']}
+    mismatches = []
+    for product_id, name, average_price in inputs['average_price']:
+        expected = float(average_price or 0)
+        actual = valuation_cost.get(product_id)
+        if actual is None or abs(actual - expected) > tolerance:
+            mismatches.append({'product_id': product_id, 'name': name,
+                               'procedure': expected, 'valuation': actual})
+    return {'checked': len(inputs['average_price']), 'mismatches': mismatches}
+
+
+def nightly_jobs(conn, chunk_size=25):
+    cursor = conn.cursor()
+    try:
+        cursor.execute('SELECT product_id FROM Products ORDER BY product_id;')
+        product_ids = [row[0] for row in cursor.fetchall()]
+        conn.commit()
+    finally:
+        cursor.close()
+
+    chunks = []
+    for start in range(0, len(product_ids), chunk_size):
+        name = f'average_price.{start // chunk_size + 1:04d}'
+        chunks.append(Job(name, average_price_chunk_job,
+                          (product_ids[start:start + chunk_size],), ()))
+    return [
+        Job('ledger_snapshot', ledger_snapshot_job, (), ()),
+        Job('low_stock', low_stock_job, (), ()),
+        Job('monthly_changes', monthly_changes_job, (), ()),
+        Job('most_transferred', most_transferred_job, (), ()),
+        *chunks,
+        Job('average_price', average_price_job, (), tuple(job.name for job in chunks)),
+        Job('valuation', valuation_job, (), ()),
+        Job('warehouse_space', warehouse_space_job, (), ()),
+        Job('average_cost_check', average_cost_check_job, (), ('average_price', 'valuation')),
+    ]
+
+
+def select_jobs(jobs, names):
+    # The named jobs and everything they depend on
+    by_name = {job.name: job for job in jobs}
+    selected = set()
+    stack = list(names)
+    while stack:
+        name = stack.pop()
+        if name in selected:
+            continue
+        if name not in by_name:
+            raise JobError(f'Unknown job {name}')
+        selected.add(name)
+        stack.extend(by_name[name].depends)
+    return [job for job in jobs if job.name in selected]
+
+
+# ---------------------------- worker processes -----------------------------
+
+_worker_db_config = None
+_worker_conn = None
+
+
+def _init_worker(db_config):
+    global _worker_db_config
+    _worker_db_config = db_config
+
+
+def _worker_connection():
+    # Opened on first use, so jobs that only merge inputs never connect
+    global _worker_conn
+    if _worker_conn is None or not _worker_conn.is_connected():
+        _worker_conn = mysql.connector.connect(**_worker_db_config)
+    return _worker_conn
+
+
+def _run_job(func, args, inputs):
+    start = time.perf_counter()
+    try:
+        output = func(_worker_connection, inputs, *args)
+    except Exception as err:
+        return None, time.perf_counter() - start, f'{type(err).__name__}: {err}'
+    return output, time.perf_counter() - start, None
+
+
+# ---------------------------- runner ---------------------------------------
+
+def _json_default(value):
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8', 'replace')
+    raise TypeError(f'Cannot serialise {type(value).__name__}')
+
+
+def _check_graph(jobs):
+    by_name = {}
+    for job in jobs:
+        if job.name in by_name:
+            raise JobError(f'Duplicate job {job.name}')
+        by_name[job.name] = job
+    for job in jobs:
+        for dependency in job.depends:
+            if dependency not in by_name:
+                raise JobError(f'{job.name} depends on unknown job {dependency}')
+    # Kahn's algorithm; anything left over is on a cycle
+    remaining = {job.name: len(job.depends) for job in jobs}
+    ready = [name for name, count in remaining.items() if count == 0]
+    dependents = {job.name: [] for job in jobs}
+    for job in jobs:
+        for dependency in job.depends:
+            dependents[dependency].append(job.name)
+    while ready:
+        for dependent in dependents[ready.pop()]:
+            remaining[dependent] -= 1
+            if remaining[dependent] == 0:
+                ready.append(dependent)
+    cyclic = sorted(name for name, count in remaining.items() if count)
+    if cyclic:
+        raise JobError(f'Dependency cycle between {", ".join(cyclic)}')
+    return dependents
+
+
+class JobRunner:
+    def __init__(self, db_config, workers=4, output_dir='job_runs', on_progress=None):
+        self.db_config = db_config
+        self.workers = workers
+        self.output_dir = output_dir
+        # on_progress(result, finished, total) after every job
+        self.on_progress = on_progress
+
+    def run(self, jobs, run_id=None):
+        dependents = _check_graph(jobs)
+        by_name = {job.name: job for job in jobs}
+        run_id = run_id or datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        run_dir = os.path.join(self.output_dir, run_id)
+        os.makedirs(run_dir, exist_ok=True)
+
+        waiting = {job.name: set(job.depends) for job in jobs}
+        outputs = {}
+        results = {}
+        run_start = time.perf_counter()
+
+        def finish(result):
+            results[result.name] = result
+            if self.on_progress:
+                self.on_progress(result, len(results), len(jobs))
+            if result.status != STATUS_DONE:
+                for dependent in dependents[result.name]:
+                    if dependent in waiting:
+                        del waiting[dependent]
+                        finish(JobResult(dependent, STATUS_SKIPPED, None, 0.0, None,
+                                         f'{result.name} {result.status}'))
+
+        with ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                 initargs=(self.db_config,)) as pool:
+            running = {}
+
+            def submit_ready():
+                for name in [name for name, deps in waiting.items() if not deps]:
+                    del waiting[name]
+                    job = by_name[name]
+                    inputs = {dependency: outputs[dependency] for dependency in job.depends}
+                    future = pool.submit(_run_job, job.func, job.args, inputs)
+                    running[future] = (name, time.perf_counter() - run_start)
+
+            submit_ready()
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, started = running.pop(future)
+                    output, seconds, error = future.result()
+                    if error is not None:
+                        finish(JobResult(name, STATUS_FAILED, started, seconds, None, error))
+                        continue
+                    output_path = os.path.join(run_dir, name + '.json')
+                    with open(output_path, 'w', encoding='utf-8') as file:
+                        json.dump(output, file, default=_json_default)
+                    if dependents[name]:
+                        outputs[name] = output
+                    for dependent in dependents[name]:
+                        if dependent in waiting:  # not skipped
+                            waiting[dependent].discard(name)
+                    finish(JobResult(name, STATUS_DONE, started, seconds, output_path, None))
+                # Inputs nobody is waiting for any more can go
+                for name in [name for name in outputs
+                             if not any(d in waiting for d in dependents[name])]:
+                    del outputs[name]
+                submit_ready()
+
+        wall_seconds = time.perf_counter() - run_start
+        with open(os.path.join(run_dir, 'run.json'), 'w', encoding='utf-8') as file:
+            json.dump({
+                'run_id': run_id,
+                'workers': self.workers,
+                'wall_seconds': wall_seconds,
+                'jobs': [{**results[job.name]._asdict(), 'depends': list(job.depends)}
+                         for job in jobs],
+            }, file, indent=1)
+        return [results[job.name] for job in jobs], wall_seconds
+
+
+def print_progress(result, finished, total):
+    line = f'[{finished:>4}/{total}] {result.name:<24} {result.status:<8}'
+    if result.status != STATUS_SKIPPED:
+        line += f' {result.seconds:8.2f}s'
+    if result.error:
+        line += f'  {result.error}'
+    print(line, flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Nightly report and reconciliation jobs')
+    add_db_arguments(parser)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4)
+    parser.add_argument('--chunk-size', type=int, default=25,
+                        help='products per calculate_average_price_per_product job')
+    parser.add_argument('--output', default='job_runs', help='directory for the run outputs')
+    parser.add_argument('--only', nargs='+', help='run only these jobs and their dependencies')
+    args = parser.parse_args(argv)
+
+    db_config = db_config_from_args(args)
+    conn = mysql.connector.connect(**db_config)
+    try:
+        jobs = nightly_jobs(conn, args.chunk_size)
+    finally:
+        conn.close()
+    try:
+        if args.only:
+            jobs = select_jobs(jobs, args.only)
+        runner = JobRunner(db_config, args.workers, args.output, print_progress)
+        results, wall_seconds = runner.run(jobs)
+    except JobError as err:
+        print(f'Error: {err}')
+        return 1
+
+    busy = sum(result.seconds for result in results)
+    failed = [result.name for result in results if result.status != STATUS_DONE]
+    print(f'{len(results)} jobs in {wall_seconds:.2f}s wall, {busy:.2f}s of job time '
+          f'({busy / wall_seconds if wall_seconds else 0:.1f}x parallelism)')
+    if failed:
+        print(f'Not done: {", ".join(failed)}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
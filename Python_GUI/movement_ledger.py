@@ -0,0 +1,228 @@
+# Inventory movement ledger and stock-as-of-date reads
+# pip install mysql-connector-python
+#
+# Every change of Inventory.quantity is appended to InventoryMovements by
+# the Inventory triggers (Inventory_procedures.sql, section 12), in the same
+# transaction as the change. The writer says what the change is by calling
+# set_movement_source() before it touches Inventory, and
+# clear_movement_source() afterwards. Anything else is an adjustment.
+#
+# take_snapshot() compacts the ledger into InventorySnapshotLines: the
+# previous snapshot plus the movements since then, one row per warehouse and
+# product. stock_as_of() reads the latest snapshot at or before the date and
+# adds only the movements after it, so the delta it reads is bounded by how
+# often snapshots are taken. Run it periodically, e.g. from cron:
+#   python movement_ledger.py snapshot --min-movements 1000
+#   python movement_ledger.py as-of 2024-06-30 --product 8
+#   python movement_ledger.py history 8 --limit 20
+
+import argparse
+import sys
+from datetime import date, datetime, time
+
+import mysql.connector
+
+from db_settings import add_db_arguments, db_config_from_args
+
+
+MOVEMENT_RECEIPT = 'receipt'
+MOVEMENT_SALE = 'sale'
+MOVEMENT_TRANSFER_IN = 'transfer_in'
+MOVEMENT_TRANSFER_OUT = 'transfer_out'
+MOVEMENT_ADJUSTMENT = 'adjustment'
+
+# Movements newer than this are left out of a snapshot, so one that is still
+# in an open transaction (its id is already taken) is not skipped over.
+SNAPSHOT_GRACE_SECONDS = 60
+
+
+class LedgerError(Exception):
+    pass
+
+
+def set_movement_source(cursor, movement_type, source_type=None, source_id=None):
+    cursor.execute('''
+        SET @movement_type = %s, @movement_source_type = %s, @movement_source_id = %s;
+    ''', (movement_type, source_type, source_id))
+
+
+def clear_movement_source(cursor):
+    cursor.execute('''
+        SET @movement_type = NULL, @movement_source_type = NULL, @movement_source_id = NULL;
+    ''')
+
+
+def take_snapshot(conn, min_movements=1, grace_seconds=SNAPSHOT_GRACE_SECONDS):
+    # Returns the new snapshot id, or None if fewer than min_movements
+    # settled movements were recorded since the last snapshot.
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction()
+        # Serialises snapshot jobs
+        cursor.execute('''
+            SELECT snapshot_id, snapshot_time, last_movement_id
+            FROM InventorySnapshots
+            ORDER BY last_movement_id DESC, snapshot_id DESC
+            LIMIT 1
+            FOR UPDATE;
+        ''')
+        row = cursor.fetchone()
+        if row is None:
+            raise LedgerError('No opening snapshot, run Inventory_procedures.sql')
+        previous_id, previous_time, previous_last = row
+
+        cursor.execute('''
+            SELECT COUNT(*), MAX(movement_id), MAX(movement_time)
+            FROM InventoryMovements
+            WHERE movement_id > %s AND movement_time <= NOW() - INTERVAL %s SECOND;
+        ''', (previous_last, grace_seconds))
+        count, last_movement_id, last_time = cursor.fetchone()
+        if not count or count < min_movements:
+            conn.rollback()
+            return None
+
+        cursor.execute('''
+            INSERT INTO InventorySnapshots (snapshot_time, last_movement_id, created_at)
+            VALUES (%s, %s, NOW());
+        ''', (max(previous_time, last_time), last_movement_id))
+        snapshot_id = cursor.lastrowid
+        cursor.execute('''
+            INSERT INTO InventorySnapshotLines (snapshot_id, warehouse_id, product_id, quantity)
+            SELECT %s, warehouse_id, product_id, SUM(quantity)
+            FROM (
+                SELECT warehouse_id, product_id, quantity
+                FROM InventorySnapshotLines
+                WHERE snapshot_id = %s
+                UNION ALL
+                SELECT warehouse_id, product_id, quantity_change
+                FROM InventoryMovements
+                WHERE movement_id > %s AND movement_id <= %s
+            ) AS stock
+            GROUP BY warehouse_id, product_id
+            HAVING SUM(quantity) <> 0;
+        ''', (snapshot_id, previous_id, previous_last, last_movement_id))
+        conn.commit()
+        return snapshot_id
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def stock_as_of(conn, as_of, warehouse_id=None, product_id=None):
+    # Returns [(warehouse_id, product_id, quantity)] as of the given datetime
+    cursor = conn.cursor()
+    try:
+        cursor.execute('''
+            SELECT snapshot_id, last_movement_id
+            FROM InventorySnapshots
+            WHERE snapshot_time <= %s
+            ORDER BY snapshot_time DESC, snapshot_id DESC
+            LIMIT 1;
+        ''', (as_of,))
+        row = cursor.fetchone()
+        if row is None:
+            raise LedgerError(f'No stock history before {as_of}')
+        snapshot_id, last_movement_id = row
+
+        filters = ''
+        params = []
+        if warehouse_id is not None:
+            filters += ' AND warehouse_id = %s'
+            params.append(warehouse_id)
+        if product_id is not None:
+            filters += ' AND product_id = %s'
+            params.append(product_id)
+
+        cursor.execute(f'''
+            SELECT warehouse_id, product_id, SUM(quantity) AS quantity
+            FROM (
+                SELECT warehouse_id, product_id, quantity
+                FROM InventorySnapshotLines
+                WHERE snapshot_id = %s{filters}
+                UNION ALL
+                SELECT warehouse_id, product_id, quantity_change
+                FROM InventoryMovements
+                WHERE movement_id > %s AND movement_time <= %s{filters}
+            ) AS stock
+            GROUP BY warehouse_id, product_id
+            HAVING SUM(quantity) <> 0
+            ORDER BY warehouse_id, product_id;
+        ''', [snapshot_id, *params, last_movement_id, as_of, *params])
+        rows = [(wh, pid, int(quantity)) for wh, pid, quantity in cursor.fetchall()]
+        conn.commit()
+        return rows
+    finally:
+        cursor.close()
+
+
+def movement_history(conn, product_id, warehouse_id=None, limit=100):
+    cursor = conn.cursor()
+    try:
+        sql = '''
+            SELECT movement_id, movement_time, movement_type, warehouse_id,
+                   quantity_change, source_type, source_id
+            FROM InventoryMovements
+            WHERE product_id = %s
+        '''
+        params = [product_id]
+        if warehouse_id is not None:
+            sql += ' AND warehouse_id = %s'
+            params.append(warehouse_id)
+        sql += ' ORDER BY movement_id DESC LIMIT %s'
+        params.append(int(limit))
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        conn.commit()
+        return rows
+    finally:
+        cursor.close()
+
+
+def parse_as_of(text):
+    # A bare date means the end of that day
+    try:
+        return datetime.combine(date.fromisoformat(text), time(23, 59, 59))
+    except ValueError:
+        return datetime.fromisoformat(text)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Inventory movement ledger')
+    add_db_arguments(parser)
+    commands = parser.add_subparsers(dest='command', required=True)
+    snapshot_parser = commands.add_parser('snapshot', help='compact the ledger into a new snapshot')
+    snapshot_parser.add_argument('--min-movements', type=int, default=1)
+    snapshot_parser.add_argument('--grace-seconds', type=int, default=SNAPSHOT_GRACE_SECONDS)
+    as_of_parser = commands.add_parser('as-of', help='stock per warehouse and product at a date')
+    as_of_parser.add_argument('as_of', help='YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS')
+    as_of_parser.add_argument('--warehouse', type=int)
+    as_of_parser.add_argument('--product', type=int)
+    history_parser = commands.add_parser('history', help='latest movements of a product')
+    history_parser.add_argument('product_id', type=int)
+    history_parser.add_argument('--warehouse', type=int)
+    history_parser.add_argument('--limit', type=int, default=50)
+    args = parser.parse_args(argv)
+
+    conn = mysql.connector.connect(**db_config_from_args(args))
+    try:
+        if args.command == 'snapshot':
+            snapshot_id = take_snapshot(conn, args.min_movements, args.grace_seconds)
+            print(f'Snapshot {snapshot_id} taken' if snapshot_id else 'Nothing to compact')
+        elif args.command == 'as-of':
+            for row in stock_as_of(conn, parse_as_of(args.as_of), args.warehouse, args.product):
+                print('\t'.join(str(value) for value in row))
+        else:
+            for row in movement_history(conn, args.product_id, args.warehouse, args.limit):
+                print('\t'.join(str(value) for value in row))
+    except LedgerError as err:
+        print(f'Error: {err}')
+        return 1
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,215 @@
+# Sales order pricing: selling price, quantity breaks and promotions
+# pip install mysql-connector-python
+#
+# PricingEngine prices a whole order in one pass over its lines, in memory:
+# - quantities are summed per product first, so a quantity break applies to
+#   the product's total in the order even when it is split over lines;
+# - the unit price is that of the largest break reached (PriceBreaks),
+#   otherwise Products.selling_price;
+# - the best promotion running on the order date for the product, or for
+#   all products, takes its percent off. Promotions do not stack.
+# Unit prices are rounded to cents, a line total is unit price x quantity.
+#
+# The rule tables are read in one go and kept in memory. Prices and
+# promotions are only changed outside the app (in SQL), so a change is picked
+# up when the rules are read again after ttl seconds, a minute by default.
+#
+# InventoryService.place_sales_order and sell() write the totals in the
+# fulfilment transaction. To price an order without placing it:
+#   python pricing.py 1:12 2:30 7:1 --on 2024-08-20
+
+import argparse
+import sys
+import threading
+import time
+from bisect import bisect_right
+from collections import namedtuple
+from datetime import date
+from decimal import ROUND_HALF_UP, Decimal
+
+import mysql.connector
+
+from db_settings import add_db_arguments, db_config_from_args
+from report_cache import table_versions
+
+
+PRICING_TABLES = ('Products', 'PriceBreaks', 'Promotions')
+
+CENT = Decimal('0.01')
+HUNDRED = Decimal(100)
+
+PricedLine = namedtuple('PricedLine', 'product_id quantity unit_price line_total promotion_id')
+PricedOrder = namedtuple('PricedOrder', 'lines total')
+
+
+class PricingError(Exception):
+    pass
+
+
+class PriceRules:
+    def __init__(self, selling_prices, breaks, promotions):
+        # selling_prices: {product_id: price}
+        # breaks: [(product_id, min_quantity, unit_price)]
+        # promotions: [(promotion_id, product_id or None, percent_off, starts_on, ends_on)]
+        self.selling_prices = selling_prices
+        self._break_quantities = {}
+        self._break_prices = {}
+        for product_id, min_quantity, unit_price in sorted(breaks):
+            self._break_quantities.setdefault(product_id, []).append(min_quantity)
+            self._break_prices.setdefault(product_id, []).append(unit_price)
+        self.promotions = promotions
+
+    def unit_price(self, product_id, quantity):
+        quantities = self._break_quantities.get(product_id)
+        if quantities:
+            i = bisect_right(quantities, quantity)
+            if i:
+                return self._break_prices[product_id][i - 1]
+        price = self.selling_prices.get(product_id)
+        if price is None:
+            raise PricingError(f'Product ID {product_id} has no selling price')
+        return price
+
+    def running_promotions(self, on_date):
+        # {product_id or None: (percent_off, promotion_id)}, the best of each
+        best = {}
+        for promotion_id, product_id, percent_off, starts_on, ends_on in self.promotions:
+            if starts_on <= on_date <= ends_on:
+                current = best.get(product_id)
+                if current is None or percent_off > current[0]:
+                    best[product_id] = (percent_off, promotion_id)
+        return best
+
+
+# Run in this order, their rows are the arguments of price_rules_from_rows
+PRICE_RULE_QUERIES = (
+    'SELECT product_id, selling_price FROM Products;',
+    'SELECT product_id, min_quantity, unit_price FROM PriceBreaks;',
+    '''
+        SELECT promotion_id, product_id, percent_off, starts_on, ends_on
+        FROM Promotions;
+    ''',
+)
+
+
+def price_rules_from_rows(products, breaks, promotions):
+    selling_prices = {pid: price for pid, price in products if price is not None}
+    return PriceRules(selling_prices, list(breaks), list(promotions))
+
+
+def load_price_rules(conn):
+    cursor = conn.cursor()
+    try:
+        results = []
+        for sql in PRICE_RULE_QUERIES:
+            cursor.execute(sql)
+            results.append(cursor.fetchall())
+        conn.commit()
+    finally:
+        cursor.close()
+    return price_rules_from_rows(*results)
+
+
+def price_lines(rules, lines, on_date):
+    # lines: [(product_id, quantity)], priced in the given order
+    ordered = {}
+    for product_id, quantity in lines:
+        ordered[product_id] = ordered.get(product_id, 0) + quantity
+    running = rules.running_promotions(on_date)
+    storewide = running.get(None)
+
+    unit_prices = {}
+    for product_id, total_quantity in ordered.items():
+        price = rules.unit_price(product_id, total_quantity)
+        promotion = running.get(product_id)
+        if storewide is not None and (promotion is None or storewide[0] > promotion[0]):
+            promotion = storewide
+        promotion_id = None
+        if promotion is not None:
+            price = (price * (HUNDRED - promotion[0]) / HUNDRED).quantize(CENT, ROUND_HALF_UP)
+            promotion_id = promotion[1]
+        unit_prices[product_id] = (price, promotion_id)
+
+    priced = []
+    total = Decimal(0)
+    for product_id, quantity in lines:
+        price, promotion_id = unit_prices[product_id]
+        line_total = price * quantity
+        total += line_total
+        priced.append(PricedLine(product_id, quantity, price, line_total, promotion_id))
+    return PricedOrder(priced, total)
+
+
+class PricingEngine:
+    def __init__(self, ttl=60.0, versions=table_versions):
+        self.ttl = ttl
+        self.versions = versions
+        self._rules = None
+        self._rules_versions = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _stale(self, versions):
+        # Called with the lock held
+        return (self._rules is None or versions != self._rules_versions
+                or time.monotonic() - self._loaded_at >= self.ttl)
+
+    def _store(self, rules, versions):
+        # Called with the lock held
+        self._rules = rules
+        self._rules_versions = versions
+        self._loaded_at = time.monotonic()
+
+    def rules(self, conn):
+        # conn is only used when the cached rules have to be read again
+        versions = self.versions.snapshot(PRICING_TABLES)
+        with self._lock:
+            if self._stale(versions):
+                self._store(load_price_rules(conn), versions)
+            return self._rules
+
+    async def rules_async(self, load):
+        # For asyncio callers: load() is a coroutine returning PriceRules,
+        # awaited without the lock, so two callers may both read them
+        versions = self.versions.snapshot(PRICING_TABLES)
+        with self._lock:
+            if not self._stale(versions):
+                return self._rules
+        rules = await load()
+        with self._lock:
+            self._store(rules, versions)
+        return rules
+
+    def price_order(self, conn, lines, on_date=None):
+        return price_lines(self.rules(conn), lines, on_date or date.today())
+
+
+def parse_line(text):
+    product_id, _, quantity = text.partition(':')
+    return int(product_id), int(quantity or 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Price a sales order')
+    add_db_arguments(parser)
+    parser.add_argument('lines', nargs='+', type=parse_line, help='product_id:quantity')
+    parser.add_argument('--on', type=date.fromisoformat, help='order date, default today')
+    args = parser.parse_args(argv)
+
+    conn = mysql.connector.connect(**db_config_from_args(args))
+    try:
+        order = PricingEngine().price_order(conn, args.lines, args.on)
+    except PricingError as err:
+        print(f'Error: {err}')
+        return 1
+    finally:
+        conn.close()
+    for line in order.lines:
+        promotion = f'  (promotion {line.promotion_id})' if line.promotion_id else ''
+        print(f'{line.product_id}\t{line.quantity}\t{line.unit_price}\t{line.line_total}{promotion}')
+    print(f'Total: {order.total}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
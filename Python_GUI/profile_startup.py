@@ -0,0 +1,101 @@
+# Startup profile for the Qt app
+#
+#   python profile_startup.py
+#   python profile_startup.py --runs 5
+#
+# Each run starts a fresh interpreter (so imports are measured cold), opens
+# ProductApp and reports, in ms since the run started:
+#   import        Inventory_management_app imported
+#   first paint   first paint event of the main window
+#   interactive   database connected, schema checked and dashboard filled
+# and which heavy modules were already loaded at first paint.
+
+import time
+
+START = time.perf_counter()
+
+import argparse  # noqa: E402
+import json  # noqa: E402
+import os  # noqa: E402
+import subprocess  # noqa: E402
+import sys  # noqa: E402
+
+HEAVY_MODULES = ['mysql.connector', 'inventory_service', 'report_windows', 'numpy', 'aiomysql']
+
+
+def elapsed_ms():
+    return (time.perf_counter() - START) * 1000
+
+
+def profile_once(timeout):
+    from PyQt5.QtCore import QEvent, QObject, QTimer  # type: ignore
+    from PyQt5.QtWidgets import QApplication  # type: ignore
+
+    app = QApplication(sys.argv[:1])
+    import Inventory_management_app
+    timings = {'import': elapsed_ms()}
+
+    class FirstPaint(QObject):
+        def eventFilter(self, obj, event):
+            if event.type() == QEvent.Paint and 'first_paint' not in timings:
+                timings['first_paint'] = elapsed_ms()
+                timings['loaded_at_first_paint'] = [
+                    name for name in HEAVY_MODULES if name in sys.modules]
+            return False
+
+    def on_startup_finished():
+        timings['interactive'] = elapsed_ms()
+        timings['database_ok'] = window.conn is not None
+        app.quit()
+
+    window = Inventory_management_app.ProductApp()
+    first_paint = FirstPaint()
+    window.installEventFilter(first_paint)
+    window.startup_finished.connect(on_startup_finished)
+    window.show()
+    QTimer.singleShot(int(timeout * 1000), app.quit)
+    app.exec_()
+    return timings
+
+
+def summarise(runs):
+    for key, label in (('import', 'import'), ('first_paint', 'first paint'),
+                       ('interactive', 'interactive')):
+        values = sorted(run[key] for run in runs if key in run)
+        if not values:
+            print(f'{label:>12}: not reached')
+            continue
+        print(f'{label:>12}: median {values[len(values) // 2]:8.1f} ms   '
+              f'min {values[0]:8.1f} ms   max {values[-1]:8.1f} ms')
+    loaded = sorted({name for run in runs for name in run.get('loaded_at_first_paint', [])})
+    print(f'Loaded at first paint: {", ".join(loaded) or "none of " + ", ".join(HEAVY_MODULES)}')
+    if not all(run.get('database_ok') for run in runs):
+        print('Warning: database startup failed in at least one run')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='ProductApp startup profile')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--timeout', type=float, default=60,
+                        help='give up on a run after this many seconds')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(profile_once(args.timeout)))
+        return 0
+
+    runs = []
+    script = os.path.abspath(__file__)
+    for i in range(args.runs):
+        output = subprocess.run(
+            [sys.executable, script, '--child', '--timeout', str(args.timeout)],
+            cwd=os.path.dirname(script), capture_output=True, text=True, check=True).stdout
+        # the app prints while it starts, the timings are the last line
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    summarise(runs)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
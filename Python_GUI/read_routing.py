@@ -0,0 +1,180 @@
+# Read-replica routing for reports and the dashboard
+# pip install mysql-connector-python
+#
+# ReadRouter hands out the connection a read-only report should use: the
+# replica configured in db_settings.REPLICA_DB_CONFIG when it is reachable
+# and no more than max_lag seconds behind, otherwise the primary. Writes
+# never go through it.
+#
+# Read your writes: callers report every write with note_write(). Lag is
+# measured in whole seconds (Seconds_Behind_Source), so when the lag is
+# checked at time t the replica holds everything committed before
+# t - lag - 1. Until that point has passed the last write, reads stay on
+# the primary, e.g. the dashboard refresh right after a sale.
+#
+# To try it with two local MySQL instances (the second one replicating from
+# the first):
+#   python read_routing.py --replica-port 3307 status
+#   python read_routing.py --replica-port 3307 report stock_list
+
+import argparse
+import sys
+import threading
+import time
+
+import mysql.connector
+
+from db_settings import (
+    REPLICA_MAX_LAG_SECONDS, add_db_arguments, db_config_from_args, get_replica_config)
+from inventory_service import REPORTS, inventory_summary, run_report
+
+
+def replication_lag(conn):
+    # Seconds the replica is behind its source, None if it is not replicating
+    cursor = conn.cursor(dictionary=True)
+    try:
+        try:
+            cursor.execute('SHOW REPLICA STATUS')
+        except mysql.connector.Error:
+            # MySQL before 8.0.22
+            cursor.execute('SHOW SLAVE STATUS')
+        row = cursor.fetchone()
+        cursor.fetchall()
+    finally:
+        cursor.close()
+    if row is None:
+        return None
+    lag = row.get('Seconds_Behind_Source', row.get('Seconds_Behind_Master'))
+    return None if lag is None else int(lag)
+
+
+class ReadRouter:
+    def __init__(self, primary_conn, replica_config=None, max_lag=REPLICA_MAX_LAG_SECONDS,
+                 check_interval=1.0, retry_interval=30.0):
+        self.primary_conn = primary_conn
+        self.replica_config = replica_config
+        self.max_lag = max_lag
+        # How often the replica lag is measured, and how long an unreachable
+        # replica is left alone before it is tried again
+        self.check_interval = check_interval
+        self.retry_interval = retry_interval
+        self.replica_conn = None
+        self.last_write = 0.0
+        # ('replica' or 'primary', reason) of the last routing decision
+        self.last_route = None
+        self._lag = None
+        self._lag_checked = 0.0
+        self._down_until = 0.0
+        self._lock = threading.Lock()
+
+    def note_write(self):
+        self.last_write = time.time()
+
+    def connection(self):
+        with self._lock:
+            conn, reason = self._route()
+            self.last_route = ('replica' if conn is self.replica_conn else 'primary', reason)
+            return conn
+
+    def _route(self):
+        if self.replica_config is None:
+            return self.primary_conn, 'no replica configured'
+        now = time.time()
+        if now < self._down_until:
+            return self.primary_conn, 'replica unavailable'
+
+        if now - self._lag_checked >= self.check_interval:
+            try:
+                if self.replica_conn is None or not self.replica_conn.is_connected():
+                    self.replica_conn = mysql.connector.connect(**self.replica_config)
+                self._lag = replication_lag(self.replica_conn)
+                self._lag_checked = now
+            except mysql.connector.Error as err:
+                self.mark_replica_down()
+                return self.primary_conn, f'replica unavailable: {err}'
+
+        if self._lag is None:
+            return self.primary_conn, 'replica is not replicating'
+        if self._lag > self.max_lag:
+            return self.primary_conn, f'replica is {self._lag}s behind'
+        if self.last_write and self._lag_checked - self._lag - 1 < self.last_write:
+            return self.primary_conn, 'latest write may not be on the replica yet'
+        return self.replica_conn, f'replica is {self._lag}s behind'
+
+    def mark_replica_down(self):
+        if self.replica_conn is not None:
+            try:
+                self.replica_conn.close()
+            except mysql.connector.Error:
+                pass
+        self.replica_conn = None
+        self._lag = None
+        self._down_until = time.time() + self.retry_interval
+
+    def _read(self, query):
+        conn = self.connection()
+        try:
+            result = query(conn)
+            conn.commit()
+            return result
+        except mysql.connector.Error:
+            if conn is self.primary_conn:
+                raise
+            # The replica failed mid-query, the primary answers instead
+            self.mark_replica_down()
+            self.last_route = ('primary', 'replica failed during the query')
+        result = query(self.primary_conn)
+        self.primary_conn.commit()
+        return result
+
+    def run_report(self, name):
+        return self._read(lambda conn: run_report(conn, name))
+
+    def inventory_summary(self):
+        return self._read(inventory_summary)
+
+    def close(self):
+        if self.replica_conn is not None:
+            self.replica_conn.close()
+            self.replica_conn = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Read-replica routing check')
+    add_db_arguments(parser)
+    parser.add_argument('--replica-host', help='default: db_settings.REPLICA_DB_CONFIG')
+    parser.add_argument('--replica-port', type=int)
+    parser.add_argument('--max-lag', type=float, default=REPLICA_MAX_LAG_SECONDS)
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('status', help='measure the lag and show where reports would go')
+    commands.add_parser('summary')
+    report_parser = commands.add_parser('report')
+    report_parser.add_argument('name', choices=sorted(REPORTS))
+    args = parser.parse_args(argv)
+
+    db_config = db_config_from_args(args)
+    replica_config = get_replica_config()
+    if args.replica_host or args.replica_port:
+        replica_config = {**db_config, 'host': args.replica_host or db_config['host'],
+                          'port': args.replica_port or 3306}
+    primary_conn = mysql.connector.connect(**db_config)
+    router = ReadRouter(primary_conn, replica_config, args.max_lag)
+    try:
+        if args.command == 'status':
+            router.connection()
+        elif args.command == 'summary':
+            for label, value in router.inventory_summary():
+                print(f'{label}: {value}')
+        else:
+            for row in router.run_report(args.name):
+                print('\t'.join(str(value) for value in row))
+        target, reason = router.last_route
+        print(f'Routed to {target} ({reason})')
+    finally:
+        router.close()
+        primary_conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,314 @@
+# Rebalancing planner that proposes inter-warehouse transfers
+# pip install mysql-connector-python
+#
+# Every warehouse should sit inside a band around the global space
+# utilisation: target = total used shelf space / total capacity, and a
+# warehouse is balanced while its own utilisation is within target +- band.
+# Only the space needed to bring each warehouse back into its band is moved:
+#   - warehouses above the band shed space down to the upper edge,
+#   - warehouses below the band are filled up to the lower edge,
+#   - if one side needs more than the other, the rest is placed in (or taken
+#     from) balanced warehouses, never pushing them out of their own band.
+# Inside a donor warehouse, products the receiver is already pulling in via
+# transfers and fast sellers are moved first, then bulky products (fewer units
+# for the same space). A donor keeps part of every product so nothing
+# disappears from a location that is selling it.
+#
+# The plan is written as 'Pending' WarehouseTransfers rows, which
+# `python transfer_engine.py --pending` executes.
+
+import argparse
+import heapq
+import itertools
+import math
+import sys
+import time
+
+import mysql.connector
+
+from db_settings import add_db_arguments, db_config_from_args
+
+
+class RebalanceState:
+    def __init__(self):
+        self.capacity = {}         # warehouse_id -> capacity
+        self.used_space = {}       # warehouse_id -> used shelf space
+        self.stock = {}            # warehouse_id -> {product_id: quantity}
+        self.shelf_space = {}      # product_id -> shelf space per unit
+        self.sales_velocity = {}   # product_id -> units sold per day
+        self.transfer_pull = {}    # (to_warehouse_id, product_id) -> units per day
+
+
+def plan_rebalance(state, band=0.1, keep_fraction=0.2, time_budget=None):
+    # Returns (transfers, complete). transfers is a list of
+    # (from_warehouse_id, to_warehouse_id, product_id, quantity); complete is
+    # False when the time budget ran out before every warehouse was handled.
+    deadline = None if time_budget is None else time.monotonic() + time_budget
+
+    total_capacity = sum(state.capacity.values())
+    if total_capacity <= 0:
+        return [], True
+    used = {wh: state.used_space.get(wh, 0) for wh in state.capacity}
+    target = sum(used.values()) / total_capacity
+    upper = {wh: math.floor((target + band) * cap) for wh, cap in state.capacity.items()}
+    lower = {wh: math.ceil(max(target - band, 0) * cap) for wh, cap in state.capacity.items()}
+
+    must_shed = {wh: used[wh] - upper[wh] for wh in used if used[wh] > upper[wh]}
+    must_fill = {wh: lower[wh] - used[wh] for wh in used if used[wh] < lower[wh]}
+    shed_total = sum(must_shed.values())
+    fill_total = sum(must_fill.values())
+
+    # Donors shed what they must and receivers take what they must. When one
+    # side needs more than the other, the difference is spread over the
+    # remaining warehouses on the right side of the target, least balanced
+    # first, without crossing the target.
+    give = dict(must_shed)
+    take = dict(must_fill)
+    ratio = {wh: used[wh] / max(state.capacity[wh], 1) for wh in used}
+    if fill_total > shed_total:
+        extra = fill_total - shed_total
+        for wh in sorted(used, key=ratio.get, reverse=True):
+            if extra <= 0:
+                break
+            if wh in must_fill:
+                continue
+            floor_space = max(lower[wh], math.ceil(target * state.capacity[wh]))
+            slack = used[wh] - give.get(wh, 0) - floor_space
+            if slack > 0:
+                give[wh] = give.get(wh, 0) + min(slack, extra)
+                extra -= min(slack, extra)
+    elif shed_total > fill_total:
+        extra = shed_total - fill_total
+        for wh in sorted(used, key=ratio.get):
+            if extra <= 0:
+                break
+            if wh in must_shed:
+                continue
+            ceiling = min(upper[wh], math.floor(target * state.capacity[wh]))
+            room = ceiling - used[wh] - take.get(wh, 0)
+            if room > 0:
+                take[wh] = take.get(wh, 0) + min(room, extra)
+                extra -= min(room, extra)
+    # Receivers are never pushed above their own upper edge.
+    room_left = {wh: max(upper[wh] - used[wh], 0) for wh in take}
+
+    donors = [(-amount, wh) for wh, amount in give.items() if amount > 0]
+    receivers = [(-amount, wh) for wh, amount in take.items() if amount > 0]
+    heapq.heapify(donors)
+    heapq.heapify(receivers)
+
+    stock = {wh: dict(products) for wh, products in state.stock.items()}
+    movable = {}
+    for wh, amount in give.items():
+        movable[wh] = {pid: qty - math.ceil(qty * keep_fraction)
+                       for pid, qty in stock.get(wh, {}).items()}
+
+    # Sorted once, not on every pairing: each donor's products fastest seller
+    # and bulkiest first, with a cursor past the ones it has run out of, and
+    # per receiver the products it pulls in, most pulled first.
+    def priority(pid):
+        return (state.sales_velocity.get(pid, 0), state.shelf_space.get(pid, 0))
+
+    order = {wh: sorted((pid for pid, qty in products.items() if qty > 0),
+                        key=priority, reverse=True)
+             for wh, products in movable.items()}
+    position = dict.fromkeys(order, 0)
+    pulled = {}
+    for (wh, pid), pull in state.transfer_pull.items():
+        if pull > 0:
+            pulled.setdefault(wh, []).append(pid)
+    for wh, pids in pulled.items():
+        pids.sort(key=lambda pid, wh=wh: (state.transfer_pull[(wh, pid)], priority(pid)),
+                  reverse=True)
+
+    transfers = []
+    complete = True
+    while donors and receivers:
+        if deadline is not None and time.monotonic() > deadline:
+            complete = False
+            break
+        give_amount, donor = heapq.heappop(donors)
+        take_amount, receiver = heapq.heappop(receivers)
+        space = min(-give_amount, -take_amount, room_left[receiver])
+        if space <= 0:
+            heapq.heappush(donors, (give_amount, donor))
+            continue
+
+        donor_order = order[donor]
+        start = position[donor]
+        while start < len(donor_order) and movable[donor][donor_order[start]] <= 0:
+            start += 1
+        position[donor] = start
+        candidates = itertools.chain(
+            pulled.get(receiver, ()),
+            (pid for pid in itertools.islice(donor_order, start, None)
+             if state.transfer_pull.get((receiver, pid), 0) <= 0))
+        moved = _move_space(state, movable[donor], candidates, stock, donor, receiver,
+                            space, transfers)
+        if moved == 0:
+            # Nothing in this donor fits the receiver. Drop the smaller of
+            # the two and pair the other one again.
+            if -give_amount < -take_amount:
+                heapq.heappush(receivers, (take_amount, receiver))
+            else:
+                heapq.heappush(donors, (give_amount, donor))
+            continue
+
+        room_left[receiver] -= moved
+        if -give_amount - moved > 0:
+            heapq.heappush(donors, (give_amount + moved, donor))
+        if -take_amount - moved > 0 and room_left[receiver] > 0:
+            heapq.heappush(receivers, (take_amount + moved, receiver))
+
+    return transfers, complete
+
+
+def _move_space(state, movable, candidates, stock, donor, receiver, space, transfers):
+    # Move about `space` units of shelf space from donor to receiver without
+    # exceeding it, trying products in the order of `candidates`. Returns the
+    # space actually moved.
+    moved = 0
+    for pid in candidates:
+        unit = state.shelf_space.get(pid) or 0
+        if unit <= 0 or unit > space - moved or movable.get(pid, 0) <= 0:
+            continue
+        quantity = min(movable[pid], (space - moved) // unit)
+        if quantity <= 0:
+            continue
+        movable[pid] -= quantity
+        stock[donor][pid] -= quantity
+        stock.setdefault(receiver, {})
+        stock[receiver][pid] = stock[receiver].get(pid, 0) + quantity
+        transfers.append((donor, receiver, pid, quantity))
+        moved += quantity * unit
+        if moved >= space:
+            break
+    return moved
+
+
+class RebalancePlanner:
+    def __init__(self, conn, db_config):
+        self.conn = conn
+        self.db_config = db_config
+
+    def load_state(self, window_days=90):
+        state = RebalanceState()
+        cursor = self.conn.cursor()
+
+        cursor.execute('SELECT warehouse_id, capacity FROM Warehouses;')
+        state.capacity = {wh: cap or 0 for wh, cap in cursor.fetchall()}
+
+        cursor.execute('SELECT product_id, shelf_space FROM Products;')
+        state.shelf_space = {pid: space or 0 for pid, space in cursor.fetchall()}
+
+        cursor.execute('''
+            SELECT warehouse_id, product_id, SUM(quantity)
+            FROM Inventory
+            GROUP BY warehouse_id, product_id
+            HAVING SUM(quantity) > 0;
+        ''')
+        for wh, pid, quantity in cursor.fetchall():
+            state.stock.setdefault(wh, {})[pid] = int(quantity)
+
+        # Transfers that are already queued count as done, so running the
+        # planner twice does not plan the same moves twice.
+        cursor.execute('''
+            SELECT from_warehouse_id, to_warehouse_id, product_id, quantity
+            FROM WarehouseTransfers
+            WHERE status = 'Pending';
+        ''')
+        for from_wh, to_wh, pid, quantity in cursor.fetchall():
+            source = state.stock.setdefault(from_wh, {})
+            source[pid] = max(source.get(pid, 0) - quantity, 0)
+            dest = state.stock.setdefault(to_wh, {})
+            dest[pid] = dest.get(pid, 0) + quantity
+
+        for wh, products in state.stock.items():
+            state.used_space[wh] = sum(
+                quantity * state.shelf_space.get(pid, 0) for pid, quantity in products.items())
+
+        # Velocities are measured back from the latest recorded activity so
+        # that historical data sets still produce a signal.
+        cursor.execute('''
+            SELECT d.product_id, SUM(d.quantity)
+            FROM SalesOrderDetails d
+            JOIN SalesOrders o ON d.order_id = o.order_id
+            WHERE o.order_date >= (SELECT MAX(order_date) FROM SalesOrders) - INTERVAL %s DAY
+            GROUP BY d.product_id;
+        ''', (window_days,))
+        state.sales_velocity = {pid: float(qty) / window_days for pid, qty in cursor.fetchall()}
+
+        cursor.execute('''
+            SELECT to_warehouse_id, product_id, SUM(quantity)
+            FROM WarehouseTransfers
+            WHERE status = 'Completed'
+              AND transfer_date >= (SELECT MAX(transfer_date) FROM WarehouseTransfers) - INTERVAL %s DAY
+            GROUP BY to_warehouse_id, product_id;
+        ''', (window_days,))
+        state.transfer_pull = {(wh, pid): float(qty) / window_days
+                               for wh, pid, qty in cursor.fetchall()}
+
+        cursor.close()
+        self.conn.commit()
+        return state
+
+    def write_plan(self, transfers):
+        cursor = self.conn.cursor()
+        try:
+            cursor.executemany('''
+                INSERT INTO WarehouseTransfers
+                    (from_warehouse_id, to_warehouse_id, product_id, quantity, transfer_date, status)
+                VALUES (%s, %s, %s, %s, CURDATE(), 'Pending');
+            ''', transfers)
+            cursor.execute('''
+                INSERT INTO Alerts (entity_type, entity_id, message, alert_date)
+                VALUES ('WarehouseTransfer', NULL, %s, NOW());
+            ''', (f'Rebalancing plan queued: {len(transfers)} pending transfers.',))
+            self.conn.commit()
+        except mysql.connector.Error:
+            self.conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Propose inter-warehouse rebalancing transfers')
+    add_db_arguments(parser)
+    parser.add_argument('--band', type=float, default=0.1,
+                        help='allowed utilisation distance from the target, e.g. 0.1 = 10 points')
+    parser.add_argument('--keep', type=float, default=0.2,
+                        help='fraction of each product a donor warehouse keeps')
+    parser.add_argument('--window-days', type=int, default=90)
+    parser.add_argument('--time-budget', type=float, default=30.0,
+                        help='seconds the solver may spend')
+    parser.add_argument('--apply', action='store_true',
+                        help='write the plan as Pending WarehouseTransfers rows')
+    args = parser.parse_args(argv)
+
+    db_config = db_config_from_args(args)
+    conn = mysql.connector.connect(**db_config)
+    planner = RebalancePlanner(conn, db_config)
+    try:
+        state = planner.load_state(args.window_days)
+        start = time.perf_counter()
+        transfers, complete = plan_rebalance(state, args.band, args.keep, args.time_budget)
+        elapsed = time.perf_counter() - start
+
+        for from_wh, to_wh, pid, quantity in transfers:
+            print(f'Warehouse {from_wh} -> {to_wh}: product {pid} x {quantity}')
+        moved = sum(q * state.shelf_space.get(p, 0) for _, _, p, q in transfers)
+        print(f'{len(transfers)} transfers, {moved} shelf space moved, planned in {elapsed:.2f}s')
+        if not complete:
+            print('Time budget reached, plan is partial.')
+
+        if args.apply and transfers:
+            planner.write_plan(transfers)
+            print('Plan written as Pending transfers.')
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,493 @@
+# Inventory reconciliation against purchase, sales and transfer records
+# pip install mysql-connector-python
+#
+# A purchase order can add its stock twice: trg_after_insert_purchase_order_details
+# puts it in warehouse 1 and create_purchase_order / InventoryService.purchase
+# insert it again into the warehouses with room, and since Inventory has no
+# unique key their ON DUPLICATE KEY UPDATE never fires, so the same warehouse
+# and product can end up on several rows. Changes made outside the write paths
+# (the movement triggers dropped, a manual import) are not in the ledger at all.
+#
+# The checker works out, per warehouse and product, how much should be on hand
+# from the documents, in one pass over InventoryMovements:
+#   - it starts from the opening snapshot (or --snapshot) and adds every
+#     movement after it, which gives the ledger stock;
+#   - movements are read ordered by source document and product, so the
+#     movements of one purchase order, sales order or transfer arrive together
+#     and are compared with what the document records: PurchaseOrderDetails
+#     for a purchase order (by Catalog product), SalesOrderDetails for a sales
+#     order, the WarehouseTransfers row for each leg of a 'Completed' transfer
+#     (any other status must not have moved stock);
+#   - what a document moved beyond its records is excess and is taken out of
+#     the warehouses of its earliest movements first; the trigger's warehouse 1
+#     receipt is written before the allocating insert of the same order.
+#     Documents without detail rows (sales through process_sales_order alone)
+#     are counted as undocumented and trusted;
+#   - earlier corrections by this tool (source 'Reconciliation') are left out
+#     of the expected stock, they only ever made Inventory match it.
+# Expected stock is then diffed against Inventory, read in the same consistent
+# snapshot, together with duplicate rows and shelf space that is not
+# quantity x Products.shelf_space. A pair keeps one row per catalog entry
+# (purchases and transfers do), so only rows that share a catalog_id are
+# duplicates.
+#
+#   python reconciliation.py
+#   python reconciliation.py --fix --batch-size 200
+#
+# --fix applies the corrections in transactions of --batch-size pairs. Each
+# pair's rows are locked, rows sharing a catalog_id are merged into the lowest
+# inventory_id of them, and the pair is moved by the difference found, so
+# sales made since the check are kept. A shortfall is added to the pair's
+# first row, an excess is taken from its rows in inventory_id order. The corrections
+# are recorded in the ledger as adjustments with source 'Reconciliation' and
+# in Alerts.
+
+import argparse
+import sys
+import time
+from collections import namedtuple
+
+import mysql.connector
+
+from db_settings import add_db_arguments, db_config_from_args
+from movement_ledger import (
+    MOVEMENT_ADJUSTMENT, MOVEMENT_RECEIPT, MOVEMENT_SALE, MOVEMENT_TRANSFER_IN,
+    MOVEMENT_TRANSFER_OUT, LedgerError, clear_movement_source, set_movement_source)
+
+
+RECONCILIATION_SOURCE = 'Reconciliation'
+
+CAUSE_DUPLICATE_ROWS = 'duplicate rows'
+CAUSE_EXCESS = 'excess'
+CAUSE_UNTRACKED = 'untracked'
+CAUSE_SHELF_SPACE = 'shelf space'
+
+# warehouse_id, product_id; quantities summed over the pair's Inventory rows,
+# duplicates counts the rows beyond one per catalog_id.
+# causes: [(cause, detail)]
+Discrepancy = namedtuple(
+    'Discrepancy',
+    'warehouse_id product_id actual ledger expected rows duplicates shelf_space '
+    'expected_shelf_space causes')
+
+
+def _stream(cursor, batch_size):
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield from rows
+
+
+class Reconciliation:
+    def __init__(self):
+        self.stock = {}        # (warehouse_id, product_id) -> ledger quantity
+        self.excess = {}       # (warehouse_id, product_id) -> moved beyond the documents
+        self.corrections = {}  # (warehouse_id, product_id) -> earlier reconciliation changes
+        self.causes = {}       # (warehouse_id, product_id) -> [(cause, detail)]
+        self.receipts = {}     # (po_id, product_id) -> quantity
+        self.sales = {}        # (order_id, product_id) -> quantity
+        self.transfers = {}    # transfer_id -> (from_warehouse_id, to_warehouse_id, product_id, quantity)
+        self.stats = {'movements': 0, 'documents': 0, 'undocumented': 0, 'short': 0}
+
+    # ---------------------------- loading --------------------------------
+
+    def load_documents(self, cursor, batch_size):
+        cursor.execute('''
+            SELECT pod.po_id, c.product_id, SUM(pod.quantity)
+            FROM PurchaseOrderDetails pod
+            JOIN Catalog c ON c.catalog_id = pod.catalog_id
+            JOIN PurchaseOrders po ON po.po_id = pod.po_id
+            WHERE po.status IS NULL OR po.status <> 'Rejected'
+            GROUP BY pod.po_id, c.product_id;
+        ''')
+        for po_id, product_id, quantity in _stream(cursor, batch_size):
+            self.receipts[(po_id, product_id)] = int(quantity or 0)
+        cursor.execute('''
+            SELECT order_id, product_id, SUM(quantity)
+            FROM SalesOrderDetails
+            GROUP BY order_id, product_id;
+        ''')
+        for order_id, product_id, quantity in _stream(cursor, batch_size):
+            self.sales[(order_id, product_id)] = int(quantity or 0)
+        cursor.execute('''
+            SELECT transfer_id, from_warehouse_id, to_warehouse_id, product_id,
+                   IF(status = 'Completed', quantity, 0)
+            FROM WarehouseTransfers;
+        ''')
+        for transfer_id, from_wh, to_wh, product_id, quantity in _stream(cursor, batch_size):
+            self.transfers[transfer_id] = (from_wh, to_wh, product_id, int(quantity or 0))
+
+    def load_opening(self, cursor, snapshot_id=None):
+        # Returns the last movement id the snapshot covers
+        if snapshot_id is None:
+            cursor.execute('''
+                SELECT snapshot_id, last_movement_id FROM InventorySnapshots
+                ORDER BY last_movement_id, snapshot_id LIMIT 1;
+            ''')
+        else:
+            cursor.execute('''
+                SELECT snapshot_id, last_movement_id FROM InventorySnapshots
+                WHERE snapshot_id = %s;
+            ''', (snapshot_id,))
+        row = cursor.fetchone()
+        if row is None:
+            raise LedgerError('No opening snapshot, run Inventory_procedures.sql')
+        snapshot_id, last_movement_id = row
+        cursor.execute('''
+            SELECT warehouse_id, product_id, quantity
+            FROM InventorySnapshotLines WHERE snapshot_id = %s;
+        ''', (snapshot_id,))
+        for warehouse_id, product_id, quantity in cursor.fetchall():
+            self.stock[(warehouse_id, product_id)] = quantity
+        return last_movement_id
+
+    # ---------------------------- movements ------------------------------
+
+    def _documented(self, source_type, source_id, product_id, movement_type):
+        # (sign, quantity the document moved), or None when it has no record
+        if source_type == 'PurchaseOrder' and movement_type == MOVEMENT_RECEIPT:
+            quantity = self.receipts.get((source_id, product_id))
+            return None if quantity is None else (1, quantity)
+        if source_type == 'SalesOrder' and movement_type == MOVEMENT_SALE:
+            quantity = self.sales.get((source_id, product_id))
+            return None if quantity is None else (-1, quantity)
+        if source_type == 'WarehouseTransfer' and movement_type in (MOVEMENT_TRANSFER_IN,
+                                                                    MOVEMENT_TRANSFER_OUT):
+            transfer = self.transfers.get(source_id)
+            if transfer is None:
+                return None
+            if transfer[2] != product_id:
+                return (1, 0) if movement_type == MOVEMENT_TRANSFER_IN else (-1, 0)
+            if movement_type == MOVEMENT_TRANSFER_IN:
+                return (1, transfer[3])
+            return (-1, transfer[3])
+        return None
+
+    def _check_group(self, key, movements):
+        # movements: [(warehouse_id, quantity_change)] of one document, product
+        # and movement type, oldest first
+        source_type, source_id, product_id, movement_type = key
+        if source_type == RECONCILIATION_SOURCE:
+            for warehouse_id, change in movements:
+                pair = (warehouse_id, product_id)
+                self.corrections[pair] = self.corrections.get(pair, 0) + change
+            return
+        if source_type is None or movement_type == MOVEMENT_ADJUSTMENT:
+            return
+        documented = self._documented(source_type, source_id, product_id, movement_type)
+        if documented is None:
+            self.stats['undocumented'] += 1
+            return
+        self.stats['documents'] += 1
+        sign, quantity = documented
+        moved = sign * sum(change for _, change in movements)
+        if moved < quantity:
+            self.stats['short'] += 1
+            return
+        remaining = moved - quantity
+        for warehouse_id, change in movements:
+            if remaining <= 0:
+                break
+            if sign * change <= 0:
+                continue
+            taken = min(sign * change, remaining)
+            remaining -= taken
+            pair = (warehouse_id, product_id)
+            self.excess[pair] = self.excess.get(pair, 0) + sign * taken
+            self.causes.setdefault(pair, []).append(
+                (CAUSE_EXCESS, f'{movement_type} {source_type} {source_id} {sign * taken:+d}'))
+
+    def scan_movements(self, cursor, after_movement_id, batch_size):
+        cursor.execute('''
+            SELECT source_type, source_id, product_id, movement_type, warehouse_id, quantity_change
+            FROM InventoryMovements
+            WHERE movement_id > %s
+            ORDER BY source_type, source_id, product_id, movement_type, movement_id;
+        ''', (after_movement_id,))
+        group_key = None
+        group = []
+        stock = self.stock
+        for source_type, source_id, product_id, movement_type, warehouse_id, change in \
+                _stream(cursor, batch_size):
+            pair = (warehouse_id, product_id)
+            stock[pair] = stock.get(pair, 0) + change
+            key = (source_type, source_id, product_id, movement_type)
+            if key != group_key:
+                if group:
+                    self._check_group(group_key, group)
+                group_key, group = key, []
+            group.append((warehouse_id, change))
+            self.stats['movements'] += 1
+        if group:
+            self._check_group(group_key, group)
+
+    # ---------------------------- diff -----------------------------------
+
+    def expected(self, pair):
+        return (self.stock.get(pair, 0) - self.excess.get(pair, 0)
+                - self.corrections.get(pair, 0))
+
+    def diff(self, inventory_rows):
+        # inventory_rows: [(warehouse_id, product_id, quantity, rows, duplicates,
+        # shelf_space, shelf space per unit)]
+        found = []
+        seen = set()
+        for warehouse_id, product_id, quantity, rows, duplicates, shelf_space, unit_space \
+                in inventory_rows:
+            pair = (warehouse_id, product_id)
+            seen.add(pair)
+            found.append(self._discrepancy(pair, int(quantity or 0), int(rows), int(duplicates),
+                                           int(shelf_space or 0), unit_space or 0))
+        for pair in self.stock.keys() - seen:
+            found.append(self._discrepancy(pair, 0, 0, 0, 0, None))
+        return sorted((d for d in found if d.causes),
+                      key=lambda d: (-abs(d.expected - d.actual), d.warehouse_id, d.product_id))
+
+    def _discrepancy(self, pair, actual, rows, duplicates, shelf_space, unit_space):
+        ledger = self.stock.get(pair, 0)
+        expected = self.expected(pair)
+        causes = list(self.causes.get(pair, ())) if expected != actual else []
+        if actual != ledger:
+            causes.append((CAUSE_UNTRACKED, f'{actual - ledger:+d} not in the ledger'))
+        if duplicates:
+            causes.append((CAUSE_DUPLICATE_ROWS,
+                           f'{rows} rows, {duplicates} sharing a catalog entry'))
+        expected_shelf_space = None
+        if unit_space is not None:
+            expected_shelf_space = max(expected, 0) * unit_space
+            if rows and shelf_space != actual * unit_space:
+                causes.append((CAUSE_SHELF_SPACE,
+                               f'{shelf_space} for {actual} x {unit_space}'))
+        return Discrepancy(pair[0], pair[1], actual, ledger, expected, rows, duplicates,
+                           shelf_space, expected_shelf_space, causes)
+
+
+def _read_inventory(cursor):
+    # Grouped by catalog entry first: the rows of a pair beyond one per
+    # catalog_id are the duplicates
+    cursor.execute('''
+        SELECT g.warehouse_id, g.product_id, SUM(g.quantity), SUM(g.row_count),
+               SUM(g.row_count) - COUNT(*), SUM(g.shelf_space), MAX(p.shelf_space)
+        FROM (
+            SELECT warehouse_id, product_id, catalog_id,
+                   SUM(IFNULL(quantity, 0)) AS quantity, COUNT(*) AS row_count,
+                   SUM(IFNULL(shelf_space, 0)) AS shelf_space
+            FROM Inventory
+            GROUP BY warehouse_id, product_id, catalog_id
+        ) g
+        LEFT JOIN Products p ON p.product_id = g.product_id
+        GROUP BY g.warehouse_id, g.product_id;
+    ''')
+    return cursor.fetchall()
+
+
+def reconcile(conn, snapshot_id=None, batch_size=10000):
+    # Returns ([Discrepancy], stats). Documents, Inventory and the ledger are
+    # read in one consistent snapshot.
+    start = time.perf_counter()
+    check = Reconciliation()
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction(consistent_snapshot=True, isolation_level='REPEATABLE READ',
+                               readonly=True)
+        check.load_documents(cursor, batch_size)
+        after_movement_id = check.load_opening(cursor, snapshot_id)
+        inventory_rows = _read_inventory(cursor)
+        check.scan_movements(cursor, after_movement_id, batch_size)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    discrepancies = check.diff(inventory_rows)
+    check.stats['pairs'] = len(inventory_rows)
+    check.stats['seconds'] = time.perf_counter() - start
+    return discrepancies, check.stats
+
+
+def plan_pair_fix(rows, difference, catalog_id):
+    # Pure planning step of _fix_pair, no database access.
+    #   rows:       [(inventory_id, quantity, shelf_space, catalog_id)] of one
+    #               pair, in inventory_id order
+    #   difference: quantity to add (or take, when negative) over the pair
+    #   catalog_id: entry for a row that has none, unless the pair has a row
+    #               for it already
+    # Returns ({inventory_id: [quantity, catalog_id]} of the rows kept, in
+    # inventory_id order, [inventory_id] merged into them and to delete).
+    kept = {}
+    keep_ids = {}
+    extra_ids = []
+    for inventory_id, quantity, _, row_catalog_id in rows:
+        keep_id = keep_ids.get(row_catalog_id)
+        if keep_id is None:
+            keep_ids[row_catalog_id] = inventory_id
+            kept[inventory_id] = [quantity, row_catalog_id]
+        else:
+            kept[keep_id][0] += quantity
+            extra_ids.append(inventory_id)
+    if None in keep_ids and catalog_id not in keep_ids:
+        kept[keep_ids[None]][1] = catalog_id
+
+    if difference > 0:
+        next(iter(kept.values()))[0] += difference
+    remaining = -difference
+    for row in kept.values():
+        if remaining <= 0:
+            break
+        take = min(max(row[0], 0), remaining)
+        row[0] -= take
+        remaining -= take
+    return kept, extra_ids
+
+
+def _fix_pair(cursor, discrepancy):
+    # Returns (quantity before, quantity after), or None when the pair is
+    # left alone
+    warehouse_id, product_id = discrepancy.warehouse_id, discrepancy.product_id
+    cursor.execute('''
+        SELECT inventory_id, IFNULL(quantity, 0), IFNULL(shelf_space, 0), catalog_id
+        FROM Inventory
+        WHERE warehouse_id = %s AND product_id = %s
+        ORDER BY inventory_id
+        FOR UPDATE;
+    ''', (warehouse_id, product_id))
+    rows = cursor.fetchall()
+    current = sum(row[1] for row in rows)
+    # Applied as a difference, so changes committed since the check are kept
+    target = current + discrepancy.expected - discrepancy.actual
+    if target < 0:
+        return None
+    cursor.execute('SELECT IFNULL(shelf_space, 0) FROM Products WHERE product_id = %s;',
+                   (product_id,))
+    row = cursor.fetchone()
+    unit_space = row[0] if row else 0
+    # Reports and valuation join Inventory to Catalog, so a row needs a
+    # catalog entry to be seen: the cheapest supplier's, as a purchase would
+    cursor.execute('''
+        SELECT catalog_id FROM Catalog
+        WHERE product_id = %s
+        ORDER BY price, catalog_id
+        LIMIT 1;
+    ''', (product_id,))
+    row = cursor.fetchone()
+    catalog_id = row[0] if row else None
+    if rows:
+        # Each catalog entry keeps its row, so the supplier and cost of the
+        # stock stay known
+        kept, extra_ids = plan_pair_fix(rows, target - current, catalog_id)
+        for inventory_id, quantity, shelf_space, row_catalog_id in rows:
+            if inventory_id not in kept:
+                continue
+            new_quantity, new_catalog_id = kept[inventory_id]
+            if (new_quantity, new_quantity * unit_space, new_catalog_id) != \
+                    (quantity, shelf_space, row_catalog_id):
+                cursor.execute('''
+                    UPDATE Inventory
+                    SET quantity = %s, shelf_space = %s, catalog_id = %s
+                    WHERE inventory_id = %s;
+                ''', (new_quantity, new_quantity * unit_space, new_catalog_id, inventory_id))
+        if extra_ids:
+            cursor.execute(f'''
+                DELETE FROM Inventory
+                WHERE inventory_id IN ({', '.join(['%s'] * len(extra_ids))});
+            ''', tuple(extra_ids))
+    elif target:
+        cursor.execute('''
+            INSERT INTO Inventory (warehouse_id, product_id, quantity, shelf_space, catalog_id)
+            VALUES (%s, %s, %s, %s, %s);
+        ''', (warehouse_id, product_id, target, target * unit_space, catalog_id))
+    else:
+        return None
+    cursor.execute('''
+        INSERT INTO Alerts (entity_type, entity_id, message, alert_date)
+        VALUES ('Inventory', %s, %s, NOW());
+    ''', (product_id, f'Reconciliation set product ID {product_id} in warehouse ID '
+                      f'{warehouse_id} from {current} to {target}'))
+    return current, target
+
+
+def apply_fixes(conn, discrepancies, batch_size=200, on_batch=None):
+    # Returns (pairs fixed, pairs skipped). Pairs are locked in key order so
+    # concurrent fix runs cannot deadlock on each other.
+    todo = sorted(discrepancies, key=lambda d: (d.warehouse_id, d.product_id))
+    fixed = skipped = 0
+    cursor = conn.cursor()
+    try:
+        for start in range(0, len(todo), batch_size):
+            batch = todo[start:start + batch_size]
+            try:
+                conn.start_transaction()
+                set_movement_source(cursor, MOVEMENT_ADJUSTMENT, RECONCILIATION_SOURCE)
+                results = [_fix_pair(cursor, discrepancy) for discrepancy in batch]
+                clear_movement_source(cursor)
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                clear_movement_source(cursor)
+                raise
+            done = sum(1 for result in results if result is not None)
+            fixed += done
+            skipped += len(batch) - done
+            if on_batch:
+                on_batch(start + len(batch), len(todo))
+    finally:
+        cursor.close()
+    return fixed, skipped
+
+
+def print_report(discrepancies, stats, limit=None):
+    print(f"{stats['movements']} movements, {stats['documents']} document lines checked, "
+          f"{stats['undocumented']} undocumented, {stats['short']} short, "
+          f"{stats['pairs']} warehouse/product pairs in {stats['seconds']:.2f}s")
+    if not discrepancies:
+        print('Inventory matches the records.')
+        return
+    counts = {}
+    for discrepancy in discrepancies:
+        for cause in {cause for cause, _ in discrepancy.causes}:
+            counts[cause] = counts.get(cause, 0) + 1
+    print(f'{len(discrepancies)} pairs differ: '
+          + ', '.join(f'{cause} {count}' for cause, count in sorted(counts.items())))
+    print('Warehouse\tProduct\tInventory\tLedger\tExpected\tCauses')
+    for discrepancy in discrepancies[:limit]:
+        causes = '; '.join(f'{cause}: {detail}' for cause, detail in discrepancy.causes)
+        print(f'{discrepancy.warehouse_id}\t{discrepancy.product_id}\t{discrepancy.actual}\t'
+              f'{discrepancy.ledger}\t{discrepancy.expected}\t{causes}')
+    if limit is not None and len(discrepancies) > limit:
+        print(f'... {len(discrepancies) - limit} more')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Reconcile Inventory with the order and transfer records')
+    add_db_arguments(parser)
+    parser.add_argument('--snapshot', type=int,
+                        help='start from this ledger snapshot instead of the opening one')
+    parser.add_argument('--fix', action='store_true', help='correct Inventory')
+    parser.add_argument('--batch-size', type=int, default=200, help='pairs per fix transaction')
+    parser.add_argument('--fetch-size', type=int, default=10000, help='rows per fetch')
+    parser.add_argument('--limit', type=int, default=50, help='pairs to list')
+    args = parser.parse_args(argv)
+
+    conn = mysql.connector.connect(**db_config_from_args(args))
+    try:
+        discrepancies, stats = reconcile(conn, args.snapshot, args.fetch_size)
+        print_report(discrepancies, stats, args.limit)
+        if args.fix and discrepancies:
+            start = time.perf_counter()
+            fixed, skipped = apply_fixes(
+                conn, discrepancies, args.batch_size,
+                lambda done, total: print(f'Fixed {done}/{total}', flush=True))
+            print(f'{fixed} pairs corrected, {skipped} left alone '
+                  f'in {time.perf_counter() - start:.2f}s')
+    except (LedgerError, mysql.connector.Error) as err:
+        print(f'Error: {err}')
+        return 1
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
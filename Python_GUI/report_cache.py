@@ -0,0 +1,161 @@
+# Report result cache with write-driven invalidation
+#
+# Results are keyed by report name and parameters, bounded by an LRU size
+# and a TTL. Every report lists the tables it reads (REPORT_TABLES), and
+# the sale, purchase and transfer write paths bump per-table version
+# counters after they commit (bump_tables). An entry is fresh while the
+# versions it was loaded at are current and it is younger than the TTL.
+#
+# Stale-while-revalidate: a stale entry is still returned at once, and one
+# background refresh per key is started. Whoever asked can pass on_refresh
+# to receive the new rows when it finishes (called on the refresh thread).
+# Entries older than max_stale are reloaded synchronously instead.
+#
+# The version counters live in this process. Writes made by other
+# processes are only picked up when the TTL runs out; reports on Products
+# columns that only change outside the app (stock levels written by
+# forecasting.py --apply, prices edited in SQL) have a shorter one
+# (REPORT_TTL).
+
+import threading
+import time
+from collections import OrderedDict, defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+
+REPORT_TABLES = {
+    'products': ('Products',),
+    'stock_list': ('Inventory', 'Catalog', 'Products'),
+    'catalog': ('Catalog', 'Products', 'Suppliers'),
+    'orders': ('SalesOrders', 'SalesOrderDetails', 'Customers', 'Products'),
+    'most_transferred': ('WarehouseTransfers', 'Products'),
+    'monthly_changes': ('Inventory', 'WarehouseTransfers', 'Products'),
+    'monthly_movements': ('InventoryMovements', 'Products'),
+    'low_stock': ('Products', 'Inventory'),
+}
+
+# Seconds an entry of these reports stays fresh, if less than the cache TTL
+REPORT_TTL = {
+    'products': 60.0,
+    'low_stock': 60.0,
+}
+
+# Tables each write path changes
+SALE_TABLES = ('Inventory', 'InventoryMovements', 'Alerts', 'SalesOrders', 'SalesOrderDetails')
+PURCHASE_TABLES = ('Inventory', 'InventoryMovements', 'Alerts', 'PurchaseOrders',
+                   'PurchaseOrderDetails')
+TRANSFER_TABLES = ('Inventory', 'InventoryMovements', 'Alerts', 'WarehouseTransfers')
+
+_Entry = namedtuple('_Entry', 'rows versions loaded_at')
+
+
+class TableVersions:
+    def __init__(self):
+        self._versions = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def bump(self, *tables):
+        with self._lock:
+            for table in tables:
+                self._versions[table] += 1
+
+    def snapshot(self, tables):
+        with self._lock:
+            return tuple(self._versions[table] for table in tables)
+
+
+table_versions = TableVersions()
+
+
+def bump_tables(*tables):
+    table_versions.bump(*tables)
+
+
+class ReportCache:
+    def __init__(self, load, refresh_load=None, max_entries=32, ttl=300.0,
+                 max_stale=3600.0, versions=table_versions):
+        # load(name, *params) runs cache misses on the caller's thread,
+        # refresh_load (default: load) runs refreshes on the cache's thread.
+        self.load = load
+        self.refresh_load = refresh_load or load
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.versions = versions
+        self.stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'refreshes': 0}
+        self._entries = OrderedDict()
+        self._refreshing = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='report-refresh')
+
+    def get(self, name, params=(), on_refresh=None):
+        if name not in REPORT_TABLES:
+            return self.load(name, *params)
+        key = (name, tuple(params))
+        versions = self.versions.snapshot(REPORT_TABLES[name])
+        ttl = min(self.ttl, REPORT_TTL.get(name, self.ttl))
+        started = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                age = started - entry.loaded_at
+                if entry.versions == versions and age < ttl:
+                    self.stats['hits'] += 1
+                    return entry.rows
+                if age < self.max_stale:
+                    self.stats['stale_hits'] += 1
+                    self._schedule_refresh(key, on_refresh)
+                    return entry.rows
+            self.stats['misses'] += 1
+
+        rows = self.load(name, *params)
+        self._store(key, versions, rows, started)
+        return rows
+
+    def _schedule_refresh(self, key, on_refresh):
+        # Called with the lock held. Later callers of a refresh that is
+        # already running just wait for its result.
+        callbacks = self._refreshing.get(key)
+        if callbacks is None:
+            callbacks = self._refreshing[key] = []
+            self._executor.submit(self._refresh, key)
+        if on_refresh is not None:
+            callbacks.append(on_refresh)
+
+    def _refresh(self, key):
+        name, params = key
+        # Versions are read before the query, so a write that commits while
+        # it runs leaves the new entry stale.
+        versions = self.versions.snapshot(REPORT_TABLES[name])
+        started = time.monotonic()
+        try:
+            rows = self.refresh_load(name, *params)
+        except Exception as err:
+            with self._lock:
+                self._refreshing.pop(key, None)
+            print(f"Error: refreshing report {name} failed: {err}")
+            return
+        self._store(key, versions, rows, started)
+        with self._lock:
+            callbacks = self._refreshing.pop(key, [])
+            self.stats['refreshes'] += 1
+        for callback in callbacks:
+            callback(rows)
+
+    def _store(self, key, versions, rows, loaded_at):
+        with self._lock:
+            current = self._entries.get(key)
+            if current is not None and current.loaded_at > loaded_at:
+                return  # a newer load got there first
+            self._entries[key] = _Entry(rows, versions, loaded_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def close(self):
+        self._executor.shutdown(wait=False)
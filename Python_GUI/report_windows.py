@@ -0,0 +1,307 @@
+# Report dialogs opened from ProductApp
+#
+# Kept out of Inventory_management_app.py so that neither these classes nor
+# the report queries they use are loaded until a dialog is first opened.
+
+from PyQt5.QtCore import pyqtSignal  # type: ignore
+from PyQt5.QtWidgets import (  # type: ignore
+    QDialog, QLabel, QTableWidget, QTableWidgetItem, QVBoxLayout)
+
+from inventory_service import run_report
+from workload_capture import OP_REPORT, captured
+
+
+class ReportDialog(QDialog):
+    # Base of the dialogs that show one report in self.table. With a
+    # ReportCache the rows come from memory; if they were stale, the table
+    # is filled again when the background refresh brings the new rows.
+    refreshed = pyqtSignal(list)
+
+    def __init__(self, conn, db_config, reports=None):
+        super().__init__()
+        self.conn = conn
+        self.db_config = db_config
+        self.reports = reports
+        self.refreshed.connect(self.fill_table)
+        self.initUI()
+
+    def fetch(self, name):
+        with captured(OP_REPORT, {'name': name}):
+            if self.reports is None:
+                return run_report(self.conn, name)
+            return self.reports.get(name, on_refresh=self.emit_refreshed)
+
+    def emit_refreshed(self, rows):
+        # Runs on the cache's refresh thread, the signal hands the rows to
+        # the GUI thread. The dialog may have been closed and deleted by then.
+        try:
+            self.refreshed.emit(rows)
+        except RuntimeError:
+            pass
+
+    def fill_table(self, rows):
+        self.table.setRowCount(0)
+        for row in rows:
+            self.table.insertRow(self.table.rowCount())
+            for col, data in enumerate(row):
+                self.table.setItem(self.table.rowCount() - 1,
+                                   col, QTableWidgetItem(str(data)))
+
+
+class ProductListWindow(ReportDialog):
+    def initUI(self):
+        self.setWindowTitle('Product List')
+        self.setGeometry(200, 200, 1030, 1200)
+        layout = QVBoxLayout()
+
+        self.table = QTableWidget(self)
+        self.table.setColumnCount(7)
+        self.table.setHorizontalHeaderLabels(
+            ['ID', 'Name', 'Description', 'Market Price', 'Safe Stock Lv', 'Healthy Stock Lv', 'Shelf Space'])
+
+        # 设置每列的宽度
+        self.table.setColumnWidth(0, 50)   # ID列
+        self.table.setColumnWidth(1, 150)  # Name列
+        self.table.setColumnWidth(2, 300)  # Description列
+        self.table.setColumnWidth(3, 150)  # Selling Price列
+        self.table.setColumnWidth(4, 100)  # Safe Stock Level列
+        self.table.setColumnWidth(5, 100)  # Healthy Stock Level列
+        self.table.setColumnWidth(6, 100)  # Shelf Space列
+
+        self.load_products()
+
+        layout.addWidget(self.table)
+        self.setLayout(layout)
+
+    def load_products(self):
+        self.fill_table(self.fetch('products'))
+
+
+class StockListWindow(ReportDialog):
+    def initUI(self):
+        self.setWindowTitle('Stock List')
+        self.setGeometry(200, 200, 1000, 1200)
+        layout = QVBoxLayout()
+
+        self.table = QTableWidget(self)
+        self.table.setColumnCount(7)
+        self.table.setHorizontalHeaderLabels(
+            ['Product ID', 'Product Name', 'Warehouse ID', 'Quantity', 'Shelf Space', 'Catalog ID', 'Price'])
+
+        # 设置每列的宽度
+        self.table.setColumnWidth(0, 100)  # Product ID列
+        self.table.setColumnWidth(1, 150)  # Product Name列
+        self.table.setColumnWidth(2, 100)  # Warehouse ID列
+        self.table.setColumnWidth(3, 100)  # Quantity列
+        self.table.setColumnWidth(4, 100)  # Shelf Space列
+        self.table.setColumnWidth(5, 100)  # Catalog ID列
+        self.table.setColumnWidth(6, 100)  # Price列
+
+        self.load_stock()
+
+        layout.addWidget(self.table)
+        self.setLayout(layout)
+
+    def load_stock(self):
+        self.fill_table(self.fetch('stock_list'))
+
+
+class CatalogListWindow(ReportDialog):
+    def initUI(self):
+        self.setWindowTitle('Catalog List')
+        self.setGeometry(200, 200, 1050, 600)
+        layout = QVBoxLayout()
+
+        self.table = QTableWidget(self)
+        self.table.setColumnCount(6)
+        self.table.setHorizontalHeaderLabels(
+            ['ID', 'Product Name', 'Description', 'Supplier Name', 'Max Quantity', 'Selling Price'])
+
+        # 设置每列的宽度
+        self.table.setColumnWidth(0, 50)   # ID列
+        self.table.setColumnWidth(1, 150)  # Product Name列
+        self.table.setColumnWidth(2, 300)  # Description列
+        self.table.setColumnWidth(3, 150)  # Supplier Name列
+        self.table.setColumnWidth(4, 100)  # Max Quantity列
+        self.table.setColumnWidth(5, 200)  # Selling Price列
+
+        self.load_catalog()
+
+        layout.addWidget(self.table)
+        self.setLayout(layout)
+
+    def load_catalog(self):
+        self.fill_table(self.fetch('catalog'))
+
+
+class OrderListWindow(ReportDialog):
+    def initUI(self):
+        self.setWindowTitle('Order List')
+        self.setGeometry(200, 200, 1200, 600)
+        layout = QVBoxLayout()
+
+        self.table = QTableWidget(self)
+        self.table.setColumnCount(9)
+        self.table.setHorizontalHeaderLabels(['Order ID', 'Customer Name', 'Order Date',
+                                             'Total Price', 'Delivery Date', 'Status', 'Product Name', 'Quantity', 'Unit price'])
+
+        # 设置每列的宽度
+        self.table.setColumnWidth(0, 100)  # Order ID列
+        self.table.setColumnWidth(1, 150)  # Customer Name列
+        self.table.setColumnWidth(2, 100)  # Order Date列
+        self.table.setColumnWidth(3, 100)  # Total Price列
+        self.table.setColumnWidth(4, 100)  # Delivery Date列
+        self.table.setColumnWidth(5, 100)  # Status列
+        self.table.setColumnWidth(6, 150)  # Product Name列
+        self.table.setColumnWidth(7, 100)  # Quantity列
+        self.table.setColumnWidth(8, 100)  # Unit price列
+
+        self.load_orders()
+
+        layout.addWidget(self.table)
+        self.setLayout(layout)
+
+    def load_orders(self):
+        self.fill_table(self.fetch('orders'))
+
+
+class MostTransferredProductsWindow(ReportDialog):
+    def initUI(self):
+        self.setWindowTitle('Most Transferred Products')
+        self.setGeometry(200, 200, 800, 600)
+        layout = QVBoxLayout()
+
+        self.table = QTableWidget(self)
+        self.table.setColumnCount(4)
+        self.table.setHorizontalHeaderLabels(
+            ['Warehouse ID', 'Product ID', 'Total Transferred', 'Product Name'])
+
+        # 设置每列的宽度
+        self.table.setColumnWidth(0, 150)  # Warehouse ID列
+        self.table.setColumnWidth(1, 150)  # Product ID列
+        self.table.setColumnWidth(2, 150)  # Total Transferred列
+        self.table.setColumnWidth(3, 200)  # Product Name列
+
+        self.load_data()
+
+        layout.addWidget(self.table)
+        self.setLayout(layout)
+
+    def load_data(self):
+        self.fill_table(self.fetch('most_transferred'))
+
+
+class MonthlyInventoryChangesWindow(ReportDialog):
+    def initUI(self):
+        self.setWindowTitle('Monthly Inventory Changes')
+        self.setGeometry(200, 200, 1000, 600)
+        layout = QVBoxLayout()
+
+        self.table = QTableWidget(self)
+        self.table.setColumnCount(5)
+        self.table.setHorizontalHeaderLabels(
+            ['Warehouse ID', 'Product ID', 'Month and Year', 'Quantity Change', 'Product Name'])
+
+        # 设置每列的宽度
+        self.table.setColumnWidth(0, 150)  # Warehouse ID列
+        self.table.setColumnWidth(1, 150)  # Product ID列
+        self.table.setColumnWidth(2, 200)  # Month and Year列
+        self.table.setColumnWidth(3, 150)  # Quantity Change列
+        self.table.setColumnWidth(4, 200)  # Product Name列
+
+        self.load_data()
+
+        layout.addWidget(self.table)
+        self.setLayout(layout)
+
+    def load_data(self):
+        self.fill_table(self.fetch('monthly_changes'))
+
+
+class LowStockProductsWindow(ReportDialog):
+    def initUI(self):
+        self.setWindowTitle('Low Stock Products')
+        self.setGeometry(200, 200, 1000, 600)
+        layout = QVBoxLayout()
+
+        self.table = QTableWidget(self)
+        self.table.setColumnCount(5)
+        self.table.setHorizontalHeaderLabels(
+            ['Product ID', 'Product Name', 'Safe Stock Level', 'Current Stock', 'Restock Needed'])
+
+        # 设置每列的宽度
+        self.table.setColumnWidth(0, 150)  # Product ID列
+        self.table.setColumnWidth(1, 200)  # Product Name列
+        self.table.setColumnWidth(2, 150)  # Safe Stock Level列
+        self.table.setColumnWidth(3, 150)  # Current Stock列
+        self.table.setColumnWidth(4, 150)  # Restock Needed列
+
+        self.load_data()
+
+        layout.addWidget(self.table)
+        self.setLayout(layout)
+
+    def load_data(self):
+        self.fill_table(self.fetch('low_stock'))
+
+
+class InventoryValuationWindow(QDialog):
+    def __init__(self, conn, db_config, reports=None):
+        # Computed from the raw arrays on every open, not cached
+        super().__init__()
+        self.conn = conn
+        self.db_config = db_config
+        self.initUI()
+
+    def initUI(self):
+        self.setWindowTitle('Inventory Valuation')
+        self.setGeometry(200, 200, 1000, 900)
+        layout = QVBoxLayout()
+
+        self.summary_label = QLabel(self)
+        layout.addWidget(self.summary_label)
+
+        self.warehouse_table = QTableWidget(self)
+        self.warehouse_table.setColumnCount(5)
+        self.warehouse_table.setHorizontalHeaderLabels(
+            ['Warehouse ID', 'Units', 'Value at Cost', 'Value at Price', 'Space Used %'])
+        self.warehouse_table.setFixedHeight(220)
+
+        self.table = QTableWidget(self)
+        self.table.setColumnCount(7)
+        self.table.setHorizontalHeaderLabels(
+            ['Product ID', 'Product Name', 'On Hand', 'Average Cost', 'Stock Value',
+             'Stock Age (days)', 'Turnover'])
+
+        # 设置每列的宽度
+        self.table.setColumnWidth(0, 100)  # Product ID列
+        self.table.setColumnWidth(1, 200)  # Product Name列
+        self.table.setColumnWidth(2, 100)  # On Hand列
+        self.table.setColumnWidth(3, 120)  # Average Cost列
+        self.table.setColumnWidth(4, 150)  # Stock Value列
+        self.table.setColumnWidth(5, 150)  # Stock Age列
+        self.table.setColumnWidth(6, 100)  # Turnover列
+
+        self.load_data()
+
+        layout.addWidget(self.warehouse_table)
+        layout.addWidget(self.table)
+        self.setLayout(layout)
+
+    def load_data(self):
+        # numpy is only needed for this report, so import it on demand
+        from analytics import InventoryAnalytics, load_arrays
+
+        analytics = InventoryAnalytics(load_arrays(self.conn))
+        self.summary_label.setText(
+            f'As of {analytics.as_of}    Total units: {analytics.total_units:.0f}    '
+            f'Total value at cost: {analytics.total_value:,.2f}')
+
+        for table, rows in ((self.warehouse_table, analytics.warehouse_rows()),
+                            (self.table, analytics.product_rows())):
+            table.setRowCount(0)
+            for row in rows:
+                table.insertRow(table.rowCount())
+                for col, data in enumerate(row):
+                    table.setItem(table.rowCount() - 1,
+                                  col, QTableWidgetItem(str(data)))
@@ -0,0 +1,255 @@
+# Local JSON-RPC server in front of InventoryService
+# pip install mysql-connector-python
+#
+#   python service_server.py --port 8765 --pool-size 16
+#   python service_server.py --capture workload.jsonl.gz   (see workload_replay.py)
+#
+# Requests are JSON-RPC 2.0 objects (or batches of them) sent as
+# HTTP POST /rpc:
+#
+#   {"jsonrpc": "2.0", "id": 1, "method": "stock", "params": {"product_id": 8}}
+#
+# Methods
+#   place_sales_order   customer_id, lines=[[product_id, quantity], ...], delivery_date,
+#                       reservation_ids (the cart's reservations, used up by the order)
+#   price_order         lines=[[product_id, quantity], ...], on_date (YYYY-MM-DD)
+#   sell                order_id, product_id, quantity, reservation_id (used up by the sale)
+#   purchase            product_id, quantity
+#   transfer            transfers=[[from_warehouse_id, to_warehouse_id, product_id, quantity], ...]
+#   stock               product_id
+#   availability        product_ids, warehouses (default false)
+#   reserve             product_id, quantity, ttl (seconds, default 900). Held against
+#                       this server's sales that do not pass the reservation's id
+#   release             reservation_id
+#   report              name (one of report_names)
+#   report_names
+#   inventory_summary
+#
+# The server runs on one asyncio loop; the blocking database work of each
+# request runs in a thread pool as large as the connection pool, so up to
+# pool-size handlers run concurrently while the loop keeps accepting.
+
+import argparse
+import asyncio
+import datetime
+import decimal
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import mysql.connector
+
+from db_settings import add_db_arguments, db_config_from_args
+from inventory_service import InventoryService, ServiceError
+from workload_capture import start_capture, stop_capture
+
+
+# JSON-RPC error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+SERVICE_ERROR = -32000
+DATABASE_ERROR = -32001
+
+MAX_BODY = 16 * 1024 * 1024
+
+
+def _json_default(value):
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8', 'replace')
+    raise TypeError(f'Cannot serialise {type(value).__name__}')
+
+
+def _rows(rows):
+    return [list(row) for row in rows]
+
+
+class ServiceDispatcher:
+    # Maps JSON-RPC method names onto InventoryService calls.
+
+    def __init__(self, service):
+        self.service = service
+        self.methods = {
+            'place_sales_order': lambda p: service.place_sales_order(
+                p['customer_id'], p['lines'], p.get('delivery_date'),
+                [int(rid) for rid in p.get('reservation_ids') or ()]),
+            'price_order': lambda p: service.price_order(
+                [(int(pid), int(qty)) for pid, qty in p['lines']],
+                datetime.date.fromisoformat(p['on_date']) if p.get('on_date') else None),
+            'sell': lambda p: service.sell(
+                p['order_id'], p['product_id'], p['quantity'],
+                int(p['reservation_id']) if p.get('reservation_id') is not None else None),
+            'purchase': lambda p: service.purchase(p['product_id'], p['quantity']),
+            'transfer': lambda p: service.transfer(p['transfers']),
+            'stock': lambda p: service.stock(p['product_id']),
+            'availability': lambda p: service.availability(
+                [int(pid) for pid in p['product_ids']], bool(p.get('warehouses'))),
+            'reserve': lambda p: service.reserve(
+                int(p['product_id']), int(p['quantity']), float(p.get('ttl', 900.0))),
+            'release': lambda p: service.release(int(p['reservation_id'])),
+            'report': lambda p: _rows(service.report(p['name'])),
+            'report_names': lambda p: service.report_names(),
+            'inventory_summary': lambda p: [list(item) for item in service.inventory_summary()],
+        }
+
+    def call(self, request):
+        # Runs in a worker thread. Returns a JSON-RPC response dict, or None
+        # for notifications (requests without an id).
+        if not isinstance(request, dict) or not isinstance(request.get('method'), str):
+            return _error(None, INVALID_REQUEST, 'Invalid Request')
+        request_id = request.get('id')
+        method = self.methods.get(request['method'])
+        if method is None:
+            return _error(request_id, METHOD_NOT_FOUND, f"Method not found: {request['method']}")
+        params = request.get('params') or {}
+        if not isinstance(params, dict):
+            return _error(request_id, INVALID_PARAMS, 'params must be an object')
+
+        try:
+            result = method(params)
+        except KeyError as err:
+            return _error(request_id, INVALID_PARAMS, f'Missing parameter: {err.args[0]}')
+        except (ValueError, TypeError, ServiceError) as err:
+            return _error(request_id, SERVICE_ERROR, str(err))
+        except mysql.connector.Error as err:
+            return _error(request_id, DATABASE_ERROR, str(err))
+        except Exception as err:
+            # Malformed params (lines=[1]), a pool timeout, a bug: answered
+            # like any other error, so the connection and the rest of a
+            # batch are not lost
+            print(f"Error: {request['method']} failed: {type(err).__name__}: {err}")
+            return _error(request_id, INTERNAL_ERROR, f'Internal error: {type(err).__name__}: {err}')
+
+        if 'id' not in request:
+            return None
+        return {'jsonrpc': '2.0', 'id': request_id, 'result': result}
+
+
+def _error(request_id, code, message):
+    return {'jsonrpc': '2.0', 'id': request_id, 'error': {'code': code, 'message': message}}
+
+
+class ServiceServer:
+    def __init__(self, dispatcher, workers):
+        self.dispatcher = dispatcher
+        self.executor = ThreadPoolExecutor(max_workers=workers,
+                                           thread_name_prefix='service-handler')
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await _read_http_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                status, payload = await self.route(method, path, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                writer.write(_http_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, path, body):
+        if method == 'GET' and path == '/health':
+            return 200, {'status': 'ok'}
+        if method != 'POST' or path != '/rpc':
+            return 404, {'error': 'POST /rpc only'}
+
+        try:
+            message = json.loads(body or b'null')
+        except ValueError:
+            return 200, _error(None, PARSE_ERROR, 'Parse error')
+
+        loop = asyncio.get_running_loop()
+        if isinstance(message, list):
+            if not message:
+                return 200, _error(None, INVALID_REQUEST, 'Empty batch')
+            responses = await asyncio.gather(*[
+                loop.run_in_executor(self.executor, self.dispatcher.call, item)
+                for item in message])
+            return 200, [r for r in responses if r is not None]
+        response = await loop.run_in_executor(self.executor, self.dispatcher.call, message)
+        return (200, response) if response is not None else (204, None)
+
+
+async def _read_http_request(reader):
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    parts = request_line.decode('latin-1').split()
+    if len(parts) != 3:
+        raise ValueError('Bad request line')
+    method, path, _ = parts
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get('content-length', 0))
+    if length > MAX_BODY:
+        raise ValueError('Request body too large')
+    body = await reader.readexactly(length) if length else b''
+    return method, path, headers, body
+
+
+_REASONS = {200: 'OK', 204: 'No Content', 404: 'Not Found'}
+
+
+def _http_response(status, payload, keep_alive):
+    body = b'' if payload is None else json.dumps(payload, default=_json_default).encode('utf-8')
+    head = [
+        f'HTTP/1.1 {status} {_REASONS.get(status, "OK")}',
+        'Content-Type: application/json',
+        f'Content-Length: {len(body)}',
+        'Connection: keep-alive' if keep_alive else 'Connection: close',
+    ]
+    return ('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body
+
+
+async def serve(service, host, port):
+    server = ServiceServer(ServiceDispatcher(service), service.pool_size)
+    listener = await asyncio.start_server(server.handle_connection, host, port)
+    print(f'Inventory service listening on http://{host}:{port}/rpc')
+    async with listener:
+        await listener.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Inventory JSON-RPC service')
+    add_db_arguments(parser)
+    parser.add_argument('--listen', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--pool-size', type=int, default=16,
+                        help='database connections and concurrent handlers (max 32)')
+    parser.add_argument('--capture', metavar='PATH',
+                        help='log sales, purchases, transfers and reports for workload_replay.py')
+    args = parser.parse_args(argv)
+
+    service = InventoryService(db_config_from_args(args), pool_size=args.pool_size)
+    if args.capture:
+        start_capture(args.capture)
+    try:
+        asyncio.run(serve(service, args.listen, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_capture()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,812 @@
+# Multi-site sharding of warehouse data by warehouse group
+# pip install mysql-connector-python   (SQLite shards need nothing extra)
+#
+# Each shard is a database for one group of warehouses. It holds their
+# Warehouses, Inventory and WarehouseTransfers rows and its own Alerts.
+# Products, Catalog and Suppliers are replicated to every shard, so a shard
+# can answer its part of any query on its own. Customers and the order
+# documents stay in the home database (inventory_mgmt).
+#
+# ShardedInventory routes by warehouse id and fans work out to all shards
+# in parallel:
+#   fulfil()             sales fulfilment (process_sales_order)
+#   allocate_purchase()  warehouse allocation of create_purchase_order
+#   summary(), report()  per-shard partial aggregates, merged here
+# Every shard writes in its own short transaction. If a shard's check fails
+# because stock or space changed since planning, the shards that already
+# committed are compensated and the order is planned again.
+#
+# Shards can be MySQL databases or SQLite files, so a multi-site setup can
+# be tried on one machine:
+#   python sharding.py --group 1-2 --group 3-4 --group 5-6 --sqlite-dir shards init
+#   python sharding.py --group 1-2 --group 3-4 --group 5-6 --sqlite-dir shards report low_stock
+#   python sharding.py --shard-map shards.json fulfil 1 8 25
+# Without --sqlite-dir, the groups become MySQL databases <database>_shard1,
+# <database>_shard2, ... on the same server. A shard map file is a JSON list
+# like [{"name": "north", "warehouses": [1, 2], "sqlite": "north.db"},
+#       {"name": "south", "warehouses": [3], "mysql": {"host": ..., "database": ...}}].
+# init copies the data out of the home database given by --host/--user/
+# --password/--database.
+
+import argparse
+import json
+import os
+import queue
+import sqlite3
+import sys
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime
+from decimal import Decimal
+
+from db_settings import add_db_arguments, db_config_from_args
+
+
+REPLICATED_TABLES = {
+    'Suppliers': ['supplier_id', 'name', 'contact_info', 'address'],
+    'Products': ['product_id', 'name', 'description', 'selling_price',
+                 'safe_stock_level', 'healthy_stock_level', 'shelf_space'],
+    'Catalog': ['catalog_id', 'supplier_id', 'product_id', 'max_quantity', 'price'],
+}
+
+SHARDED_TABLES = {
+    'Warehouses': ['warehouse_id', 'location', 'capacity'],
+    'Inventory': ['inventory_id', 'warehouse_id', 'product_id', 'quantity',
+                  'shelf_space', 'catalog_id'],
+    'WarehouseTransfers': ['transfer_id', 'from_warehouse_id', 'to_warehouse_id',
+                           'product_id', 'quantity', 'transfer_date', 'status'],
+}
+
+# Portable DDL, {serial} is filled in per dialect. Replicated tables keep
+# the ids of the home database.
+SHARD_SCHEMA = [
+    '''CREATE TABLE Suppliers (
+        supplier_id INT PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        contact_info VARCHAR(255) NOT NULL,
+        address VARCHAR(255) NULL
+    )''',
+    '''CREATE TABLE Products (
+        product_id INT PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        description TEXT,
+        selling_price DECIMAL(10, 2),
+        safe_stock_level INT,
+        healthy_stock_level INT,
+        shelf_space INT
+    )''',
+    '''CREATE TABLE Catalog (
+        catalog_id INT PRIMARY KEY,
+        supplier_id INT,
+        product_id INT,
+        max_quantity INT,
+        price DECIMAL(10, 2)
+    )''',
+    '''CREATE TABLE Warehouses (
+        warehouse_id INT PRIMARY KEY,
+        location VARCHAR(255) NULL,
+        capacity INT
+    )''',
+    '''CREATE TABLE Inventory (
+        inventory_id {serial},
+        warehouse_id INT,
+        product_id INT,
+        quantity INT,
+        shelf_space INT,
+        catalog_id INT
+    )''',
+    '''CREATE TABLE WarehouseTransfers (
+        transfer_id {serial},
+        from_warehouse_id INT,
+        to_warehouse_id INT,
+        product_id INT,
+        quantity INT,
+        transfer_date DATE,
+        status VARCHAR(50)
+    )''',
+    '''CREATE TABLE Alerts (
+        alert_id {serial},
+        entity_type VARCHAR(50),
+        entity_id INT,
+        message VARCHAR(1000),
+        alert_date DATETIME
+    )''',
+    'CREATE INDEX idx_inventory_product ON Inventory (product_id)',
+    'CREATE INDEX idx_inventory_warehouse ON Inventory (warehouse_id)',
+    'CREATE INDEX idx_catalog_product ON Catalog (product_id)',
+]
+
+DIALECTS = {
+    'mysql': {
+        'serial': 'INT PRIMARY KEY AUTO_INCREMENT',
+        'for_update': ' FOR UPDATE',
+        'month': 'EXTRACT(YEAR_MONTH FROM t.transfer_date)',
+    },
+    'sqlite': {
+        'serial': 'INTEGER PRIMARY KEY AUTOINCREMENT',
+        'for_update': '',
+        'month': "CAST(strftime('%Y%m', t.transfer_date) AS INTEGER)",
+    },
+}
+
+SUMMARY_LABELS = ["Inventory remaining", "Products on sale",
+                  "Warehouse quantity", "Total inventory value"]
+
+BATCH_SIZE = 1000
+
+
+class ShardingError(Exception):
+    # Business rule failures of the sharded operations, like ServiceError.
+    pass
+
+
+def _register_sqlite_adapters():
+    # mysql.connector hands back Decimal and date values, store them as text
+    # so SQLite's numeric and date functions still work on them.
+    sqlite3.register_adapter(Decimal, str)
+    sqlite3.register_adapter(date, date.isoformat)
+    sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+
+
+def _number(value):
+    # SQLite returns floats where MySQL returns Decimal
+    if value is None:
+        return Decimal(0)
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+class Shard:
+    def __init__(self, name, warehouse_ids, db_config=None, sqlite_path=None, pool_size=4):
+        if (db_config is None) == (sqlite_path is None):
+            raise ValueError(f'Shard {name} needs exactly one of db_config or sqlite_path')
+        self.name = name
+        self.warehouse_ids = sorted(warehouse_ids)
+        self.db_config = db_config
+        self.sqlite_path = sqlite_path
+        self.dialect = 'sqlite' if sqlite_path else 'mysql'
+        self.pool_size = pool_size
+        self._idle = queue.LifoQueue()
+
+    def _connect(self):
+        if self.sqlite_path:
+            _register_sqlite_adapters()
+            # Transactions are started explicitly, see transaction()
+            return sqlite3.connect(self.sqlite_path, timeout=30,
+                                   isolation_level=None, check_same_thread=False)
+        import mysql.connector
+        return mysql.connector.connect(**self.db_config)
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        except _Conflict:
+            # rolled back already, the connection is fine to reuse
+            self._idle.put(conn)
+            raise
+        except BaseException:
+            conn.close()
+            raise
+        if self._idle.qsize() < self.pool_size:
+            self._idle.put(conn)
+        else:
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def sql(self, text):
+        text = text.format(**DIALECTS[self.dialect])
+        return text.replace('%s', '?') if self.dialect == 'sqlite' else text
+
+    def query(self, text, params=()):
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(self.sql(text), params)
+            rows = cursor.fetchall()
+            cursor.close()
+            # end the read snapshot so the next query sees new data
+            conn.commit()
+        return rows
+
+    @contextmanager
+    def transaction(self):
+        with self.connection() as conn:
+            if self.dialect == 'sqlite':
+                conn.execute('BEGIN IMMEDIATE')
+            else:
+                conn.start_transaction()
+            cursor = conn.cursor()
+            try:
+                yield cursor
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+
+    def execute(self, cursor, text, params=()):
+        cursor.execute(self.sql(text), params)
+
+    def owns(self, warehouse_id):
+        return warehouse_id in self.warehouse_ids
+
+    def warehouse_list(self):
+        # Literal id list for IN (...), the ids are ints from the shard map
+        return ', '.join(str(int(warehouse_id)) for warehouse_id in self.warehouse_ids) or 'NULL'
+
+    # ---------------------------------------------------------------- setup
+
+    def create_schema(self):
+        if self.dialect == 'mysql':
+            import mysql.connector
+            server_config = dict(self.db_config)
+            database = server_config.pop('database')
+            with mysql.connector.connect(**server_config) as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(f'CREATE DATABASE IF NOT EXISTS `{database}`')
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            for table in ['Alerts', *SHARDED_TABLES, *REPLICATED_TABLES]:
+                cursor.execute(f'DROP TABLE IF EXISTS {table}')
+            for statement in SHARD_SCHEMA:
+                cursor.execute(self.sql(statement))
+            cursor.close()
+            conn.commit()
+
+    def load(self, rows_by_table):
+        # Replaces the contents of the given tables in one transaction
+        with self.transaction() as cursor:
+            for table, rows in rows_by_table.items():
+                columns = ({**REPLICATED_TABLES, **SHARDED_TABLES})[table]
+                cursor.execute(f'DELETE FROM {table}')
+                insert = self.sql(f'INSERT INTO {table} ({", ".join(columns)}) '
+                                  f'VALUES ({", ".join(["%s"] * len(columns))})')
+                for start in range(0, len(rows), BATCH_SIZE):
+                    cursor.executemany(insert, rows[start:start + BATCH_SIZE])
+
+    def add_alerts(self, alerts):
+        # alerts: list of (entity_type, entity_id, message)
+        if not alerts:
+            return
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self.transaction() as cursor:
+            cursor.executemany(self.sql('''
+                INSERT INTO Alerts (entity_type, entity_id, message, alert_date)
+                VALUES (%s, %s, %s, %s)
+            '''), [(entity_type, entity_id, message, now)
+                   for entity_type, entity_id, message in alerts])
+
+    # ---------------------------------------------------------------- sales
+
+    def stock_rows(self, product_id):
+        return self.query('''
+            SELECT inventory_id, quantity
+            FROM Inventory
+            WHERE product_id = %s AND quantity > 0
+            ORDER BY inventory_id
+        ''', (product_id,))
+
+    def take_stock(self, legs):
+        # legs: list of (inventory_id, quantity). False if any row no longer
+        # has enough, in which case nothing is changed.
+        with self.transaction() as cursor:
+            for inventory_id, quantity in legs:
+                self.execute(cursor, '''
+                    UPDATE Inventory SET quantity = quantity - %s
+                    WHERE inventory_id = %s AND quantity >= %s
+                ''', (quantity, inventory_id, quantity))
+                if cursor.rowcount != 1:
+                    raise _Conflict()
+        return True
+
+    def return_stock(self, legs):
+        with self.transaction() as cursor:
+            cursor.executemany(self.sql('''
+                UPDATE Inventory SET quantity = quantity + %s WHERE inventory_id = %s
+            '''), [(quantity, inventory_id) for inventory_id, quantity in legs])
+
+    def low_stock_suggestions(self, product_id):
+        rows = self.query('''
+            SELECT i.inventory_id, i.quantity, p.safe_stock_level
+            FROM Inventory i
+            JOIN Products p ON p.product_id = i.product_id
+            WHERE i.product_id = %s AND i.quantity < p.safe_stock_level
+            ORDER BY i.inventory_id
+        ''', (product_id,))
+        messages = [
+            f'Suggestion: Consider placing a purchase order for product {product_id} in inventory ID '
+            f'{inventory_id} (shard {self.name}). Current stock is {quantity} units, below safe stock '
+            f'level of {safe_stock_level} units.'
+            for inventory_id, quantity, safe_stock_level in rows]
+        self.add_alerts([('Product', product_id, message) for message in messages])
+        return messages
+
+    # ------------------------------------------------------------ purchases
+
+    def warehouse_space(self):
+        # (warehouse_id, capacity, used space) for every local warehouse
+        return self.query('''
+            SELECT w.warehouse_id, w.capacity,
+                   COALESCE(SUM(i.quantity * p.shelf_space), 0)
+            FROM Warehouses w
+            LEFT JOIN Inventory i ON i.warehouse_id = w.warehouse_id
+            LEFT JOIN Products p ON p.product_id = i.product_id
+            GROUP BY w.warehouse_id, w.capacity
+        ''')
+
+    def add_stock(self, product_id, catalog_id, unit_space, legs):
+        # legs: list of (warehouse_id, quantity). Re-checks the space of each
+        # warehouse under lock, False if it no longer fits.
+        with self.transaction() as cursor:
+            for warehouse_id, quantity in legs:
+                self.execute(cursor, 'SELECT capacity FROM Warehouses WHERE warehouse_id = %s{for_update}',
+                             (warehouse_id,))
+                capacity = cursor.fetchone()[0]
+                self.execute(cursor, '''
+                    SELECT COALESCE(SUM(i.quantity * p.shelf_space), 0)
+                    FROM Inventory i
+                    JOIN Products p ON p.product_id = i.product_id
+                    WHERE i.warehouse_id = %s
+                ''', (warehouse_id,))
+                if cursor.fetchone()[0] + quantity * unit_space > capacity:
+                    raise _Conflict()
+                self.execute(cursor, '''
+                    UPDATE Inventory
+                    SET quantity = quantity + %s, shelf_space = shelf_space + %s
+                    WHERE warehouse_id = %s AND product_id = %s AND catalog_id = %s
+                ''', (quantity, quantity * unit_space, warehouse_id, product_id, catalog_id))
+                if cursor.rowcount == 0:
+                    self.execute(cursor, '''
+                        INSERT INTO Inventory (warehouse_id, product_id, quantity, shelf_space, catalog_id)
+                        VALUES (%s, %s, %s, %s, %s)
+                    ''', (warehouse_id, product_id, quantity, quantity * unit_space, catalog_id))
+        return True
+
+    def remove_stock(self, product_id, catalog_id, unit_space, legs):
+        with self.transaction() as cursor:
+            cursor.executemany(self.sql('''
+                UPDATE Inventory
+                SET quantity = quantity - %s, shelf_space = shelf_space - %s
+                WHERE warehouse_id = %s AND product_id = %s AND catalog_id = %s
+            '''), [(quantity, quantity * unit_space, warehouse_id, product_id, catalog_id)
+                   for warehouse_id, quantity in legs])
+
+
+class _Conflict(Exception):
+    # A shard's write check failed, the caller plans again
+    pass
+
+
+class ShardedInventory:
+    def __init__(self, shards, retries=3):
+        self.shards = shards
+        self.retries = retries
+        self._by_warehouse = {}
+        for shard in shards:
+            for warehouse_id in shard.warehouse_ids:
+                if warehouse_id in self._by_warehouse:
+                    raise ValueError(f'Warehouse {warehouse_id} is in shards '
+                                     f'{self._by_warehouse[warehouse_id].name} and {shard.name}')
+                self._by_warehouse[warehouse_id] = shard
+        self.executor = ThreadPoolExecutor(max_workers=len(shards), thread_name_prefix='shard')
+
+    def close(self):
+        self.executor.shutdown()
+        for shard in self.shards:
+            shard.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def shard_for(self, warehouse_id):
+        try:
+            return self._by_warehouse[warehouse_id]
+        except KeyError:
+            raise ValueError(f'Warehouse {warehouse_id} is not in any shard') from None
+
+    def fan_out(self, function, shards=None):
+        # Runs function(shard) on every shard in parallel, results in shard order
+        return list(self.executor.map(function, self.shards if shards is None else shards))
+
+    def _apply(self, work, apply, undo):
+        # work: list of (shard, payload). Every shard applies its payload in
+        # its own transaction. If any of them fails, the ones that committed
+        # are undone. Returns False on a conflict, re-raises other errors.
+        futures = [self.executor.submit(apply, shard, payload) for shard, payload in work]
+        committed, conflict, error = [], False, None
+        for (shard, payload), future in zip(work, futures):
+            try:
+                future.result()
+                committed.append((shard, payload))
+            except _Conflict:
+                conflict = True
+            except Exception as err:
+                error = error or err
+        if not conflict and error is None:
+            return True
+        self.fan_out(lambda item: undo(*item), committed)
+        if error is not None:
+            raise error
+        return False
+
+    # ---------------------------------------------------------------- setup
+
+    def create_schema(self):
+        self.fan_out(Shard.create_schema)
+
+    def load_from(self, home_conn):
+        # Splits the single-database layout into the shards
+        rows = self._read_tables(home_conn, {**REPLICATED_TABLES, **SHARDED_TABLES})
+        unknown = {row[0] for row in rows['Warehouses']} - set(self._by_warehouse)
+        if unknown:
+            raise ValueError(f'Warehouses {sorted(unknown)} are not in any shard')
+
+        def load(shard):
+            local = set(shard.warehouse_ids)
+            part = {table: rows[table] for table in REPLICATED_TABLES}
+            part['Warehouses'] = [row for row in rows['Warehouses'] if row[0] in local]
+            part['Inventory'] = [row for row in rows['Inventory'] if row[1] in local]
+            # A transfer between two shards is kept on both, and each side
+            # only reports on its own warehouse.
+            part['WarehouseTransfers'] = [row for row in rows['WarehouseTransfers']
+                                          if row[1] in local or row[2] in local]
+            shard.load(part)
+
+        self.fan_out(load)
+
+    def replicate(self, home_conn):
+        # Refreshes Products, Catalog and Suppliers on every shard
+        rows = self._read_tables(home_conn, REPLICATED_TABLES)
+        self.fan_out(lambda shard: shard.load(rows))
+
+    def _read_tables(self, conn, tables):
+        cursor = conn.cursor()
+        rows = {}
+        for table, columns in tables.items():
+            cursor.execute(f'SELECT {", ".join(columns)} FROM {table}')
+            rows[table] = [tuple(row) for row in cursor.fetchall()]
+        cursor.close()
+        conn.commit()
+        return rows
+
+    # ---------------------------------------------------------------- sales
+
+    def fulfil(self, order_id, product_id, quantity):
+        # Takes stock from the shards holding the most first, so an order
+        # touches as few shards as possible.
+        for attempt in range(self.retries + 1):
+            stock = self.fan_out(lambda shard: shard.stock_rows(product_id))
+            if sum(q for rows in stock for _, q in rows) < quantity:
+                message = f'Insufficient stock for product {product_id} to fulfill sales order {order_id}'
+                self.shards[0].add_alerts([('Product', product_id, message)])
+                return {'order_id': order_id, 'status': 'Rejected', 'messages': [message]}
+
+            work = []
+            needed = quantity
+            by_stock = sorted(zip(self.shards, stock), key=lambda item: -sum(q for _, q in item[1]))
+            for shard, rows in by_stock:
+                legs = []
+                for inventory_id, available in rows:
+                    take = min(available, needed)
+                    legs.append((inventory_id, take))
+                    needed -= take
+                    if needed == 0:
+                        break
+                if legs:
+                    work.append((shard, legs))
+                if needed == 0:
+                    break
+
+            if self._apply(work, Shard.take_stock, Shard.return_stock):
+                messages = [message for shard_messages in self.fan_out(
+                    lambda shard: shard.low_stock_suggestions(product_id))
+                    for message in shard_messages]
+                return {'order_id': order_id, 'status': 'Fulfilled', 'messages': messages,
+                        'shards': [shard.name for shard, _ in work]}
+        raise ShardingError(f'Stock of product {product_id} kept changing, '
+                            f'sales order {order_id} was not fulfilled')
+
+    # ------------------------------------------------------------ purchases
+
+    def allocate_purchase(self, product_id, quantity):
+        # The warehouse allocation of create_purchase_order: largest
+        # warehouses first, over all shards. The PurchaseOrders documents
+        # themselves stay in the home database.
+        catalog = self.shards[0].query('''
+            SELECT supplier_id, catalog_id, price, max_quantity
+            FROM Catalog WHERE product_id = %s ORDER BY price
+        ''', (product_id,))
+        unit = self.shards[0].query('SELECT shelf_space FROM Products WHERE product_id = %s',
+                                    (product_id,))
+        if not catalog or not unit:
+            raise ShardingError(f'Product ID {product_id} has no supplier in the catalog')
+        unit_space = unit[0][0]
+
+        lines = []
+        remaining = quantity
+        for supplier_id, catalog_id, price, max_quantity in catalog:
+            take = min(max_quantity, remaining)
+            lines.append((supplier_id, catalog_id, take, price))
+            remaining -= take
+            if remaining == 0:
+                break
+        catalog_id = lines[-1][1]
+        total_cost = sum(_number(price) * take for _, _, take, price in lines)
+
+        for attempt in range(self.retries + 1):
+            warehouses = []
+            for shard, rows in zip(self.shards, self.fan_out(Shard.warehouse_space)):
+                warehouses.extend((capacity, warehouse_id, used, shard)
+                                  for warehouse_id, capacity, used in rows)
+            warehouses.sort(key=lambda item: (-item[0], item[1]))
+
+            legs = defaultdict(list)
+            remaining = quantity
+            for capacity, warehouse_id, used, shard in warehouses:
+                allocatable = int((capacity - used) // unit_space)
+                if allocatable > 0:
+                    take = min(allocatable, remaining)
+                    legs[shard].append((warehouse_id, take))
+                    remaining -= take
+                    if remaining == 0:
+                        break
+
+            if remaining > 0:
+                message = (f'Warning: Not enough warehouse capacity for the entire order of {quantity} '
+                           f'units of product ID {product_id}. PO rejected. Unallocated quantity: {remaining}')
+                self.shards[0].add_alerts([('Product', product_id, message)])
+                return {'status': 'Rejected', 'message': message, 'allocations': [],
+                        'lines': [], 'total_cost': Decimal(0)}
+
+            work = list(legs.items())
+            if self._apply(work,
+                           lambda shard, shard_legs: shard.add_stock(product_id, catalog_id, unit_space, shard_legs),
+                           lambda shard, shard_legs: shard.remove_stock(product_id, catalog_id, unit_space, shard_legs)):
+                allocations = [(shard.name, warehouse_id, take)
+                               for shard, shard_legs in work for warehouse_id, take in shard_legs]
+                message = (f'{quantity} units of product ID {product_id} allocated to '
+                           f'{len(allocations)} warehouses on {len(work)} shards.')
+                return {'status': 'Add to Inventory', 'message': message, 'allocations': allocations,
+                        'lines': lines, 'total_cost': total_cost}
+        raise ShardingError(f'Warehouse space kept changing, purchase of product {product_id} was not allocated')
+
+    # -------------------------------------------------------------- reports
+
+    def summary(self):
+        # Same figures as inventory_service.SUMMARY_QUERIES, summed over shards
+        parts = self.fan_out(lambda shard: shard.query('''
+            SELECT
+                (SELECT COALESCE(SUM(quantity), 0) FROM Inventory),
+                (SELECT COUNT(DISTINCT product_id) FROM Catalog),
+                (SELECT COUNT(*) FROM Warehouses),
+                (SELECT COALESCE(SUM(i.quantity * c.price), 0)
+                 FROM Inventory i JOIN Catalog c ON i.catalog_id = c.catalog_id)
+        ''')[0])
+        values = [sum(int(part[0]) for part in parts),
+                  parts[0][1],  # Catalog is replicated
+                  sum(part[2] for part in parts),
+                  sum(_number(part[3]) for part in parts)]
+        return list(zip(SUMMARY_LABELS, values))
+
+    def report_names(self):
+        return sorted(REPORT_MERGES)
+
+    def report(self, name):
+        if name not in REPORT_MERGES:
+            raise ValueError(f'Unknown report: {name}')
+        return REPORT_MERGES[name](self)
+
+    def _products(self):
+        return self.shards[0].query('SELECT * FROM Products ORDER BY product_id')
+
+    def _catalog(self):
+        return self.shards[0].query('''
+            SELECT
+                Catalog.catalog_id,
+                Products.name AS product_name,
+                Products.description,
+                Suppliers.name AS supplier_name,
+                Catalog.max_quantity,
+                Catalog.price
+            FROM Catalog
+            JOIN Products ON Catalog.product_id = Products.product_id
+            JOIN Suppliers ON Catalog.supplier_id = Suppliers.supplier_id
+            ORDER BY Catalog.catalog_id
+        ''')
+
+    def _stock_list(self):
+        parts = self.fan_out(lambda shard: shard.query('''
+            SELECT
+                Inventory.product_id,
+                Products.name AS product_name,
+                Inventory.warehouse_id,
+                Inventory.quantity,
+                Inventory.shelf_space,
+                Inventory.catalog_id,
+                Catalog.price
+            FROM Inventory
+            JOIN Catalog ON Inventory.catalog_id = Catalog.catalog_id
+            JOIN Products ON Inventory.product_id = Products.product_id
+        '''))
+        return sorted((row for rows in parts for row in rows), key=lambda row: (row[0], row[2]))
+
+    def _low_stock(self):
+        parts = self.fan_out(lambda shard: shard.query(
+            'SELECT product_id, SUM(quantity) FROM Inventory GROUP BY product_id'))
+        current = defaultdict(int)
+        for rows in parts:
+            for product_id, quantity in rows:
+                current[product_id] += int(quantity or 0)
+        rows = []
+        for product_id, name, safe_stock_level in self.shards[0].query(
+                'SELECT product_id, name, safe_stock_level FROM Products ORDER BY product_id'):
+            # like the LEFT JOIN in GetLowStockProducts, products without any
+            # stock rows have no current stock and are not listed
+            if product_id in current and current[product_id] < safe_stock_level:
+                rows.append((product_id, name, safe_stock_level, current[product_id],
+                             safe_stock_level - current[product_id]))
+        return rows
+
+    def _most_transferred(self):
+        # Each shard totals the transfers of its own warehouses only, so the
+        # partial results never overlap.
+        parts = self.fan_out(lambda shard: shard.query(f'''
+            SELECT warehouse_id, product_id, SUM(quantity)
+            FROM (
+                SELECT from_warehouse_id AS warehouse_id, product_id, quantity FROM WarehouseTransfers
+                UNION ALL
+                SELECT to_warehouse_id AS warehouse_id, product_id, quantity FROM WarehouseTransfers
+            ) AS transfers
+            WHERE warehouse_id IN ({shard.warehouse_list()})
+            GROUP BY warehouse_id, product_id
+        '''))
+        names = dict(self.shards[0].query('SELECT product_id, name FROM Products'))
+        by_warehouse = defaultdict(list)
+        for rows in parts:
+            for warehouse_id, product_id, total in rows:
+                by_warehouse[warehouse_id].append((int(total), product_id))
+        result = []
+        for warehouse_id in sorted(by_warehouse):
+            ranked = sorted(by_warehouse[warehouse_id], key=lambda item: -item[0])[:5]
+            result.extend((warehouse_id, product_id, total, names.get(product_id))
+                          for total, product_id in ranked if product_id in names)
+        return result
+
+    def _monthly_changes(self):
+        parts = self.fan_out(lambda shard: shard.query('''
+            SELECT
+                i.warehouse_id,
+                i.product_id,
+                {month} AS month_key,
+                COALESCE(SUM(CASE
+                    WHEN t.from_warehouse_id = i.warehouse_id THEN -t.quantity
+                    WHEN t.to_warehouse_id = i.warehouse_id THEN t.quantity
+                    ELSE 0
+                END), 0) AS quantity_change,
+                p.name AS product_name
+            FROM Inventory i
+            LEFT JOIN WarehouseTransfers t ON i.product_id = t.product_id
+            JOIN Products p ON i.product_id = p.product_id
+            GROUP BY i.warehouse_id, i.product_id, month_key, p.name
+            HAVING quantity_change <> 0
+        '''))
+        rows = [(warehouse_id, product_id,
+                 None if month is None else f'{int(month) // 100}-{int(month) % 100:02d}',
+                 change, name)
+                for shard_rows in parts
+                for warehouse_id, product_id, month, change, name in shard_rows]
+        return sorted(rows, key=lambda row: (row[0], row[1], row[2] or ''))
+
+
+REPORT_MERGES = {
+    'products': ShardedInventory._products,
+    'catalog': ShardedInventory._catalog,
+    'stock_list': ShardedInventory._stock_list,
+    'low_stock': ShardedInventory._low_stock,
+    'most_transferred': ShardedInventory._most_transferred,
+    'monthly_changes': ShardedInventory._monthly_changes,
+}
+
+
+def parse_group(text):
+    # "1-3" or "1,2,5"
+    warehouse_ids = []
+    for part in text.split(','):
+        low, _, high = part.partition('-')
+        warehouse_ids.extend(range(int(low), int(high or low) + 1))
+    return warehouse_ids
+
+
+def shards_from_args(args, db_config):
+    if args.shard_map:
+        with open(args.shard_map, 'r', encoding='utf-8') as file:
+            specs = json.load(file)
+        base = os.path.dirname(os.path.abspath(args.shard_map))
+        return [Shard(spec['name'], spec['warehouses'],
+                      db_config={**db_config, **spec['mysql']} if 'mysql' in spec else None,
+                      sqlite_path=os.path.join(base, spec['sqlite']) if 'sqlite' in spec else None)
+                for spec in specs]
+    if not args.group:
+        raise SystemExit('Give the shards with --shard-map or --group')
+    shards = []
+    for number, group in enumerate(args.group, start=1):
+        name = f'shard{number}'
+        if args.sqlite_dir:
+            os.makedirs(args.sqlite_dir, exist_ok=True)
+            shards.append(Shard(name, parse_group(group),
+                                sqlite_path=os.path.join(args.sqlite_dir, f'{name}.db')))
+        else:
+            shards.append(Shard(name, parse_group(group),
+                                db_config={**db_config, 'database': f"{db_config['database']}_{name}"}))
+    return shards
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Inventory sharded by warehouse group')
+    add_db_arguments(parser)
+    parser.add_argument('--shard-map', help='JSON file describing the shards')
+    parser.add_argument('--group', action='append',
+                        help='warehouse ids of one shard, e.g. 1-3 or 1,4 (repeat per shard)')
+    parser.add_argument('--sqlite-dir', help='keep --group shards in SQLite files here')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('init', help='create the shards from the home database')
+    commands.add_parser('replicate', help='refresh Products, Catalog and Suppliers on every shard')
+    commands.add_parser('summary')
+    report_parser = commands.add_parser('report')
+    report_parser.add_argument('name', choices=sorted(REPORT_MERGES))
+    fulfil_parser = commands.add_parser('fulfil')
+    fulfil_parser.add_argument('order_id', type=int)
+    fulfil_parser.add_argument('product_id', type=int)
+    fulfil_parser.add_argument('quantity', type=int)
+    allocate_parser = commands.add_parser('allocate')
+    allocate_parser.add_argument('product_id', type=int)
+    allocate_parser.add_argument('quantity', type=int)
+    args = parser.parse_args(argv)
+
+    db_config = db_config_from_args(args)
+    with ShardedInventory(shards_from_args(args, db_config)) as sharded:
+        if args.command in ('init', 'replicate'):
+            import mysql.connector
+            with mysql.connector.connect(**db_config) as home_conn:
+                if args.command == 'init':
+                    sharded.create_schema()
+                    sharded.load_from(home_conn)
+                else:
+                    sharded.replicate(home_conn)
+            for shard in sharded.shards:
+                print(f'{shard.name}: warehouses {shard.warehouse_ids}')
+        elif args.command == 'summary':
+            for label, value in sharded.summary():
+                print(f'{label}: {value}')
+        elif args.command == 'report':
+            for row in sharded.report(args.name):
+                print('\t'.join(str(value) for value in row))
+        elif args.command == 'fulfil':
+            result = sharded.fulfil(args.order_id, args.product_id, args.quantity)
+            print(result['status'])
+            for message in result['messages']:
+                print(message)
+        else:
+            result = sharded.allocate_purchase(args.product_id, args.quantity)
+            print(result['message'])
+            for shard_name, warehouse_id, quantity in result['allocations']:
+                print(f'  {shard_name}: warehouse {warehouse_id} +{quantity}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,321 @@
+# Warehouse transfer execution engine
+# pip install mysql-connector-python
+#
+# A batch of transfers is validated against one snapshot of stock and
+# capacity, then every debit and credit is applied in a single transaction.
+# Warehouse, WarehouseSpace and Inventory rows are locked in ascending id
+# order so that two batches touching the same warehouses can never deadlock
+# each other. The WarehouseSpace lock also keeps a purchase from filling a
+# destination between the capacity check and the move.
+#
+# Status transitions recorded in WarehouseTransfers:
+#   Pending -> Completed   (stock moved)
+#   Pending -> Rejected    (not enough stock or destination capacity)
+#   Pending -> Failed      (the apply transaction was rolled back)
+
+import argparse
+import sys
+
+import mysql.connector
+
+from db_settings import add_db_arguments, db_config_from_args
+from movement_ledger import (
+    MOVEMENT_TRANSFER_IN, MOVEMENT_TRANSFER_OUT,
+    clear_movement_source, set_movement_source)
+
+
+STATUS_PENDING = 'Pending'
+STATUS_COMPLETED = 'Completed'
+STATUS_REJECTED = 'Rejected'
+STATUS_FAILED = 'Failed'
+
+
+def plan_transfers(transfers, capacity, used_space, shelf_space, stock_rows):
+    # Pure planning step, no database access.
+    #   transfers:   list of (transfer_id, from_wh, to_wh, product_id, quantity)
+    #   capacity:    {warehouse_id: capacity}
+    #   used_space:  {warehouse_id: used shelf space}, updated in place
+    #   shelf_space: {product_id: shelf space per unit}
+    #   stock_rows:  {(warehouse_id, product_id): [[inventory_id, quantity, catalog_id], ...]}
+    #                in inventory_id order, updated in place
+    # Returns (legs, results). Each leg is
+    #   ('debit', transfer_id, inventory_id, quantity, space)
+    #   ('credit', transfer_id, inventory_id, quantity, space)
+    #   ('insert', transfer_id, row_key, quantity, space)
+    # where row_key = (warehouse_id, product_id, catalog_id) identifies a row
+    # that does not exist yet. Later credits to the same new row use the
+    # row_key in place of the inventory_id.
+    legs = []
+    results = []
+
+    for transfer_id, from_wh, to_wh, product_id, quantity in transfers:
+        unit_space = shelf_space.get(product_id)
+        reason = None
+
+        if quantity <= 0:
+            reason = 'Quantity must be positive'
+        elif from_wh == to_wh:
+            reason = 'Source and destination warehouse are the same'
+        elif from_wh not in capacity or to_wh not in capacity:
+            reason = 'Unknown warehouse'
+        elif unit_space is None:
+            reason = 'Unknown product'
+        else:
+            source_rows = stock_rows.get((from_wh, product_id), [])
+            available = sum(row[1] for row in source_rows)
+            needed_space = quantity * unit_space
+            free_space = capacity[to_wh] - used_space.get(to_wh, 0)
+            if available < quantity:
+                reason = f'Insufficient stock: {available} available, {quantity} requested'
+            elif free_space < needed_space:
+                reason = f'Insufficient capacity: {free_space} free, {needed_space} needed'
+
+        if reason is not None:
+            results.append({'transfer_id': transfer_id,
+                            'status': STATUS_REJECTED, 'reason': reason})
+            continue
+
+        # Drain the source rows in inventory_id order, crediting the
+        # destination row that carries the same catalog entry.
+        remaining = quantity
+        dest_rows = stock_rows.setdefault((to_wh, product_id), [])
+        for row in stock_rows[(from_wh, product_id)]:
+            if remaining == 0:
+                break
+            if row[1] == 0:
+                continue
+            take = min(row[1], remaining)
+            row[1] -= take
+            remaining -= take
+            legs.append(('debit', transfer_id, row[0], take, take * unit_space))
+
+            catalog_id = row[2]
+            dest = next((r for r in dest_rows if r[2] == catalog_id), None)
+            if dest is None:
+                dest = [(to_wh, product_id, catalog_id), take, catalog_id]
+                dest_rows.append(dest)
+                legs.append(('insert', transfer_id, dest[0],
+                             take, take * unit_space))
+            else:
+                dest[1] += take
+                legs.append(('credit', transfer_id, dest[0],
+                             take, take * unit_space))
+
+        used_space[from_wh] = used_space.get(from_wh, 0) - quantity * unit_space
+        used_space[to_wh] = used_space.get(to_wh, 0) + quantity * unit_space
+        results.append({'transfer_id': transfer_id,
+                        'status': STATUS_COMPLETED, 'reason': None})
+
+    return legs, results
+
+
+class TransferEngine:
+    def __init__(self, conn, db_config):
+        self.conn = conn
+        self.db_config = db_config
+
+    def execute_batch(self, transfers):
+        # transfers: iterable of (from_warehouse_id, to_warehouse_id, product_id, quantity)
+        transfers = [tuple(int(v) for v in t) for t in transfers]
+        if not transfers:
+            return []
+        transfer_ids = self.create_pending(transfers)
+        items = [(tid,) + t for tid, t in zip(transfer_ids, transfers)]
+        return self._execute(items)
+
+    def execute_pending(self, limit=None):
+        # Run transfers that were queued as 'Pending', e.g. by the rebalancer.
+        cursor = self.conn.cursor()
+        sql = '''
+            SELECT transfer_id, from_warehouse_id, to_warehouse_id, product_id, quantity
+            FROM WarehouseTransfers
+            WHERE status = %s
+            ORDER BY transfer_id
+        '''
+        params = (STATUS_PENDING,)
+        if limit is not None:
+            sql += ' LIMIT %s'
+            params = (STATUS_PENDING, int(limit))
+        cursor.execute(sql, params)
+        items = [tuple(row) for row in cursor.fetchall()]
+        cursor.close()
+        self.conn.commit()
+        if not items:
+            return []
+        return self._execute(items)
+
+    def create_pending(self, transfers):
+        cursor = self.conn.cursor()
+        try:
+            transfer_ids = []
+            for from_wh, to_wh, product_id, quantity in transfers:
+                cursor.execute('''
+                    INSERT INTO WarehouseTransfers
+                        (from_warehouse_id, to_warehouse_id, product_id, quantity, transfer_date, status)
+                    VALUES (%s, %s, %s, %s, CURDATE(), %s);
+                ''', (from_wh, to_wh, product_id, quantity, STATUS_PENDING))
+                transfer_ids.append(cursor.lastrowid)
+            self.conn.commit()
+            return transfer_ids
+        except mysql.connector.Error:
+            self.conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def _execute(self, items):
+        cursor = self.conn.cursor()
+        try:
+            self.conn.start_transaction()
+            snapshot = self._lock_and_snapshot(cursor, items)
+            legs, results = plan_transfers(items, *snapshot)
+            self._apply_legs(cursor, legs)
+            self._record_results(cursor, results)
+            self.conn.commit()
+            return results
+        except mysql.connector.Error as err:
+            self.conn.rollback()
+            clear_movement_source(cursor)
+            self._mark_failed(cursor, [item[0] for item in items], str(err))
+            raise
+        finally:
+            cursor.close()
+
+    def _lock_and_snapshot(self, cursor, items):
+        warehouse_ids = sorted({item[1] for item in items} | {item[2] for item in items})
+        product_ids = sorted({item[3] for item in items})
+        wh_marks = ', '.join(['%s'] * len(warehouse_ids))
+        product_marks = ', '.join(['%s'] * len(product_ids))
+
+        # Lock order: Warehouses by id, WarehouseSpace by id, then Inventory
+        # by id.
+        cursor.execute(f'''
+            SELECT warehouse_id, capacity
+            FROM Warehouses
+            WHERE warehouse_id IN ({wh_marks})
+            ORDER BY warehouse_id
+            FOR UPDATE;
+        ''', warehouse_ids)
+        capacity = {wh: cap or 0 for wh, cap in cursor.fetchall()}
+
+        cursor.execute(f'''
+            SELECT warehouse_id, used_space
+            FROM WarehouseSpace
+            WHERE warehouse_id IN ({wh_marks})
+            ORDER BY warehouse_id
+            FOR UPDATE;
+        ''', warehouse_ids)
+        used_space = {wh: int(used) for wh, used in cursor.fetchall()}
+
+        cursor.execute(f'''
+            SELECT inventory_id, warehouse_id, product_id, quantity, catalog_id
+            FROM Inventory
+            WHERE warehouse_id IN ({wh_marks}) AND product_id IN ({product_marks})
+            ORDER BY inventory_id
+            FOR UPDATE;
+        ''', warehouse_ids + product_ids)
+        stock_rows = {}
+        for inventory_id, wh, product_id, quantity, catalog_id in cursor.fetchall():
+            stock_rows.setdefault((wh, product_id), []).append(
+                [inventory_id, quantity or 0, catalog_id])
+
+        cursor.execute(f'''
+            SELECT product_id, shelf_space
+            FROM Products
+            WHERE product_id IN ({product_marks});
+        ''', product_ids)
+        shelf_space = {product_id: space or 0 for product_id, space in cursor.fetchall()}
+
+        return capacity, used_space, shelf_space, stock_rows
+
+    def _apply_legs(self, cursor, legs):
+        # Rows created earlier in the batch are addressed by their row_key
+        # until the INSERT hands back an inventory_id. Each leg is recorded
+        # in the movement ledger against its transfer.
+        new_rows = {}
+        for kind, transfer_id, target, quantity, space in legs:
+            set_movement_source(
+                cursor, MOVEMENT_TRANSFER_OUT if kind == 'debit' else MOVEMENT_TRANSFER_IN,
+                'WarehouseTransfer', transfer_id)
+            if kind == 'debit':
+                cursor.execute('''
+                    UPDATE Inventory
+                    SET quantity = quantity - %s, shelf_space = shelf_space - %s
+                    WHERE inventory_id = %s;
+                ''', (quantity, space, new_rows.get(target, target)))
+            elif kind == 'insert':
+                warehouse_id, product_id, catalog_id = target
+                cursor.execute('''
+                    INSERT INTO Inventory (warehouse_id, product_id, quantity, shelf_space, catalog_id)
+                    VALUES (%s, %s, %s, %s, %s);
+                ''', (warehouse_id, product_id, quantity, space, catalog_id))
+                new_rows[target] = cursor.lastrowid
+            else:
+                inventory_id = new_rows.get(target, target)
+                cursor.execute('''
+                    UPDATE Inventory
+                    SET quantity = quantity + %s, shelf_space = shelf_space + %s
+                    WHERE inventory_id = %s;
+                ''', (quantity, space, inventory_id))
+        clear_movement_source(cursor)
+
+    def _record_results(self, cursor, results):
+        cursor.executemany('''
+            UPDATE WarehouseTransfers
+            SET status = %s, transfer_date = CURDATE()
+            WHERE transfer_id = %s;
+        ''', [(r['status'], r['transfer_id']) for r in results])
+
+        rejected = [r for r in results if r['status'] == STATUS_REJECTED]
+        if rejected:
+            cursor.executemany('''
+                INSERT INTO Alerts (entity_type, entity_id, message, alert_date)
+                VALUES ('WarehouseTransfer', %s, %s, NOW());
+            ''', [(r['transfer_id'],
+                   f"Transfer {r['transfer_id']} rejected. {r['reason']}")
+                  for r in rejected])
+
+    def _mark_failed(self, cursor, transfer_ids, message):
+        try:
+            cursor.executemany('''
+                UPDATE WarehouseTransfers SET status = %s WHERE transfer_id = %s;
+            ''', [(STATUS_FAILED, tid) for tid in transfer_ids])
+            self.conn.commit()
+        except mysql.connector.Error as err:
+            print(f"Error: {err}")
+        print(f"Transfer batch failed: {message}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Execute warehouse transfers. Each transfer is FROM,TO,PRODUCT,QUANTITY.')
+    add_db_arguments(parser)
+    parser.add_argument('transfers', nargs='*',
+                        help='transfers such as 1,2,5,10')
+    parser.add_argument('--pending', action='store_true',
+                        help='execute transfers queued with status Pending')
+    parser.add_argument('--limit', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    db_config = db_config_from_args(args)
+    conn = mysql.connector.connect(**db_config)
+    engine = TransferEngine(conn, db_config)
+    try:
+        if args.pending:
+            results = engine.execute_pending(args.limit)
+        else:
+            results = engine.execute_batch(
+                [t.split(',') for t in args.transfers])
+    finally:
+        conn.close()
+
+    for r in results:
+        line = f"Transfer {r['transfer_id']}: {r['status']}"
+        if r['reason']:
+            line += f" ({r['reason']})"
+        print(line)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,185 @@
+# Warehouse space ledger: free space queries, check and rebuild
+# pip install mysql-connector-python
+#
+# WarehouseSpace holds capacity, used and free shelf space per warehouse.
+# The triggers in Inventory_procedures.sql (section 13) keep it in the same
+# transaction as every Inventory change, and keep Inventory.shelf_space at
+# quantity x Products.shelf_space, so nothing has to sum Inventory to find
+# room any more. free_space is indexed, so "warehouses with at least X free"
+# is one index range scan:
+#   python warehouse_space.py free 500
+#
+# check recomputes every warehouse from Inventory and Products and lists the
+# ones the ledger disagrees with; rebuild does the same and writes the
+# recomputed values, including Inventory.shelf_space, in one transaction
+# (it is also the nightly warehouse_space job in job_runner.py):
+#   python warehouse_space.py check
+#   python warehouse_space.py rebuild
+
+import argparse
+import sys
+from collections import namedtuple
+
+import mysql.connector
+
+from db_settings import add_db_arguments, db_config_from_args
+
+
+# used/free as kept by the triggers, recomputed_used from Inventory
+SpaceDrift = namedtuple('SpaceDrift', 'warehouse_id capacity used_space recomputed_used')
+
+
+def warehouses_with_free_space(conn, space, limit=None):
+    # Returns [(warehouse_id, free_space)] with free_space >= space, least
+    # free first so callers can fill the tightest warehouse that fits
+    sql = '''
+        SELECT warehouse_id, free_space
+        FROM WarehouseSpace
+        WHERE free_space >= %s
+        ORDER BY free_space, warehouse_id
+    '''
+    params = (space,)
+    if limit is not None:
+        sql += ' LIMIT %s'
+        params = (space, int(limit))
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql + ';', params)
+        rows = [(warehouse_id, int(free)) for warehouse_id, free in cursor.fetchall()]
+        conn.commit()
+    finally:
+        cursor.close()
+    return rows
+
+
+def _recomputed_space(cursor, lock=False):
+    cursor.execute(f'''
+        SELECT Warehouses.warehouse_id, IFNULL(Warehouses.capacity, 0),
+               IFNULL(SUM(IFNULL(Inventory.quantity, 0) * IFNULL(Products.shelf_space, 0)), 0)
+        FROM Warehouses
+        LEFT JOIN Inventory ON Inventory.warehouse_id = Warehouses.warehouse_id
+        LEFT JOIN Products ON Products.product_id = Inventory.product_id
+        GROUP BY Warehouses.warehouse_id, Warehouses.capacity
+        {'LOCK IN SHARE MODE' if lock else ''};
+    ''')
+    return {warehouse_id: (int(capacity), int(used)) for warehouse_id, capacity, used in cursor.fetchall()}
+
+
+def _ledger_space(cursor, lock=False):
+    cursor.execute(f'''
+        SELECT warehouse_id, capacity, used_space FROM WarehouseSpace
+        {'FOR UPDATE' if lock else ''};
+    ''')
+    return {warehouse_id: (int(capacity), int(used)) for warehouse_id, capacity, used in cursor.fetchall()}
+
+
+def _drift(ledger, recomputed):
+    drift = []
+    for warehouse_id in sorted(ledger.keys() | recomputed.keys()):
+        capacity, used = ledger.get(warehouse_id, (None, None))
+        expected = recomputed.get(warehouse_id)
+        if expected is None or (capacity, used) != expected:
+            drift.append(SpaceDrift(warehouse_id, capacity, used,
+                                    None if expected is None else expected[1]))
+    return drift
+
+
+def check(conn):
+    # Returns [SpaceDrift], read in one consistent snapshot
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction(consistent_snapshot=True, readonly=True)
+        ledger = _ledger_space(cursor)
+        recomputed = _recomputed_space(cursor)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return _drift(ledger, recomputed)
+
+
+def rebuild(conn):
+    # Rewrites Inventory.shelf_space and WarehouseSpace from Inventory and
+    # Products. Returns [SpaceDrift] as found before the rebuild. Writers
+    # wait on the locked rows for the length of the transaction.
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction()
+        ledger = _ledger_space(cursor, lock=True)
+        recomputed = _recomputed_space(cursor, lock=True)
+        # Only shelf_space changes, so the movement ledger records nothing
+        cursor.execute('''
+            UPDATE Inventory
+            LEFT JOIN Products ON Products.product_id = Inventory.product_id
+            SET Inventory.shelf_space = IFNULL(Inventory.quantity, 0) * IFNULL(Products.shelf_space, 0)
+            WHERE NOT (Inventory.shelf_space <=> IFNULL(Inventory.quantity, 0) * IFNULL(Products.shelf_space, 0));
+        ''')
+        cursor.execute('''
+            DELETE FROM WarehouseSpace
+            WHERE warehouse_id NOT IN (SELECT warehouse_id FROM Warehouses);
+        ''')
+        # Written last: the Inventory triggers above have moved used_space
+        # from whatever it was
+        if recomputed:
+            cursor.executemany('''
+                INSERT INTO WarehouseSpace (warehouse_id, capacity, used_space)
+                VALUES (%s, %s, %s)
+                ON DUPLICATE KEY UPDATE capacity = VALUES(capacity), used_space = VALUES(used_space);
+            ''', [(warehouse_id, capacity, used)
+                  for warehouse_id, (capacity, used) in sorted(recomputed.items())])
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return _drift(ledger, recomputed)
+
+
+def print_drift(drift):
+    if not drift:
+        print('WarehouseSpace matches Inventory.')
+        return
+    print('Warehouse\tCapacity\tLedger used\tRecomputed used')
+    for row in drift:
+        print(f'{row.warehouse_id}\t{row.capacity}\t{row.used_space}\t{row.recomputed_used}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Warehouse space ledger')
+    add_db_arguments(parser)
+    commands = parser.add_subparsers(dest='command', required=True)
+    free = commands.add_parser('free', help='warehouses with at least this much free space')
+    free.add_argument('space', type=int)
+    free.add_argument('--limit', type=int)
+    commands.add_parser('check', help='compare the ledger with Inventory')
+    commands.add_parser('rebuild', help='recompute the ledger from Inventory')
+    args = parser.parse_args(argv)
+
+    conn = mysql.connector.connect(**db_config_from_args(args))
+    try:
+        if args.command == 'free':
+            rows = warehouses_with_free_space(conn, args.space, args.limit)
+            print('Warehouse\tFree space')
+            for warehouse_id, free_space in rows:
+                print(f'{warehouse_id}\t{free_space}')
+        elif args.command == 'check':
+            drift = check(conn)
+            print_drift(drift)
+            return 1 if drift else 0
+        else:
+            drift = rebuild(conn)
+            print_drift(drift)
+            print(f'Rebuilt, {len(drift)} warehouses corrected.')
+    except mysql.connector.Error as err:
+        print(f'Error: {err}')
+        return 1
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
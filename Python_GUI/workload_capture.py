@@ -0,0 +1,133 @@
+# Workload capture: a log of the logical operations a process runs
+#
+# While capture is on, every sale, sales order, purchase, transfer and
+# report open that goes through the data layer (InventoryService,
+# async_db.SyncInventoryDB, the report dialogs) is appended to a gzipped
+# JSON lines log with its parameters, when it started and how long it took.
+# workload_replay.py runs such a log again against a copy of the database.
+#
+# Capture is off unless started, and then costs one lock and one line per
+# operation:
+#   - the GUI captures when db_settings.WORKLOAD_CAPTURE_PATH is set,
+#   - python service_server.py --capture workload.jsonl.gz
+#
+# Log format: the first line is a header object, then one array per
+# operation, in the order they finished:
+#   [start offset in seconds, operation, {parameters}, seconds, error, result]
+# error is None or "ExceptionType: message"; result is None or the ids later
+# operations may refer to ({"order_id": ...} for place_sales_order).
+
+import atexit
+import gzip
+import json
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+
+
+LOG_FORMAT = 'inventory-workload'
+LOG_VERSION = 1
+
+OP_SELL = 'sell'
+OP_PLACE_SALES_ORDER = 'place_sales_order'
+OP_PURCHASE = 'purchase'
+OP_CREATE_PURCHASE_ORDER = 'create_purchase_order'
+OP_TRANSFER = 'transfer'
+OP_REPORT = 'report'
+
+CapturedOperation = namedtuple('CapturedOperation', 'offset op params seconds error result')
+
+
+class WorkloadRecorder:
+    def __init__(self, path, flush_interval=1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.count = 0
+        self._file = gzip.open(path, 'wt', encoding='utf-8')
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._flushed_at = self._start
+        self._write({'format': LOG_FORMAT, 'version': LOG_VERSION,
+                     'started_at': datetime.now().isoformat(timespec='seconds')})
+
+    def _write(self, entry):
+        self._file.write(json.dumps(entry, separators=(',', ':'), default=str))
+        self._file.write('\n')
+
+    def record(self, op, params, started, seconds, error=None, result=None):
+        # started: time.perf_counter() when the operation began
+        entry = [round(started - self._start, 4), op, params, round(seconds, 6),
+                 error, result or None]
+        with self._lock:
+            if self._file is None:
+                return
+            self._write(entry)
+            self.count += 1
+            now = time.perf_counter()
+            # A sync flush, so a crashed process leaves a readable log
+            if now - self._flushed_at >= self.flush_interval:
+                self._file.flush()
+                self._flushed_at = now
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+_recorder = None
+
+
+def start_capture(path, flush_interval=1.0):
+    global _recorder
+    stop_capture()
+    _recorder = WorkloadRecorder(path, flush_interval)
+    atexit.register(stop_capture)
+    return _recorder
+
+
+def stop_capture():
+    global _recorder
+    recorder, _recorder = _recorder, None
+    if recorder is not None:
+        recorder.close()
+
+
+@contextmanager
+def captured(op, params):
+    # Records the operation run inside the block. Ids later operations refer
+    # to go into the yielded dict.
+    recorder = _recorder
+    result = {}
+    if recorder is None:
+        yield result
+        return
+    started = time.perf_counter()
+    try:
+        yield result
+    except BaseException as err:
+        recorder.record(op, params, started, time.perf_counter() - started,
+                        f'{type(err).__name__}: {err}')
+        raise
+    recorder.record(op, params, started, time.perf_counter() - started, None, result)
+
+
+def read_workload(path):
+    # Returns (header, [CapturedOperation] ordered by start offset).
+    # Operations are logged as they finish, so they are sorted here.
+    with gzip.open(path, 'rt', encoding='utf-8') as file:
+        header = json.loads(file.readline() or 'null')
+        if not isinstance(header, dict) or header.get('format') != LOG_FORMAT:
+            raise ValueError(f'{path} is not a workload log')
+        operations = []
+        try:
+            for line in file:
+                if line.strip():
+                    operations.append(CapturedOperation(*json.loads(line)))
+        except (EOFError, OSError, ValueError):
+            pass  # the last lines of a log whose process did not stop capture
+    operations.sort(key=lambda operation: operation.offset)
+    return header, operations
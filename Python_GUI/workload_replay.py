@@ -0,0 +1,423 @@
+# Workload replay: run a captured log again and measure it
+# pip install mysql-connector-python
+#
+# Replays a log written by workload_capture.py through InventoryService
+# against the database given on the command line. The log repeats every
+# write, so point it at a copy restored from before the capture started.
+#   python workload_replay.py workload.jsonl.gz --database inventory_copy
+#   python workload_replay.py workload.jsonl.gz --speed 4 --concurrency 16
+#   python workload_replay.py workload.jsonl.gz --max-speed --concurrency 32
+#
+# Pacing is open loop: an operation starts at its captured offset / speed,
+# however far behind the database is, so falling behind shows up as start
+# lag as well as latency. With --max-speed operations start as soon as one of
+# the --concurrency workers is free. A sell of an order placed earlier in the
+# log waits for that order to be replayed and uses its new order id.
+# --purchases procedure sends captured purchases through the
+# create_purchase_order procedure, --purchases service the other way round.
+#
+# While the log runs, a monitor connection samples sys.innodb_lock_waits
+# every --lock-sample-interval seconds. Each wait is put down to the stored
+# program the waiting statement runs in (process_sales_order,
+# create_purchase_order, a trigger) and the statement, with the table, index
+# and lock mode it waits for and the statement holding the lock. Needs
+# performance_schema and the sys schema; without them only the InnoDB row
+# lock counters and the deadlocks and lock wait timeouts the operations hit
+# are reported.
+
+import argparse
+import json
+import math
+import re
+import sys
+import threading
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import mysql.connector
+
+from db_settings import add_db_arguments, db_config_from_args
+from inventory_service import InventoryService, ServiceError
+from workload_capture import (
+    OP_CREATE_PURCHASE_ORDER, OP_PLACE_SALES_ORDER, OP_PURCHASE, OP_REPORT, OP_SELL,
+    OP_TRANSFER, read_workload)
+
+
+ER_LOCK_DEADLOCK = 1213
+ER_LOCK_WAIT_TIMEOUT = 1205
+
+ERROR_DEADLOCK = 'deadlock'
+ERROR_LOCK_WAIT_TIMEOUT = 'lock wait timeout'
+ERROR_DATABASE = 'database'
+ERROR_SERVICE = 'service'
+ERROR_OTHER = 'other'
+
+# The procedures the contention report is about
+WATCHED_PROGRAMS = ('process_sales_order', 'create_purchase_order')
+
+# lag: seconds between when the operation was due and when it started
+ReplayResult = namedtuple('ReplayResult', 'op offset lag seconds error')
+# One place where replayed statements waited for a row lock
+LockPoint = namedtuple('LockPoint', 'program statement locked_table locked_index lock_mode')
+
+
+class ReplayError(Exception):
+    pass
+
+
+def _error_kind(err):
+    if isinstance(err, ServiceError):
+        return ERROR_SERVICE
+    if isinstance(err, mysql.connector.Error):
+        if err.errno == ER_LOCK_DEADLOCK:
+            return ERROR_DEADLOCK
+        if err.errno == ER_LOCK_WAIT_TIMEOUT:
+            return ERROR_LOCK_WAIT_TIMEOUT
+        return ERROR_DATABASE
+    return ERROR_OTHER
+
+
+def _normalise_sql(sql, width=140):
+    if not sql:
+        return '(idle in transaction)'
+    sql = re.sub(r"'(?:[^'\\]|\\.)*'", '?', sql)
+    sql = re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+    sql = ' '.join(sql.split())
+    return sql if len(sql) <= width else sql[:width - 3] + '...'
+
+
+# ---------------------------- replay ---------------------------------------
+
+class WorkloadReplayer:
+    def __init__(self, service, concurrency=8, speed=1.0, purchases='captured'):
+        # speed: 1.0 is real time, 4.0 four times as fast, None no pacing
+        self.service = service
+        self.concurrency = concurrency
+        self.speed = speed
+        self.purchases = purchases
+        self.results = []
+        self._orders = {}  # captured order_id -> future of the replayed place_sales_order
+
+    def replay(self, operations):
+        # Returns the wall time in seconds
+        slots = threading.BoundedSemaphore(self.concurrency * 2)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(self.concurrency, thread_name_prefix='replay') as pool:
+            for operation in operations:
+                if self.speed:
+                    due = start + operation.offset / self.speed
+                    delay = due - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                slots.acquire()
+                if not self.speed:
+                    due = time.perf_counter()
+                future = pool.submit(self._execute, operation, due)
+                future.add_done_callback(lambda _: slots.release())
+                if operation.op == OP_PLACE_SALES_ORDER and operation.result:
+                    self._orders[operation.result['order_id']] = future
+        return time.perf_counter() - start
+
+    def _execute(self, operation, due):
+        params = operation.params
+        if operation.op == OP_SELL:
+            # Waiting for the order to be placed is not part of the sale
+            params = dict(params, order_id=self._order_id(params['order_id']))
+        started = time.perf_counter()
+        result = error = None
+        try:
+            result = self._run(operation.op, params)
+        except Exception as err:
+            error = _error_kind(err)
+        self.results.append(ReplayResult(operation.op, operation.offset, started - due,
+                                         time.perf_counter() - started, error))
+        return result
+
+    def _order_id(self, order_id):
+        # The replayed id of an order placed earlier in the log
+        future = self._orders.get(order_id)
+        if future is None:
+            return order_id
+        result = future.result()
+        return result['order_id'] if result else order_id
+
+    def _run(self, op, params):
+        if op == OP_PURCHASE and self.purchases == 'procedure':
+            op = OP_CREATE_PURCHASE_ORDER
+        elif op == OP_CREATE_PURCHASE_ORDER and self.purchases == 'service':
+            op = OP_PURCHASE
+
+        if op == OP_SELL:
+            return self.service.sell(params['order_id'], params['product_id'], params['quantity'])
+        if op == OP_PLACE_SALES_ORDER:
+            return self.service.place_sales_order(params['customer_id'], params['lines'],
+                                                  params['delivery_date'])
+        if op == OP_PURCHASE:
+            return self.service.purchase(params['product_id'], params['quantity'])
+        if op == OP_CREATE_PURCHASE_ORDER:
+            return self._create_purchase_order(params['product_id'], params['quantity'])
+        if op == OP_TRANSFER:
+            return self.service.transfer([tuple(move) for move in params['transfers']])
+        if op == OP_REPORT:
+            return self.service.report(params['name'])
+        raise ReplayError(f'Unknown operation {op}')
+
+    def _create_purchase_order(self, product_id, quantity):
+        # The procedure itself, on a connection from the service's pool
+        with self.service.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.callproc('create_purchase_order', [product_id, quantity])
+                messages = [row[0] for result in cursor.stored_results()
+                            for row in result.fetchall()]
+                conn.commit()
+            finally:
+                cursor.close()
+        return {'messages': messages}
+
+
+# ---------------------------- lock monitor ---------------------------------
+
+class LockMonitor:
+    def __init__(self, db_config, interval=0.05):
+        self.db_config = db_config
+        self.interval = interval
+        self.available = False
+        self.samples = 0
+        self.points = {}     # LockPoint -> {'samples', 'waits', 'max_wait', 'blockers'}
+        self.counters = {}   # Innodb_row_lock_* at start, then the change over the replay
+        self._conn = None
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        self._conn = mysql.connector.connect(**self.db_config)
+        cursor = self._conn.cursor()
+        try:
+            self.counters = self._row_lock_counters(cursor)
+            try:
+                self._sample(cursor)
+                self.available = True
+            except mysql.connector.Error as err:
+                print(f'Lock waits not sampled, sys.innodb_lock_waits is not readable: {err}')
+        finally:
+            cursor.close()
+        if self.available:
+            self._thread = threading.Thread(target=self._run, name='lock-monitor', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+        cursor = self._conn.cursor()
+        try:
+            after = self._row_lock_counters(cursor)
+        finally:
+            cursor.close()
+            self._conn.close()
+        self.counters = {name: after.get(name, 0) - self.counters.get(name, 0)
+                         for name in ('Innodb_row_lock_waits', 'Innodb_row_lock_time')}
+        self.counters['Innodb_row_lock_time_max'] = after.get('Innodb_row_lock_time_max', 0)
+
+    def _row_lock_counters(self, cursor):
+        cursor.execute("SHOW GLOBAL STATUS LIKE 'Innodb_row_lock%';")
+        counters = {name: int(value) for name, value in cursor.fetchall()}
+        self._conn.commit()
+        return counters
+
+    def _run(self):
+        cursor = self._conn.cursor()
+        try:
+            while not self._stopping.wait(self.interval):
+                self._sample(cursor)
+        except mysql.connector.Error as err:
+            print(f'Error: lock monitor stopped: {err}')
+        finally:
+            cursor.close()
+
+    def _sample(self, cursor):
+        # A waiting statement inside a stored program has a row per nesting
+        # level in events_statements_current; the deepest names the program
+        # the statement is in.
+        cursor.execute('''
+            SELECT w.waiting_trx_id, w.waiting_lock_id, w.waiting_query, w.locked_table,
+                   w.locked_index, w.waiting_lock_mode, w.blocking_query, w.wait_age_secs,
+                   s.NESTING_EVENT_LEVEL, s.OBJECT_NAME
+            FROM sys.innodb_lock_waits w
+            LEFT JOIN performance_schema.threads t ON t.PROCESSLIST_ID = w.waiting_pid
+            LEFT JOIN performance_schema.events_statements_current s ON s.THREAD_ID = t.THREAD_ID;
+        ''')
+        waits = {}
+        for (trx_id, lock_id, query, table, index, mode, blocking_query, age,
+             level, program) in cursor.fetchall():
+            current = waits.get((trx_id, lock_id))
+            if current is None or (level or 0) > current[0]:
+                waits[(trx_id, lock_id)] = ((level or 0), program, query, table, index, mode,
+                                            blocking_query, age)
+        self._conn.commit()
+        self.samples += 1
+        for wait_id, (_, program, query, table, index, mode, blocking_query, age) in waits.items():
+            point = LockPoint(program or '-', _normalise_sql(query), table, index, mode)
+            stats = self.points.get(point)
+            if stats is None:
+                stats = self.points[point] = {'samples': 0, 'waits': set(), 'max_wait': 0,
+                                              'blockers': Counter()}
+            stats['samples'] += 1
+            stats['waits'].add(wait_id)
+            stats['max_wait'] = max(stats['max_wait'], age or 0)
+            stats['blockers'][_normalise_sql(blocking_query)] += 1
+
+
+# ---------------------------- report ---------------------------------------
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    # Nearest rank
+    rank = max(math.ceil(fraction * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def latency_rows(results, captured_seconds):
+    # One row per operation: count, errors, latencies and start lag in ms,
+    # and the captured p50/p99 to compare with
+    by_op = {}
+    for result in results:
+        by_op.setdefault(result.op, []).append(result)
+    rows = []
+    for op, op_results in sorted(by_op.items()):
+        seconds = sorted(result.seconds for result in op_results)
+        lags = sorted(max(result.lag, 0.0) for result in op_results)
+        captured = sorted(captured_seconds.get(op, ()))
+        rows.append({
+            'op': op,
+            'count': len(op_results),
+            'errors': dict(Counter(result.error for result in op_results if result.error)),
+            'mean_ms': sum(seconds) / len(seconds) * 1000,
+            'p50_ms': percentile(seconds, 0.50) * 1000,
+            'p90_ms': percentile(seconds, 0.90) * 1000,
+            'p99_ms': percentile(seconds, 0.99) * 1000,
+            'max_ms': seconds[-1] * 1000,
+            'lag_p50_ms': percentile(lags, 0.50) * 1000,
+            'lag_p99_ms': percentile(lags, 0.99) * 1000,
+            'captured_p50_ms': percentile(captured, 0.50) * 1000 if captured else None,
+            'captured_p99_ms': percentile(captured, 0.99) * 1000 if captured else None,
+        })
+    return rows
+
+
+def contention_rows(monitor):
+    rows = []
+    for point, stats in monitor.points.items():
+        rows.append({
+            **point._asdict(),
+            'samples': stats['samples'],
+            'waits': len(stats['waits']),
+            'max_wait_s': stats['max_wait'],
+            'blocked_by': stats['blockers'].most_common(3),
+        })
+    rows.sort(key=lambda row: -row['samples'])
+    return rows
+
+
+def print_report(latencies, contention, monitor, wall_seconds, limit=10):
+    total = sum(row['count'] for row in latencies)
+    print(f'{total} operations in {wall_seconds:.2f}s '
+          f'({total / wall_seconds if wall_seconds else 0:.1f} ops/s)')
+    print('Operation\tCount\tp50 ms\tp90 ms\tp99 ms\tMax ms\tLag p99 ms\tCaptured p50/p99 ms\tErrors')
+    for row in latencies:
+        captured = '-'
+        if row['captured_p50_ms'] is not None:
+            captured = f"{row['captured_p50_ms']:.1f}/{row['captured_p99_ms']:.1f}"
+        errors = ', '.join(f'{kind} {count}' for kind, count in sorted(row['errors'].items()))
+        print(f"{row['op']}\t{row['count']}\t{row['p50_ms']:.1f}\t{row['p90_ms']:.1f}\t"
+              f"{row['p99_ms']:.1f}\t{row['max_ms']:.1f}\t{row['lag_p99_ms']:.1f}\t"
+              f"{captured}\t{errors or '-'}")
+
+    counters = monitor.counters
+    print(f"InnoDB row lock waits: {counters.get('Innodb_row_lock_waits', 0)}, "
+          f"{counters.get('Innodb_row_lock_time', 0)} ms waited, "
+          f"longest {counters.get('Innodb_row_lock_time_max', 0)} ms")
+    if not monitor.available:
+        return
+    print(f'Lock waits seen in {monitor.samples} samples every {monitor.interval * 1000:.0f} ms')
+    watched = [row for row in contention if row['program'] in WATCHED_PROGRAMS]
+    others = [row for row in contention if row['program'] not in WATCHED_PROGRAMS]
+    for title, rows in (('In ' + ' and '.join(WATCHED_PROGRAMS), watched), ('Elsewhere', others)):
+        print(f'{title}:')
+        if not rows:
+            print('  none')
+        for row in rows[:limit]:
+            print(f"  {row['program']}: {row['statement']}")
+            print(f"    waits {row['waits']}, samples {row['samples']}, "
+                  f"longest {row['max_wait_s']}s on {row['locked_table']} "
+                  f"{row['locked_index']} {row['lock_mode']}")
+            for blocker, count in row['blocked_by']:
+                print(f'    held by ({count}) {blocker}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay a captured workload')
+    add_db_arguments(parser)
+    parser.add_argument('log', help='log written by workload_capture.py')
+    parser.add_argument('--speed', type=float, default=1.0, help='1 is the captured pace')
+    parser.add_argument('--max-speed', action='store_true', help='no pacing')
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help='workers and pooled connections (max 32)')
+    parser.add_argument('--purchases', choices=('captured', 'procedure', 'service'),
+                        default='captured', help='how purchases are replayed')
+    parser.add_argument('--no-report-cache', action='store_true',
+                        help='run every report against the database')
+    parser.add_argument('--only', nargs='+', help='replay only these operations')
+    parser.add_argument('--lock-sample-interval', type=float, default=0.05)
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    args = parser.parse_args(argv)
+
+    if args.speed <= 0 and not args.max_speed:
+        print('Error: --speed must be positive')
+        return 1
+    try:
+        header, operations = read_workload(args.log)
+    except (OSError, ValueError) as err:
+        print(f'Error: {err}')
+        return 1
+    if args.only:
+        operations = [operation for operation in operations if operation.op in args.only]
+    captured_seconds = {}
+    for operation in operations:
+        captured_seconds.setdefault(operation.op, []).append(operation.seconds)
+    print(f"Replaying {len(operations)} operations captured {header.get('started_at')}")
+
+    db_config = db_config_from_args(args)
+    try:
+        service = InventoryService(db_config, pool_size=args.concurrency,
+                                   pool_name='workload_replay',
+                                   cache_reports=not args.no_report_cache)
+        monitor = LockMonitor(db_config, args.lock_sample_interval).start()
+    except mysql.connector.Error as err:
+        print(f'Error: {err}')
+        return 1
+    replayer = WorkloadReplayer(service, args.concurrency,
+                                None if args.max_speed else args.speed, args.purchases)
+    try:
+        wall_seconds = replayer.replay(operations)
+    finally:
+        monitor.stop()
+
+    latencies = latency_rows(replayer.results, captured_seconds)
+    contention = contention_rows(monitor)
+    print_report(latencies, contention, monitor, wall_seconds)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump({'log': args.log, 'speed': replayer.speed, 'concurrency': args.concurrency,
+                       'wall_seconds': wall_seconds, 'latencies': latencies,
+                       'row_lock_counters': monitor.counters, 'lock_points': contention},
+                      file, indent=1, default=str)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())